@@ -1,12 +1,20 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from src import logic, database, reports, prediction, ai_advice
+import os
+import time
+from datetime import datetime, timedelta, time as dt_time
+from src import logic, database, reports, prediction, ai_advice, tracing, config, archive, rules, sleep, search, export, clinics, anomaly, prompts, outbox, scheduler
 
 # 1. Page Config (Must be first)
 st.set_page_config(page_title="Swasthya Monitor", page_icon="🏥", layout="wide")
 
 database.init_db()
+database.start_reconciler()  # Uploads records saved while offline
+scheduler.start()  # Cache warmup and nightly jobs (SCHEDULER_ENABLED)
+
+# Admin-only diagnostics panel (open the app with ?admin=<ADMIN_KEY>)
+admin_key = config.get_setting("ADMIN_KEY")
+is_admin = bool(admin_key) and st.query_params.get("admin") == admin_key
 
 # 2. Custom CSS for "Clean Minimal UI"
 st.markdown("""
@@ -62,17 +70,46 @@ with st.sidebar:
     # Language Toggle
     language = st.radio("Language / भाषा", ["English", "Hindi"], horizontal=True)
     
+    # Returning patients: search stored records and autofill their demographics
+    def fill_returning_patient(profile):
+        st.session_state.patient_name = "" if pd.isna(profile["Name"]) else str(profile["Name"])
+        st.session_state.patient_phone = search.normalize_phone(profile["Phone"])
+        for key, column, low, high in (("patient_age", "Age", 1, 120), ("patient_weight", "Weight", 30, 150),
+                                       ("patient_height", "Height", 100, 250)):
+            value = pd.to_numeric(profile[column], errors="coerce")
+            if not pd.isna(value):
+                st.session_state[key] = int(min(max(round(float(value)), low), high))
+        if profile["Gender"] in ("Male", "Female"):
+            st.session_state.patient_gender = profile["Gender"]
+    
+    patient_query = st.text_input("🔍 पुराना रोगी खोजें" if language == "Hindi" else "🔍 Find Returning Patient",
+                                  placeholder="नाम, फोन या रोगी ID" if language == "Hindi" else "Name, phone or Patient ID")
+    if patient_query:
+        matches = database.get_search_index().find(patient_query, limit=10)
+        if matches.empty:
+            st.caption("कोई मेल खाता रोगी नहीं मिला" if language == "Hindi" else "No matching patient found")
+        else:
+            profiles = {row["Patient_ID"]: row for row in matches.to_dict("records")}
+            chosen = st.selectbox("मिलते-जुलते रोगी" if language == "Hindi" else "Matching Patients", list(profiles),
+                                  format_func=lambda pid: f"{profiles[pid]['Name']} · {pid} · {profiles[pid]['Visits']} visit(s)")
+            st.button("विवरण भरें" if language == "Hindi" else "Fill Details", on_click=fill_returning_patient,
+                      args=(profiles[chosen],))
+    
     # Patient Identification
-    name = st.text_input("Full Name / पूरा नाम" if language == "Hindi" else "Full Name")
+    name = st.text_input("Full Name / पूरा नाम" if language == "Hindi" else "Full Name", key="patient_name")
     phone = st.text_input("Phone Number / फोन नंबर" if language == "Hindi" else "Phone Number", 
-                          placeholder="10 digits", help="Used to generate unique Patient ID")
+                          placeholder="10 digits", help="Used to generate unique Patient ID", key="patient_phone")
     
-    age = st.number_input("Age / उम्र" if language == "Hindi" else "Age", 1, 120, 45)
-    gender = st.radio("Gender / लिंग" if language == "Hindi" else "Gender", ["Male", "Female"], horizontal=True)
+    # Defaults go through session state so "Fill Details" can overwrite them
+    for key, default in (("patient_age", 45), ("patient_weight", 70), ("patient_height", 170)):
+        st.session_state.setdefault(key, default)
+    age = st.number_input("Age / उम्र" if language == "Hindi" else "Age", 1, 120, key="patient_age")
+    gender = st.radio("Gender / लिंग" if language == "Hindi" else "Gender", ["Male", "Female"], horizontal=True,
+                      key="patient_gender")
     
     st.subheader("महत्वपूर्ण संकेत" if language == "Hindi" else "Vitals")
-    weight = st.number_input("वजन (किलो)" if language == "Hindi" else "Weight (kg)", 30, 150, 70)
-    height = st.number_input("ऊंचाई (सेंटीमीटर)" if language == "Hindi" else "Height (cm)", 100, 250, 170)
+    weight = st.number_input("वजन (किलो)" if language == "Hindi" else "Weight (kg)", 30, 150, key="patient_weight")
+    height = st.number_input("ऊंचाई (सेंटीमीटर)" if language == "Hindi" else "Height (cm)", 100, 250, key="patient_height")
     sugar = st.number_input("उपवास शर्करा (mg/dL)" if language == "Hindi" else "Fasting Sugar (mg/dL)", 50, 500, 90)
     sys_bp = st.number_input("सिस्टोलिक बीपी" if language == "Hindi" else "Systolic BP", 90, 250, 120)
     dia_bp = st.number_input("डायस्टोलिक बीपी" if language == "Hindi" else "Diastolic BP", 50, 150, 80)
@@ -85,24 +122,30 @@ with st.sidebar:
     bedtime = None
     waketime = None
     with st.expander("नींद का पैटर्न (वैकल्पिक)" if language == "Hindi" else "Sleep Pattern (Optional)"):
-        bedtime = st.number_input("सोने का समय (24 घंटे)" if language == "Hindi" else "Bedtime Hour (24hr)", 0, 23, 22, 
-                                   help="जैसे, 22 का मतलब 10 बजे रात" if language == "Hindi" else "e.g., 22 for 10 PM", key="bedtime")
-        waketime = st.number_input("जागने का समय (24 घंटे)" if language == "Hindi" else "Wake Time Hour (24hr)", 0, 23, 6,
-                                    help="जैसे, 6 का मतलब सुबह 6 बजे" if language == "Hindi" else "e.g., 6 for 6 AM", key="waketime")
+        bedtime = st.time_input("सोने का समय" if language == "Hindi" else "Bedtime", dt_time(22, 0), step=900,
+                                help="जैसे, 22:30 का मतलब रात 10:30 बजे" if language == "Hindi" else "e.g., 22:30 for 10:30 PM", key="bedtime")
+        waketime = st.time_input("जागने का समय" if language == "Hindi" else "Wake Time", dt_time(6, 0), step=900,
+                                 help="जैसे, 06:15 का मतलब सुबह 6:15 बजे" if language == "Hindi" else "e.g., 06:15 for 6:15 AM", key="waketime")
     
     analyze_btn = st.button("Run Diagnostics / निदान चलाएं" if language == "Hindi" else "Run Diagnostics", 
                             type="primary")
 
 # 4. Main Area (Tabs)
-tab1, tab2 = st.tabs(["🏥 वर्तमान विश्लेषण" if language == "Hindi" else "🏥 Current Analysis", "📂 रोगी रिकॉर्ड" if language == "Hindi" else "📂 Patient Records"])
+tab_labels = ["🏥 वर्तमान विश्लेषण" if language == "Hindi" else "🏥 Current Analysis", "📂 रोगी रिकॉर्ड" if language == "Hindi" else "📂 Patient Records"]
+if is_admin:
+    tab_labels.append("⚙️ Admin")
+tabs = st.tabs(tab_labels)
+tab1, tab2 = tabs[0], tabs[1]
 
 with tab1:
     if analyze_btn:
+        run_start = time.perf_counter()
         # A. Validation
         if not name or not name.strip():
             st.error("कृपया रोगी का नाम दर्ज करें।" if language == "Hindi" else "Please enter a patient name.")
         else:
-            errs = logic.validate_inputs(age, weight, height, sugar, sys_bp, dia_bp)
+            with tracing.span("validate"):
+                errs = logic.validate_inputs(age, weight, height, sugar, sys_bp, dia_bp)
             if errs:
                 for e in errs: 
                     st.error(e)
@@ -117,34 +160,30 @@ with tab1:
                 chronotype = None
                 sleep_hours = None
                 if bedtime is not None and waketime is not None:
-                    try:
-                        chronotype = logic.detect_chronotype(bedtime, waketime)
-                        # Calculate sleep duration
-                        if bedtime > waketime:
-                            sleep_hours = (24 - bedtime) + waketime
-                        else:
-                            sleep_hours = waketime - bedtime
-                    except Exception:
-                        chronotype = None
-                        sleep_hours = None
+                    sleep_hours, _, chronotype = sleep.metrics(bedtime, waketime)
+                    sleep_hours = round(sleep_hours, 2) if chronotype is not None else None
                 
                 # Calculate risk score with sleep data
-                score, label, color, factors = logic.calculate_scrs(age, bmi, sugar, sys_bp, dia_bp, sleep_hours)
+                with tracing.span("score"):
+                    score, label, color, factors = logic.calculate_scrs(age, bmi, sugar, sys_bp, dia_bp, sleep_hours)
                 
                 # C. Prediction Logic (ML)
-                history_df = database.get_patient_history(patient_id)
+                with tracing.span("history_lookup"):
+                    summary = database.get_patient_summary(patient_id)
+                history_df = summary["recent"] if summary else pd.DataFrame()
+                
+                # Readings far from this patient's own baseline (checked before this visit is saved)
+                vital_flags = []
+                if summary:
+                    with tracing.span("anomaly_check"):
+                        vital_flags = anomaly.check(database.get_vital_baseline(patient_id), {
+                            "Sugar": sugar, "Systolic_BP": sys_bp, "Diastolic_BP": dia_bp, "BMI": bmi})
                 future_pred = None
                 trend = "stable"
                 
-                if not history_df.empty and len(history_df) >= 2:
-                    # Prepare history for prediction
-                    history_for_pred = history_df.copy()
-                    # Extract BP values if stored as "140/90" format
-                    if 'BP' in history_for_pred.columns:
-                        history_for_pred['Systolic_BP'] = history_for_pred['BP'].apply(
-                            lambda x: int(str(x).split('/')[0]) if '/' in str(x) else None
-                        )
-                    future_pred = prediction.predict_trends(history_for_pred)
+                if summary and summary["Visits"] >= 2:
+                    # Forecast kept up to date in the summary table (fitted on the recent visits)
+                    future_pred = summary["forecast"]
                     
                     # Determine trend
                     if future_pred and 'Sugar' in future_pred:
@@ -157,9 +196,12 @@ with tab1:
                 advice_text = None
                 try:
                     with st.spinner("🤖 Generating personalized advice..." if language == "English" else "🤖 व्यक्तिगत सलाह तैयार की जा रही है..."):
-                        advice_text = ai_advice.get_holistic_advice(name, age, label, trend, meds, language, chronotype, sleep_hours)
+                        with tracing.span("advice"):
+                            advice_text = ai_advice.get_holistic_advice(name, age, label, trend, meds, language, chronotype, sleep_hours)
                 except Exception as e:
                     advice_text = ai_advice.get_fallback_advice(label, language)
+                # Parsed once; the care plan, PDF and WhatsApp message all reuse it
+                advice_plan = ai_advice.parse_advice(advice_text) if advice_text else None
                 
                 # E. Follow-up Date Calculation
                 followup_date = prediction.calculate_followup_date(score)
@@ -205,6 +247,16 @@ with tab1:
                     risk_emoji = "🟢" if score <= 3 else "🟡" if score <= 6 else "🟠" if score <= 8 else "🔴"
                     st.metric("Status", f"{risk_emoji} {label}", delta="")
                 
+                # Unusual readings for this patient
+                vital_names = {"Sugar": "शुगर", "Systolic_BP": "सिस्टोलिक बीपी", "Diastolic_BP": "डायस्टोलिक बीपी", "BMI": "बीएमआई"} if language == "Hindi" else {"Sugar": "Sugar", "Systolic_BP": "Systolic BP", "Diastolic_BP": "Diastolic BP", "BMI": "BMI"}
+                for flag in vital_flags:
+                    reading = f"{vital_names[flag['vital']]} {flag['value']:g} {anomaly.UNITS[flag['vital']]}"
+                    usual = f"{flag['expected']:g} ± {flag['std']:g}"
+                    if flag["kind"] == anomaly.ENTRY_ERROR:
+                        st.warning(f"⚠️ कृपया जाँचें: {reading} इस रोगी के सामान्य {usual} से बहुत अलग है (z = {flag['z']:+.1f})। संभवतः प्रविष्टि त्रुटि।" if language == "Hindi" else f"⚠️ Please re-check: {reading} is far from this patient's usual {usual} (z = {flag['z']:+.1f}). Likely a data-entry error.")
+                    else:
+                        st.info(f"📈 {reading} इस रोगी के लिए असामान्य है (सामान्य {usual}, z = {flag['z']:+.1f})।" if language == "Hindi" else f"📈 {reading} is unusual for this patient (usual {usual}, z = {flag['z']:+.1f}).")
+                
                 # Chronotype & Sleep Display (if available)
                 if chronotype:
                     sleep_quality = "Adequate" if sleep_hours and 7 <= sleep_hours <= 9 else "Poor" if sleep_hours and sleep_hours < 6 else "Excessive" if sleep_hours and sleep_hours > 9 else "Unknown"
@@ -273,7 +325,7 @@ with tab1:
                 st.markdown("---")
                 st.subheader("📈 Health Trends & Predictions" if language == "English" else "📈 स्वास्थ्य प्रवृत्तियाँ और भविष्यवाणियाँ")
                 
-                if not history_df.empty and len(history_df) >= 2:
+                if summary and summary["Visits"] >= 2:
                     # Show historical trend chart
                     col_chart1, col_chart2 = st.columns(2, gap="medium")
                     
@@ -287,6 +339,15 @@ with tab1:
                             st.line_chart(history_df[['Risk_Score']].tail(10), height=200)
                             st.caption("Risk Score Trend (Last 10 visits)" if language == "English" else "जोखिम स्कोर प्रवृत्ति (पिछली 10 यात्राएं)")
                     
+                    sugar_stats = summary["stats"].get("Sugar")
+                    if sugar_stats:
+                        if language == "Hindi":
+                            st.caption(f"{summary['Visits']} यात्राएं ({summary['First_Visit'][:10]} से) · रक्त शर्करा न्यूनतम/औसत/अधिकतम: "
+                                       f"{sugar_stats['min']:.0f} / {sugar_stats['mean']:.0f} / {sugar_stats['max']:.0f} mg/dL")
+                        else:
+                            st.caption(f"{summary['Visits']} visits since {summary['First_Visit'][:10]} · Sugar min/mean/max: "
+                                       f"{sugar_stats['min']:.0f} / {sugar_stats['mean']:.0f} / {sugar_stats['max']:.0f} mg/dL")
+                    
                     # Prediction
                     if future_pred:
                         trend_emoji = "📈" if trend == "negative" else "📉" if trend == "positive" else "➡️"
@@ -295,12 +356,36 @@ with tab1:
                         else:
                             pred_text = f"{trend_emoji} **Prediction Analysis:** If you continue current habits, your predicted Sugar at next visit: **{future_pred.get('Sugar', 'N/A')} mg/dL**."
                         
+                        intervals = future_pred.get('intervals', {})
+                        if 'Sugar' in intervals:
+                            low, high = intervals['Sugar']
+                            pred_text += f" (80% सीमा: {low}–{high})" if language == "Hindi" else f" (80% range: {low}–{high})"
+                        
                         if trend == "positive":
                             st.success(pred_text + " ✅ Improving!" if language == "English" else pred_text + " ✅ सुधार हो रहा है!")
                         elif trend == "negative":
                             st.warning(pred_text + " ⚠️ Needs attention!" if language == "English" else pred_text + " ⚠️ ध्यान देने की आवश्यकता!")
                         else:
                             st.info(pred_text)
+                        
+                        # Next-visit forecast of the other vitals and the recomputed score
+                        forecast_date = future_pred.get('Forecast_Date')
+                        forecast_rows = []
+                        for key, name_en, name_hi in [("Systolic_BP", "Systolic BP", "सिस्टोलिक बीपी"),
+                                                      ("Diastolic_BP", "Diastolic BP", "डायस्टोलिक बीपी"),
+                                                      ("BMI", "BMI", "बीएमआई"),
+                                                      ("Risk_Score", "Risk Score", "जोखिम स्कोर")]:
+                            if key in future_pred:
+                                low, high = intervals.get(key, (None, None))
+                                forecast_rows.append({
+                                    ("मान" if language == "Hindi" else "Measure"): name_hi if language == "Hindi" else name_en,
+                                    ("अनुमान" if language == "Hindi" else "Forecast"): str(future_pred[key]),
+                                    ("80% सीमा" if language == "Hindi" else "80% Range"): f"{low}–{high}" if low is not None else "—",
+                                })
+                        if forecast_rows:
+                            st.dataframe(pd.DataFrame(forecast_rows), use_container_width=True, hide_index=True)
+                            if forecast_date is not None:
+                                st.caption(f"अगली अनुमानित यात्रा: {forecast_date:%d %b %Y}" if language == "Hindi" else f"Forecast for the expected next visit: {forecast_date:%d %b %Y}")
                 else:
                     st.info("📊 Historical data unavailable. Visit us again to unlock trend predictions and charts!" if language == "English" else "📊 ऐतिहासिक डेटा अनुपलब्ध। प्रवृत्ति भविष्यवाणियों और चार्ट को अनलॉक करने के लिए फिर से आएं!")
                 
@@ -311,7 +396,7 @@ with tab1:
                     st.subheader(advice_title)
                     # Use Streamlit container for proper markdown rendering
                     with st.container():
-                        st.markdown(advice_text)  # Direct markdown rendering - no HTML wrapper
+                        st.markdown(ai_advice.advice_markdown(advice_plan))  # Direct markdown rendering - no HTML wrapper
                 
                 # I. Follow-up Date
                 if followup_date:
@@ -332,10 +417,14 @@ with tab1:
                     'dia': dia_bp, 
                     'score': score, 
                     'label': label,
+                    'rule_version': rules.active().version,
                     'phone': phone,
                     'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
                     'followup_date': followup_date.strftime("%Y-%m-%d") if followup_date else None,
                     'advice': advice_text or "",
+                    'advice_plan': advice_plan,
+                    'bedtime': round(sleep.to_hours(bedtime), 2) if sleep_hours is not None else None,
+                    'waketime': round(sleep.to_hours(waketime), 2) if sleep_hours is not None else None,
                     'chronotype': chronotype,
                     'sleep_hours': sleep_hours,
                     'factors': factors
@@ -366,18 +455,51 @@ with tab1:
                         st.error(f"PDF generation failed: {str(e)}")
                 with c2:
                     try:
-                        wa_link = reports.get_whatsapp_link(name, score, label, language)
+                        wa_link = reports.get_whatsapp_link(name, score, label, language, advice_plan)
                         button_text = "WhatsApp पर साझा करें" if language == "Hindi" else "Share via WhatsApp"
                         st.link_button(button_text, wa_link, use_container_width=True)
                     except Exception as e:
                         st.error(f"WhatsApp link generation failed: {str(e)}")
+                
+                tracing.record("diagnostic_total", time.perf_counter() - run_start)
     else:
         info_text = "👈 साइडबार में रोगी विवरण दर्ज करें और 'निदान चलाएं' पर क्लिक करें" if language == "Hindi" else "👈 Enter patient details in the sidebar and click 'Run Diagnostics'"
         st.info(info_text)
 
 with tab2:
     st.subheader("अस्पताल डेटाबेस रिकॉर्ड" if language == "Hindi" else "Hospital Database Records")
-    df = database.get_history()
+    if clinics.current():
+        st.caption(f"क्लिनिक: {clinics.current()}" if language == "Hindi" else f"Clinic: {clinics.current()}")
+        legacy_waiting = database.legacy_pending()
+        if legacy_waiting:
+            st.warning(f"⚠️ क्लिनिक सेट करने से पहले सहेजे गए {legacy_waiting} रिकॉर्ड अभी स्थानांतरित नहीं हुए हैं। ऐप को पुनः आरंभ करें।"
+                       if language == "Hindi" else
+                       f"⚠️ {legacy_waiting} record(s) saved before the clinic was set have not been moved to this clinic yet. Restart the app to move them.")
+    
+    # Offline sync status
+    sync_counts = database.sync_status()
+    if sync_counts.get("pending"):
+        n_pending = sync_counts["pending"]
+        st.info(f"🔄 इस डिवाइस पर सहेजे गए {n_pending} रिकॉर्ड Google Sheets से सिंक होने की प्रतीक्षा में हैं।" if language == "Hindi" else f"🔄 {n_pending} record(s) saved on this device are waiting to sync to Google Sheets.")
+    if sync_counts.get("conflict"):
+        n_conflict = sync_counts["conflict"]
+        st.warning(f"⚠️ {n_conflict} ऑफ़लाइन रिकॉर्ड उसी रोगी और समय की अलग शीट प्रविष्टि से टकराते हैं।" if language == "Hindi" else f"⚠️ {n_conflict} offline record(s) clash with a different sheet entry for the same patient and time.")
+        with st.expander("सिंक टकराव" if language == "Hindi" else "Sync Conflicts"):
+            st.dataframe(database.get_conflicts(), use_container_width=True)
+    
+    # Older visits live in the archive; only load the range being viewed
+    if archive.partitions():
+        today = datetime.now().date()
+        date_range = st.date_input(
+            "दिनांक सीमा" if language == "Hindi" else "Date Range",
+            value=(today - timedelta(days=365), today)
+        )
+        if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+            df = database.get_history(date_range[0], f"{date_range[1]} 23:59")
+        else:
+            df = database.get_history(date_range[0] if date_range else None)
+    else:
+        df = database.get_history()
     
     if df.empty:
         st.info("कोई रोगी रिकॉर्ड नहीं मिला। विश्लेषण के बाद रिकॉर्ड यहां दिखाई देंगे।" if language == "Hindi" else "No patient records found. Records will appear here after analysis.")
@@ -393,3 +515,248 @@ with tab2:
             # Count risk levels if Risk_Score column is missing
             risk_counts = df['Label'].value_counts()
             st.bar_chart(risk_counts)
+        
+        # Cohort search: patients with a visit in a date and risk score range
+        with st.expander("रोगी समूह खोज" if language == "Hindi" else "Cohort Search"):
+            with st.form("cohort_search"):
+                today = datetime.now().date()
+                max_score = int(max(pd.to_numeric(df["Risk_Score"], errors="coerce").max(), 10)) if "Risk_Score" in df.columns else 10
+                col_name, col_risk = st.columns(2)
+                with col_name:
+                    cohort_name = st.text_input("नाम (वैकल्पिक)" if language == "Hindi" else "Name (optional)")
+                with col_risk:
+                    risk_range = st.slider("जोखिम स्कोर" if language == "Hindi" else "Risk Score", 0, max_score, (0, max_score))
+                cohort_dates = st.date_input("मुलाकात की तारीखें" if language == "Hindi" else "Visit Dates",
+                                             value=(today - timedelta(days=90), today))
+                find_cohort = st.form_submit_button("खोजें" if language == "Hindi" else "Search")
+            if find_cohort and isinstance(cohort_dates, (tuple, list)) and len(cohort_dates) == 2:
+                cohort = database.get_search_index().cohort(cohort_dates[0], f"{cohort_dates[1]} 23:59",
+                                                            risk_range[0], risk_range[1], name=cohort_name or None)
+                st.caption(f"{len(cohort)} रोगी" if language == "Hindi" else f"{len(cohort)} patient(s)")
+                st.dataframe(cohort.head(500), use_container_width=True, hide_index=True)
+
+        # Export: streamed to a file under DATA_DIR/exports in chunks, then offered for download
+        with st.expander("रिकॉर्ड निर्यात करें" if language == "Hindi" else "Export Records"):
+            with st.form("export_records"):
+                today = datetime.now().date()
+                col_format, col_labels = st.columns(2)
+                with col_format:
+                    export_format = st.selectbox("प्रारूप" if language == "Hindi" else "Format", export.FORMATS,
+                                                 format_func=lambda f: {"csv": "CSV", "parquet": "Parquet", "fhir": "FHIR Bundle (JSON)"}[f])
+                with col_labels:
+                    export_labels = st.multiselect("जोखिम स्तर" if language == "Hindi" else "Risk Levels",
+                                                   [level["label"] for level in rules.active().spec["levels"]])
+                limit_dates = st.checkbox("तारीख सीमा लागू करें" if language == "Hindi" else "Limit to visit dates")
+                export_dates = st.date_input("मुलाकात की तारीखें" if language == "Hindi" else "Visit Dates",
+                                             value=(today - timedelta(days=365), today), key="export_dates")
+                export_ids = st.text_area("रोगी आईडी (वैकल्पिक, अल्पविराम से अलग)" if language == "Hindi" else "Patient IDs (optional, comma-separated)")
+                run_export = st.form_submit_button("निर्यात तैयार करें" if language == "Hindi" else "Prepare Export")
+            if run_export:
+                start, end = None, None
+                if limit_dates and isinstance(export_dates, (tuple, list)) and len(export_dates) == 2:
+                    start, end = export_dates[0], f"{export_dates[1]} 23:59"
+                patient_ids = [p.strip() for p in export_ids.replace("\n", ",").split(",") if p.strip()]
+                extension, mime = export.FILE_TYPES[export_format]
+                file_name = f"swasthya_records_{datetime.now():%Y%m%d_%H%M}{extension}"
+                # Only the latest export of this session is kept on disk
+                previous_path = st.session_state.get("export_path")
+                if previous_path and os.path.exists(previous_path):
+                    os.remove(previous_path)
+                export_path = config.data_path("exports", f"{int(time.time() * 1000)}-{file_name}")
+                st.session_state.export_path = export_path
+                try:
+                    with st.spinner("निर्यात तैयार किया जा रहा है..." if language == "Hindi" else "Preparing export..."):
+                        refresh_error = export.refresh()
+                        with open(export_path, "wb") as f:
+                            n_exported = export.export(export_format, f, start, end, export_labels, patient_ids or None)
+                    st.caption(f"{n_exported} मुलाकातें निर्यात की गईं" if language == "Hindi" else f"{n_exported} visit(s) exported")
+                    if refresh_error:
+                        st.warning(f"⚠️ Google Sheets नहीं पढ़ा जा सका ({refresh_error})। निर्यात में केवल इस डिवाइस पर अंतिम सिंक तक की मुलाकातें हैं; अन्य डिवाइस की नई मुलाकातें छूट सकती हैं।"
+                                   if language == "Hindi" else
+                                   f"⚠️ Could not read Google Sheets ({refresh_error}). The export holds the visits last synced to this device; newer visits from other devices may be missing.")
+                    with open(export_path, "rb") as f:
+                        st.download_button("⬇️ डाउनलोड करें" if language == "Hindi" else "⬇️ Download", f,
+                                           file_name=file_name, mime=mime, on_click="ignore")
+                except export.ExportError as e:
+                    st.error(str(e))
+
+        # Report for a past visit; the stored advice is only fetched when the PDF is built
+        with st.expander("पिछली मुलाकात की रिपोर्ट" if language == "Hindi" else "Past Visit Report"):
+            report_pid = st.text_input("रोगी ID" if language == "Hindi" else "Patient ID", key="report_patient_id").strip()
+            if report_pid:
+                visits = database.get_patient_history(report_pid)
+                if visits.empty:
+                    st.caption("इस ID के लिए कोई मुलाकात नहीं मिली" if language == "Hindi" else "No visits found for this Patient ID")
+                else:
+                    visit_rows = {row["Date"]: row for row in visits.to_dict("records")}
+                    visit_date = st.selectbox("मुलाकात" if language == "Hindi" else "Visit", list(visit_rows)[::-1])
+                    visit = visit_rows[visit_date]
+                    sys_bp_past, dia_bp_past = logic.split_bp([str(visit["BP"])])
+
+                    def past_visit_pdf(visit=visit, sys_bp=sys_bp_past[0], dia_bp=dia_bp_past[0]):
+                        return reports.create_pdf({
+                            'name': visit["Name"], 'patient_id': visit["Patient_ID"], 'age': visit["Age"],
+                            'date': visit["Date"], 'score': visit["Risk_Score"], 'label': visit["Label"],
+                            'bmi': visit["BMI"], 'sugar': visit["Sugar"], 'sys': f"{sys_bp:.0f}", 'dia': f"{dia_bp:.0f}",
+                            'followup_date': visit.get("Followup_Date") if pd.notna(visit.get("Followup_Date")) else None,
+                            'advice': database.get_advice(visit.get("Advice")),
+                        }, language=language)
+
+                    st.download_button("रिपोर्ट डाउनलोड करें (PDF)" if language == "Hindi" else "Download Report (PDF)",
+                                       past_visit_pdf, mime="application/pdf", on_click="ignore",
+                                       file_name=f"Swasthya_Report_{report_pid}_{str(visit_date)[:10].replace('-', '')}.pdf")
+
+        # Sleep patterns across all visits with sleep data
+        sleep_stats = sleep.summary(df)
+        if sleep_stats:
+            st.subheader("नींद के पैटर्न" if language == "Hindi" else "Sleep Patterns")
+            col_bands, col_types = st.columns(2)
+            with col_bands:
+                st.bar_chart(sleep_stats["bands"])
+            with col_types:
+                st.dataframe(sleep_stats["chronotypes"], use_container_width=True)
+            corr = sleep_stats["correlation"]
+            if corr["spearman"] is not None:
+                st.caption(f"{sleep_stats['visits']} visits | नींद और जोखिम स्कोर का सहसंबंध: Spearman {corr['spearman']}, Pearson {corr['pearson']}" if language == "Hindi" else f"{sleep_stats['visits']} visits | Correlation of sleep hours with risk score: Spearman {corr['spearman']}, Pearson {corr['pearson']}")
+
+if is_admin:
+    with tabs[2]:
+        st.subheader("Pipeline Timings")
+        stage_stats = tracing.stage_stats()
+        if stage_stats:
+            st.dataframe(pd.DataFrame(stage_stats), use_container_width=True, hide_index=True)
+        else:
+            st.info("No timings recorded yet. Run a diagnostic to populate this panel.")
+        metric_values = tracing.metric_values()
+        if metric_values:
+            st.subheader("Backend Resilience")
+            st.dataframe(pd.DataFrame(metric_values), use_container_width=True, hide_index=True)
+        metrics_text = tracing.export_prometheus()
+        st.download_button("Download Metrics (Prometheus)", data=metrics_text,
+                           file_name="swasthya_metrics.txt", mime="text/plain")
+        with st.expander("Metrics Text"):
+            st.code(metrics_text, language="text")
+        with st.expander("Advice Prompt Size"):
+            token_report = prompts.token_report()
+            st.dataframe(pd.DataFrame([{"Language": lang, "Prompt Tokens": sizes["prompt_tokens"], "Max Response Tokens": sizes["max_tokens"]}
+                                       for lang, sizes in token_report.items()]), use_container_width=True, hide_index=True)
+            st.caption("Token counts: " + ("tiktoken cl100k_base" if prompts.HAS_TIKTOKEN else "estimated (install tiktoken for exact counts)"))
+        
+        st.subheader("Background Jobs")
+        jobs = {job.name: job for job in scheduler.default_jobs()}
+        col_job, col_run = st.columns([3, 1])
+        with col_job:
+            job_name = st.selectbox("Job", list(jobs), label_visibility="collapsed")
+        with col_run:
+            run_now = st.button("Run Now", use_container_width=True)
+        if run_now:
+            with st.spinner(f"Running {job_name}..."):
+                result = scheduler.run_job(jobs[job_name])
+            if result["status"] == scheduler.OK:
+                st.success(f"{job_name} finished in {result['duration']:.2f}s: {result['detail']}")
+            else:
+                st.error(f"{job_name} failed after {result['duration']:.2f}s: {result['detail']}")
+        st.dataframe(scheduler.status(list(jobs.values())), use_container_width=True, hide_index=True)
+        if not scheduler.running():
+            st.caption("The scheduler is not running in this process (SCHEDULER_ENABLED is off, or it runs as a sidecar).")
+        with st.expander("Recent Job Runs"):
+            st.dataframe(scheduler.get_store().runs(limit=50), use_container_width=True, hide_index=True)
+        
+        st.subheader("Data Quality")
+        stored = database.get_history()
+        if not stored.empty:
+            check = logic.validate_batch(stored)
+            n_invalid = int((~check.valid).sum())
+            st.caption(f"{n_invalid} of {len(check)} stored visits fail validation.")
+            if n_invalid:
+                failing = {name: count for name, count in check.counts().items() if count}
+                st.dataframe(pd.DataFrame({"check": list(failing), "rows": list(failing.values())}),
+                             use_container_width=True, hide_index=True)
+                with st.expander("Failing Visits (first 50)"):
+                    st.dataframe(pd.DataFrame([
+                        {"row": label, "errors": "; ".join(messages)} for label, messages in check.errors(limit=50)
+                    ]), use_container_width=True, hide_index=True)
+        
+        if not stored.empty:
+            anomalies = anomaly.backfill(stored)[1]
+            n_errors = int((anomalies["Kind"] == anomaly.ENTRY_ERROR).sum())
+            st.caption(f"{len(anomalies)} stored readings are unusual for their patient ({n_errors} likely entry errors).")
+            if not anomalies.empty:
+                with st.expander("Unusual Readings (latest 50)"):
+                    st.dataframe(anomalies.tail(50).iloc[::-1], use_container_width=True, hide_index=True)
+        
+        st.subheader("Risk Rules")
+        ruleset = rules.active()
+        st.caption(f"Active rule set: {ruleset.version} ({ruleset.name}). Set RULESET to change it.")
+        versions = rules.available()
+        compare = st.selectbox("Preview stored visits under", versions,
+                               index=versions.index(ruleset.version) if ruleset.version in versions else 0)
+        if compare and not stored.empty:
+            rescored = logic.rescore_history(stored, compare)
+            preview = pd.DataFrame({
+                "stored": stored["Label"].value_counts(),
+                compare: rescored["Label"].value_counts(),
+            }).fillna(0).astype(int)
+            st.dataframe(preview, use_container_width=True)
+            st.caption(f"{int((rescored['Label'] != stored['Label']).sum())} visit(s) would change risk level. "
+                       f"To rewrite stored scores run `python -m src.rescore --version {compare}` (add `--dry-run` to review first).")
+        
+        region = clinics.all_clinics()
+        if len(region) > 1:
+            st.subheader("Regional Analytics")
+            with st.form("regional_analytics"):
+                selected = st.multiselect("Clinics", region, default=region, format_func=clinics.label)
+                region_dates = st.date_input("Visit Dates", value=())
+                load_region = st.form_submit_button("Load Regional Data")
+            if load_region and selected:
+                start, end = (region_dates[0], f"{region_dates[1]} 23:59") if len(region_dates) == 2 else (None, None)
+                regional, unavailable = database.get_regional_history(selected, start, end)
+                if unavailable:
+                    st.warning(f"Could not read: {', '.join(clinics.label(c) for c in unavailable)}. Showing the other clinics.")
+                st.dataframe(clinics.overview(regional), use_container_width=True)
+                if not regional.empty:
+                    st.bar_chart(pd.crosstab(regional[clinics.CLINIC_COLUMN], regional["Label"]))
+        
+        st.subheader("Follow-up Reminders")
+        reminders = outbox.get_store()
+        with st.form("queue_reminders"):
+            reminder_language = st.selectbox("Message Language", ["English", "Hindi"],
+                                             index=1 if language == "Hindi" else 0)
+            reminder_channel = st.selectbox("Channel", outbox.CHANNELS, index=outbox.CHANNELS.index(outbox.CHANNEL)
+                                            if outbox.CHANNEL in outbox.CHANNELS else 0)
+            queue_reminders = st.form_submit_button("Queue Due Reminders")
+        if queue_reminders:
+            queued = outbox.queue_due(language=reminder_language, channel=reminder_channel)
+            st.success(f"{queued['due']} follow-up(s) due: {queued['queued']} reminder(s) queued, "
+                       f"{queued['skipped_no_phone']} skipped (no phone number).")
+        reminder_counts = reminders.counts()
+        state_cols = st.columns(len(reminder_counts))
+        for col, (state, count) in zip(state_cols, reminder_counts.items()):
+            col.metric(state.title(), count)
+        col_send, col_retry = st.columns(2)
+        with col_send:
+            if outbox.dispatcher_running():
+                st.info("Sending reminders in the background...")
+            elif st.button("Send Queued Reminders", disabled=not reminder_counts[outbox.QUEUED]):
+                try:
+                    outbox.start_dispatcher()
+                    pace = f" (at most {outbox.RATE:g} per second)" if outbox.RATE > 0 else ""
+                    st.success(f"Sending {reminder_counts[outbox.QUEUED]} reminder(s) in the background{pace}.")
+                except outbox.OutboxError as e:
+                    st.error(f"Cannot send reminders: {e}")
+        with col_retry:
+            if st.button("Retry Failed Reminders", disabled=not reminder_counts[outbox.FAILED]):
+                st.success(f"{reminders.retry_failed()} failed reminder(s) queued again.")
+        if reminder_counts[outbox.FAILED]:
+            with st.expander("Failed Reminders (latest 50)"):
+                st.dataframe(reminders.recent(outbox.FAILED), use_container_width=True, hide_index=True)
+        
+        st.subheader("Archive")
+        archive_summary = archive.summary()
+        if archive_summary:
+            st.dataframe(pd.DataFrame(archive_summary), use_container_width=True, hide_index=True)
+        else:
+            st.info("No visits archived yet.")
+        if st.button("Archive Old Visits"):
+            moved = database.archive_old_records()
+            st.success(f"Moved {moved} visit(s) older than the hot window to the archive.")
@@ -0,0 +1,33 @@
+"""
+Benchmarks for src/advice_store.py: saving and resolving advice texts.
+"""
+
+import itertools
+
+import pytest
+
+from benchmarks.synthetic import FakeGroq
+from src import advice_store, ai_advice
+
+
+@pytest.fixture
+def store():
+    return advice_store.AdviceStore(":memory:")
+
+
+def bench_put_new_advice(benchmark, store):
+    counter = itertools.count()
+    key = benchmark(lambda: store.put(f"{FakeGroq.ADVICE}\n\nVisit {next(counter)}"))
+    assert advice_store.is_ref(key)
+
+
+def bench_put_repeated_fallback(benchmark, store):
+    # Fallback advice is identical for every patient with the same risk level
+    text = ai_advice.get_fallback_advice("High Risk", "English")
+    key = benchmark(store.put, text)
+    assert store.stats()["texts"] == 1 and key == advice_store.ref(text)
+
+
+def bench_get_advice(benchmark, store):
+    key = store.put(FakeGroq.ADVICE)
+    assert benchmark(store.get, key) == FakeGroq.ADVICE
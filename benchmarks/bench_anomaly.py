@@ -0,0 +1,36 @@
+"""
+Benchmarks for src/anomaly.py: replaying history into baselines and scoring new visits.
+"""
+
+import pandas as pd
+import pytest
+
+from src import anomaly
+
+
+@pytest.fixture(scope="module")
+def store(large_history):
+    baseline_store = anomaly.BaselineStore(":memory:")
+    baseline_store.update(large_history)
+    return baseline_store
+
+
+def bench_backfill(benchmark, large_history):
+    baselines, flags = benchmark.pedantic(anomaly.backfill, args=(large_history,), rounds=3, iterations=1)
+    assert len(baselines) == large_history["Patient_ID"].nunique()
+    assert set(flags["Kind"]) <= {anomaly.OUTLIER, anomaly.ENTRY_ERROR}
+
+
+def bench_add_visit(benchmark, store, large_history):
+    # A later visit of an existing patient: one baseline row read, updated and written
+    visit = large_history.iloc[[-1]]
+    dates = (ts.strftime("%Y-%m-%d %H:%M") for ts in pd.date_range("2030-01-01", periods=1_000_000, freq="min"))
+    benchmark(lambda: store.update(visit.assign(Date=next(dates))))
+    assert store.get(visit["Patient_ID"].iloc[0])["Last_Visit"] >= "2030-01-01"
+
+
+def bench_check_visit(benchmark, store, large_history):
+    baseline = store.get(large_history["Patient_ID"].iloc[0])
+    readings = {"Sugar": baseline["vitals"]["Sugar"]["mean"] + 80, "Systolic_BP": 120, "Diastolic_BP": 80, "BMI": 24.0}
+    flags = benchmark(anomaly.check, baseline, readings)
+    assert flags and flags[0]["vital"] == "Sugar"
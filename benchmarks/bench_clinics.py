@@ -0,0 +1,41 @@
+"""
+Benchmarks for src/clinics.py: regional queries fanned out across clinic shards.
+"""
+
+import pytest
+
+from benchmarks import synthetic
+from src import clinics, database
+
+SHARDS = [f"CLINIC{i}" for i in range(8)]
+
+
+@pytest.fixture(scope="module")
+def shard_data():
+    """8 clinic worksheets of 25,000 visits each."""
+    return {clinic: synthetic.generate_history(2_500, visits_per_patient=10, seed=10 + i)
+            for i, clinic in enumerate(SHARDS)}
+
+
+@pytest.fixture
+def sharded_conn(monkeypatch, shard_data):
+    """Fake Sheets with one worksheet per clinic and a 50 ms round trip."""
+    conn = synthetic.FakeSheetsConnection(latency=0.05)
+    conn.worksheets.update(shard_data)
+    monkeypatch.setenv("CLINICS", ",".join(SHARDS))
+    monkeypatch.setattr(database, "get_conn", lambda: conn)
+    yield conn
+    database._read_clinic_sheet.clear()
+
+
+def bench_regional_history_fan_out(benchmark, sharded_conn, shard_data):
+    # Uncached: every round reads all 8 worksheets (in parallel)
+    regional, failed = benchmark.pedantic(database.get_regional_history, args=(SHARDS,),
+                                          setup=database._read_clinic_sheet.clear, rounds=5, iterations=1)
+    assert not failed and len(regional) == sum(len(df) for df in shard_data.values())
+
+
+def bench_clinic_overview(benchmark, sharded_conn):
+    regional, _ = database.get_regional_history(SHARDS)
+    result = benchmark(clinics.overview, regional)
+    assert list(result.index) == SHARDS
@@ -0,0 +1,24 @@
+"""
+Benchmarks for src/database.py against an in-memory fake Sheets connection.
+"""
+
+from src import database
+
+
+def bench_get_patient_history_large(benchmark, monkeypatch, large_history):
+    monkeypatch.setattr(database, "_hot_history", lambda: large_history)
+    patient_id = large_history["Patient_ID"].iloc[len(large_history) // 2]
+    result = benchmark(database.get_patient_history, patient_id)
+    assert len(result) >= 10
+
+
+def bench_add_record(benchmark, fake_conn, patients):
+    row = patients.iloc[0]
+    record = {
+        "patient_id": row["Patient_ID"], "name": row["Name"], "age": row["Age"], "gender": row["Gender"],
+        "weight": row["Weight"], "height": row["Height"], "bmi": row["BMI"], "sugar": row["Sugar"],
+        "sys": row["Systolic_BP"], "dia": row["Diastolic_BP"], "score": 4, "label": "Moderate Risk",
+        "phone": row["Phone"], "followup_date": "", "advice": "Walk 30 minutes daily.",
+    }
+    benchmark(database.add_record, record)
+    assert fake_conn.writes > 0
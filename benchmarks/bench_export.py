@@ -0,0 +1,39 @@
+"""
+Benchmarks for src/export.py: streaming the stored history to each format.
+"""
+
+import os
+
+import pytest
+
+from src import database, export, local_store
+
+
+@pytest.fixture(scope="module")
+def stored_history(large_history):
+    """large_history mirrored into the on-device store, the source of hot visits."""
+    local_store.get_store(database.SHEET_COLUMNS).mirror(large_history)
+    return large_history
+
+
+def _export(fmt, **filters):
+    with open(os.devnull, "wb") as out:
+        return export.export(fmt, out, **filters)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def bench_export_all(benchmark, stored_history, fmt):
+    rows = benchmark.pedantic(_export, args=(fmt,), rounds=3, iterations=1)
+    assert rows >= len(stored_history.drop_duplicates(["Patient_ID", "Date"]))
+
+
+def bench_export_high_risk_quarter(benchmark, stored_history):
+    rows = benchmark.pedantic(_export, args=("csv",), rounds=3, iterations=1,
+                              kwargs={"start": "2023-01-01", "end": "2023-03-31 23:59", "labels": ["High Risk"]})
+    assert rows > 0
+
+
+def bench_fhir_observations_chunk(benchmark, stored_history):
+    chunk = stored_history.head(export.CHUNK_ROWS)
+    observations = benchmark.pedantic(lambda: sum(1 for _ in export.fhir_observations(chunk)), rounds=3, iterations=1)
+    assert observations >= len(chunk)
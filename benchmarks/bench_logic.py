@@ -0,0 +1,30 @@
+"""
+Benchmarks for src/logic.py: risk scoring and input validation.
+"""
+
+from src import logic
+
+
+def _rows(patients):
+    return list(patients[["Age", "BMI", "Weight", "Height", "Sugar", "Systolic_BP", "Diastolic_BP"]].itertuples(index=False))
+
+
+def bench_calculate_scrs(benchmark, patients):
+    rows = _rows(patients)
+    benchmark(lambda: [logic.calculate_scrs(r.Age, r.BMI, r.Sugar, r.Systolic_BP, r.Diastolic_BP, 7) for r in rows])
+
+
+def bench_validate_inputs(benchmark, patients):
+    rows = _rows(patients)
+    benchmark(lambda: [logic.validate_inputs(r.Age, r.Weight, r.Height, r.Sugar, r.Systolic_BP, r.Diastolic_BP) for r in rows])
+
+
+def bench_validate_batch(benchmark, patients):
+    result = benchmark(logic.validate_batch, patients)
+    assert len(result) == len(patients)
+
+
+def bench_rescore_history(benchmark, large_history):
+    result = benchmark(logic.rescore_history, large_history)
+    assert len(result) == len(large_history)
+
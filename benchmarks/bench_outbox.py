@@ -0,0 +1,45 @@
+"""
+Benchmarks for src/outbox.py: finding due follow-ups and draining the reminder queue.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import outbox
+
+ON_DATE = "2024-06-01"
+
+
+@pytest.fixture(scope="module")
+def followup_history(large_history):
+    """200,000 visits, half with a follow-up date within two weeks of ON_DATE."""
+    rng = np.random.default_rng(46)
+    offsets = pd.to_timedelta(rng.integers(-10, 4, len(large_history)), unit="D")
+    followups = (pd.Timestamp(ON_DATE) + offsets).strftime("%Y-%m-%d")
+    return large_history.assign(Followup_Date=np.where(rng.random(len(large_history)) < 0.5, followups, ""))
+
+
+def bench_due_followups(benchmark, followup_history):
+    due = benchmark(outbox.due_followups, followup_history, ON_DATE)
+    assert not due.empty and due["Patient_ID"].is_unique
+
+
+def bench_queue_and_dispatch(benchmark, followup_history):
+    due = outbox.due_followups(followup_history, ON_DATE)
+    reminders, _ = outbox.build_reminders(due, "Hindi", "sms")
+
+    def run():
+        store = outbox.OutboxStore(":memory:")
+        store.enqueue(reminders)
+        return outbox.dispatch(outbox.FakeSender(fail_every=20), store, batch_size=200, rate=0)
+
+    stats = benchmark.pedantic(run, rounds=3, iterations=1)
+    assert stats["sent"] + stats["retrying"] == len(reminders)
+
+
+def bench_normalize_phone(benchmark, followup_history):
+    """Phones read from the sheet as floats or NaN must not turn into other numbers."""
+    phones = followup_history["Phone"].tolist() + [9876543210.0, float("nan"), None]
+    normalized = benchmark(lambda: [outbox.normalize_phone(p) for p in phones])
+    assert normalized[-3:] == ["919876543210", "", ""]
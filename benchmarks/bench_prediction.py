@@ -0,0 +1,27 @@
+"""
+Benchmarks for src/prediction.py: per-patient and population trend forecasting.
+"""
+
+from src import prediction
+
+
+def _patient_frames(history, n):
+    ids = history["Patient_ID"].drop_duplicates().head(n)
+    subset = history[history["Patient_ID"].isin(ids)]
+    return [group for _, group in subset.groupby("Patient_ID", sort=False)]
+
+
+def bench_predict_trends_single(benchmark, large_history):
+    patient = _patient_frames(large_history, 1)[0]
+    result = benchmark(prediction.predict_trends, patient)
+    assert result and "Sugar" in result
+
+
+def bench_predict_trends_500_patients(benchmark, large_history):
+    frames = _patient_frames(large_history, 500)
+    benchmark(lambda: [prediction.predict_trends(f) for f in frames])
+
+
+def bench_forecast_population(benchmark, large_history):
+    result = benchmark(prediction.forecast_population, large_history)
+    assert len(result) == large_history["Patient_ID"].nunique()
@@ -0,0 +1,35 @@
+"""
+Benchmarks for src/prompts.py and advice parsing: prompt building and
+turning a response into the care plan reused by the UI, PDF and WhatsApp.
+"""
+
+import pytest
+
+from benchmarks.synthetic import FakeGroq
+from src import ai_advice, prompts, reports
+
+
+@pytest.mark.parametrize("language", ["English", "Hindi"])
+def bench_build_advice_prompt(benchmark, language):
+    prompt, tokens, budget = benchmark(prompts.build_advice_prompt, "Asha Verma", 54, "Moderate Risk", "negative",
+                                       "Metformin 500mg", language, "Night Owl", 6.5)
+    # Compact: no indentation or blank lines left from the source template
+    assert all(line and line == line.strip() for line in prompt.splitlines())
+    assert tokens == prompts.count_tokens(prompt) and budget == prompts.MAX_TOKENS[language]
+
+
+def bench_parse_advice(benchmark):
+    plan = benchmark(ai_advice.parse_advice, f"{ai_advice.AI_TITLE}\n\n{FakeGroq.ADVICE}")
+    assert all(plan[section] for section in ai_advice.SECTIONS)
+
+
+def bench_render_outputs(benchmark):
+    # One parse feeds all three outputs
+    plan = ai_advice.parse_advice(ai_advice.get_fallback_advice("High Risk"))
+
+    def render():
+        return (ai_advice.advice_markdown(plan), reports.get_whatsapp_link("Asha", 7, "High Risk", advice_plan=plan),
+                reports.create_pdf({"name": "Asha", "score": 7, "label": "High Risk", "advice_plan": plan}))
+
+    markdown, link, pdf = benchmark(render)
+    assert "Exercise" in markdown and "Care%20Plan" in link and pdf
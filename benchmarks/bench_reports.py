@@ -0,0 +1,18 @@
+"""
+Benchmarks for src/reports.py: PDF report rendering.
+"""
+
+from src import ai_advice, reports
+
+
+def bench_create_pdf(benchmark, patients):
+    row = patients.iloc[0]
+    record = {
+        "patient_id": row["Patient_ID"], "name": row["Name"], "age": int(row["Age"]),
+        "date": "2024-06-01 10:30", "bmi": row["BMI"], "sugar": int(row["Sugar"]),
+        "sys": int(row["Systolic_BP"]), "dia": int(row["Diastolic_BP"]), "score": 7,
+        "label": "High Risk", "followup_date": "2024-07-01",
+        "advice": ai_advice.get_fallback_advice("High Risk") * 3,
+    }
+    pdf = benchmark(reports.create_pdf, record)
+    assert pdf
@@ -0,0 +1,17 @@
+"""
+Benchmarks for src/rescore.py: diffing stored scores against a rule set.
+"""
+
+from src import rescore
+
+
+def bench_diff_large_history(benchmark, large_history):
+    changes = benchmark.pedantic(rescore.diff, args=(large_history, "scrs-who-1"), rounds=3, iterations=1)
+    # Every visit was scored under scrs-1, so all of them are at least re-stamped
+    assert len(changes) == len(large_history)
+
+
+def bench_dry_run_sheet(benchmark, fake_conn):
+    stats = benchmark.pedantic(rescore.run, kwargs={"version": "scrs-who-1", "dry_run": True, "sources": ("sheet",)},
+                               rounds=3, iterations=1)
+    assert stats["scanned"] == len(fake_conn.data) and fake_conn.writes == 0
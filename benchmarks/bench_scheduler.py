@@ -0,0 +1,24 @@
+"""
+Benchmarks for src/scheduler.py: the cache warm-up job and the per-tick cost of
+checking which jobs are due.
+"""
+
+import time
+
+from src import database, scheduler
+
+
+def bench_warm_history(benchmark, fake_conn):
+    stats = benchmark.pedantic(database.refresh_history, rounds=3, iterations=1)
+    assert stats["visits"] == len(fake_conn.data)
+
+
+def bench_run_due_idle(benchmark):
+    """A tick where every job has already run in its current slot."""
+    store = scheduler.JobStore(":memory:")
+    jobs = [scheduler.Job(f"noop_{i}", lambda: None, every=60) for i in range(4)]
+    jobs += [scheduler.Job("nightly", lambda: None, at="02:00")]
+    now = time.time()
+    scheduler.run_due(jobs, now=now, store=store)
+    results = benchmark(scheduler.run_due, jobs, now=now, store=store)
+    assert results == {}
@@ -0,0 +1,39 @@
+"""
+Benchmarks for src/search.py: building the patient index and looking patients up.
+"""
+
+import pytest
+
+from src import search
+
+
+@pytest.fixture(scope="module")
+def index(large_history):
+    return search.PatientIndex(large_history)
+
+
+def bench_build_index(benchmark, large_history):
+    result = benchmark(search.PatientIndex, large_history)
+    assert len(result) == large_history["Patient_ID"].nunique()
+
+
+def bench_find_by_phone(benchmark, index, large_history):
+    phone = large_history["Phone"].iloc[-1]
+    result = benchmark(index.find, phone)
+    assert large_history["Patient_ID"].iloc[-1] in set(result["Patient_ID"])
+
+
+def bench_find_by_name_prefix(benchmark, index, large_history):
+    result = benchmark(index.find, large_history["Name"].iloc[-1][:4])
+    assert len(result) > 0
+
+
+def bench_find_by_misspelled_name(benchmark, index, large_history):
+    name = large_history["Name"].iloc[-1]
+    result = benchmark(index.find, name[:-1] + "x")
+    assert len(result) > 0
+
+
+def bench_cohort_high_risk_quarter(benchmark, index):
+    result = benchmark(index.cohort, "2023-01-01", "2023-03-31", 5, None)
+    assert len(result) > 0
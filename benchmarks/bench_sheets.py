@@ -0,0 +1,54 @@
+"""
+Benchmarks for src/sheets.py: a burst of sessions missing the cache at once.
+"""
+
+import threading
+
+from benchmarks import synthetic
+from src import database, sheets
+
+USERS = 20
+
+
+def _burst(func):
+    """Call func from USERS threads released at the same moment."""
+    start = threading.Barrier(USERS)
+    errors = []
+
+    def user():
+        start.wait()
+        try:
+            func()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=user) for _ in range(USERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def bench_coalesced_sheet_reads(benchmark, monkeypatch, patients):
+    """20 simultaneous cache misses cost one upstream read (and one mirror)."""
+    conn = synthetic.FakeSheetsConnection(patients, latency=0.2)
+    monkeypatch.setattr(database, "get_conn", lambda: conn)
+
+    def run():
+        before = conn.reads
+        _burst(lambda: database._fetch_sheet(fresh=True))
+        return conn.reads - before
+
+    reads = benchmark.pedantic(run, rounds=3, iterations=1)
+    assert reads == 1
+
+
+def bench_read_many(benchmark, fake_conn, patients):
+    """Several worksheets read in parallel: about one round trip, not one per sheet."""
+    fake_conn.latency = 0.2
+    names = [f"Clinic{i}" for i in range(4)]
+    for name in names:
+        fake_conn.worksheets[name] = patients
+    results, errors = benchmark.pedantic(sheets.read_many, args=(fake_conn, names), rounds=3, iterations=1)
+    assert not errors and len(results) == len(names)
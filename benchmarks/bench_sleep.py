@@ -0,0 +1,22 @@
+"""
+Benchmarks for src/sleep.py: sleep metrics and population sleep analytics.
+"""
+
+from src import sleep
+
+
+def bench_metrics_single(benchmark):
+    duration, _, chronotype = benchmark(sleep.metrics, "22:30", "06:15")
+    assert duration == 7.75 and chronotype
+
+
+def bench_metrics_clock_strings(benchmark, large_history):
+    bedtime = [f"{int(h):02d}:{int(h % 1 * 60):02d}" for h in large_history["Bedtime"]]
+    waketime = [f"{int(h):02d}:{int(h % 1 * 60):02d}" for h in large_history["Waketime"]]
+    duration, _, _ = benchmark(sleep.metrics, bedtime, waketime)
+    assert len(duration) == len(large_history)
+
+
+def bench_summary(benchmark, large_history):
+    result = benchmark(sleep.summary, large_history)
+    assert result["visits"] == len(large_history)
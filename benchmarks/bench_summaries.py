@@ -0,0 +1,43 @@
+"""
+Benchmarks for src/summaries.py: building per-patient summaries and reading one.
+"""
+
+import pandas as pd
+import pytest
+
+from src import summaries
+
+
+@pytest.fixture(scope="module")
+def store(large_history):
+    summary_store = summaries.SummaryStore(":memory:")
+    summary_store.update(large_history)
+    return summary_store
+
+
+def bench_build_summaries(benchmark, large_history):
+    def build():
+        return summaries.SummaryStore(":memory:").update(large_history)
+
+    result = benchmark.pedantic(build, rounds=3, iterations=1)
+    assert result == large_history["Patient_ID"].nunique()
+
+
+def bench_get_summary(benchmark, store, large_history):
+    result = benchmark(store.get, large_history["Patient_ID"].iloc[-1])
+    assert result["Visits"] >= 2 and result["forecast"] is not None
+
+
+def bench_add_visit(benchmark, store, large_history):
+    # A later visit of an existing patient: one row re-aggregated and re-forecast
+    visit = large_history.iloc[[-1]]
+    dates = (ts.strftime("%Y-%m-%d %H:%M") for ts in pd.date_range("2030-01-01", periods=1_000_000, freq="min"))
+    result = benchmark(lambda: store.update(visit.assign(Date=next(dates))))
+    assert result == 1
+
+
+def bench_resubmit_sheet(benchmark, store, large_history):
+    # Every sheet read passes the whole sheet again; already counted visits are skipped
+    result = benchmark.pedantic(store.update, args=(large_history,), kwargs={"known_only": True},
+                                rounds=3, iterations=1)
+    assert result == 0
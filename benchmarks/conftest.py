@@ -0,0 +1,75 @@
+"""
+Shared fixtures for the benchmark suite.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+STORAGE = os.path.join(HERE, ".benchmarks")
+# Reference run committed with the code; every run is compared with it
+BASELINE = os.path.join(HERE, "baseline", "baseline.json")
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Keep the on-device store used by add_record out of the real data directory
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="swasthya-bench-"))
+# The fake sheet has no API quota; pacing calls to it would only measure sleeps
+os.environ.setdefault("SHEETS_READ_RATE", "0")
+os.environ.setdefault("SHEETS_WRITE_RATE", "0")
+
+from benchmarks import synthetic  # noqa: E402
+from src import database  # noqa: E402
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """
+    Keep saved runs next to the suite (local history only) and compare with
+    the committed baseline; an explicit --benchmark-compare=<run> still
+    compares with a saved local run instead.
+    """
+    if not hasattr(config.option, "benchmark_storage"):
+        return
+    config.option.benchmark_storage = "file://" + STORAGE
+    if config.option.benchmark_compare is not True:
+        return
+    if os.path.exists(BASELINE):
+        config.option.benchmark_compare = BASELINE
+    else:
+        config.option.benchmark_compare = []
+        config.option.benchmark_compare_fail = None
+
+
+def pytest_benchmark_update_json(config, benchmarks, output_json):
+    """Write the committed baseline with summary statistics only, not every timing."""
+    if os.path.abspath(str(getattr(config.option, "benchmark_json", None) or "")) != BASELINE:
+        return
+    for bench in output_json["benchmarks"]:
+        bench["stats"].pop("data", None)
+
+
+@pytest.fixture(scope="session")
+def patients():
+    """10,000 single-visit synthetic patients."""
+    return synthetic.generate_patients(10_000, seed=1)
+
+
+@pytest.fixture(scope="session")
+def large_history():
+    """200,000-row sheet: 20,000 patients x 10 visits."""
+    return synthetic.generate_history(20_000, visits_per_patient=10, seed=2)
+
+
+@pytest.fixture
+def fake_conn(monkeypatch, large_history):
+    """Route database.get_conn() to an in-memory sheet holding large_history."""
+    conn = synthetic.FakeSheetsConnection(large_history)
+    monkeypatch.setattr(database, "get_conn", lambda: conn)
+    database._read_sheet.clear()
+    yield conn
+    database._read_sheet.clear()
@@ -0,0 +1,214 @@
+"""
+Synthetic load generator simulating concurrent clinic sessions.
+
+Each simulated health worker is a separate Streamlit AppTest session running
+the real app.py: it fills the sidebar with a synthetic patient, clicks
+"Run Diagnostics" and waits for the rerun to finish. Google Sheets and Groq
+are replaced by in-memory fakes with configurable latency.
+
+Usage:
+    python -m benchmarks.loadtest --users 10 --iterations 5 \
+        --sheets-latency 0.3 --groq-latency 0.8 --history-patients 2000
+
+Reports throughput, latency percentiles, per-stage timings and memory per
+session, including how much of it is each session's private copy of the
+patient history (st.session_state.db_cache); sessions reading the shared
+memory-mapped snapshot count as holding no private copy.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from src import database, tracing
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def _widget(widgets, label):
+    """Find a widget by the start of its (English) label."""
+    for widget in widgets:
+        if widget.label.startswith(label):
+            return widget
+    raise LookupError(f"No widget labelled {label!r}")
+
+
+def _fill_patient(at, patient):
+    """Enter one synthetic patient into the sidebar form."""
+    sidebar = at.sidebar
+    _widget(sidebar.text_input, "Full Name").input(patient["Name"])
+    _widget(sidebar.text_input, "Phone Number").input(patient["Phone"])
+    _widget(sidebar.number_input, "Age").set_value(int(patient["Age"]))
+    _widget(sidebar.number_input, "Weight").set_value(int(np.clip(patient["Weight"], 30, 150)))
+    _widget(sidebar.number_input, "Height").set_value(int(np.clip(patient["Height"], 100, 250)))
+    _widget(sidebar.number_input, "Fasting Sugar").set_value(int(patient["Sugar"]))
+    _widget(sidebar.number_input, "Systolic BP").set_value(int(patient["Systolic_BP"]))
+    _widget(sidebar.number_input, "Diastolic BP").set_value(int(np.clip(patient["Diastolic_BP"], 50, 150)))
+
+
+def _session_cache_bytes(at):
+    """Bytes held by this session's private copy of the history, and its id()."""
+    try:
+        cache = at.session_state["db_cache"]
+    except KeyError:
+        return 0, None
+    if cache is None:
+        return 0, None
+    # Arrow-backed columns come from the shared memory-mapped snapshot
+    private = [c for c, dtype in cache.dtypes.items() if not isinstance(dtype, pd.ArrowDtype)]
+    if not private:
+        return 0, None
+    return int(cache[private].memory_usage(deep=True).sum()), id(cache)
+
+
+def run_session(user_id, patients, iterations, timeout):
+    """
+    Drive one simulated clinic session.
+
+    Returns:
+        dict: latencies (seconds), error count, cache bytes and cache identity
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+    latencies, errors = [], 0
+    for i in range(iterations):
+        patient = patients.iloc[(user_id * iterations + i) % len(patients)]
+        _fill_patient(at, patient)
+        _widget(at.sidebar.button, "Run Diagnostics").click()
+        start = time.perf_counter()
+        at.run()
+        latencies.append(time.perf_counter() - start)
+        if at.exception:
+            errors += 1
+    cache_bytes, cache_id = _session_cache_bytes(at)
+    return {"latencies": latencies, "errors": errors, "cache_bytes": cache_bytes, "cache_id": cache_id}
+
+
+def run_load_test(users=10, iterations=5, sheets_latency=0.3, groq_latency=0.8,
+                  history_patients=2000, returning_ratio=0.5, timeout=120, seed=0):
+    """
+    Run N concurrent simulated sessions against stubbed backends.
+
+    Args:
+        users: Number of concurrent sessions
+        iterations: Diagnostics per session
+        sheets_latency: Seconds added to every fake Sheets read/write
+        groq_latency: Seconds added to every fake Groq completion
+        history_patients: Patients in the pre-filled sheet (6 visits each)
+        returning_ratio: Share of submitted patients that already have history
+        timeout: Per-rerun timeout in seconds
+        seed: Random seed for synthetic data
+
+    Returns:
+        dict: Summary metrics (see print_report)
+    """
+    import groq
+
+    history = synthetic.generate_history(history_patients, visits_per_patient=6, seed=seed)
+    conn = synthetic.FakeSheetsConnection(history, latency=sheets_latency)
+
+    # Mix returning patients (same name/phone as stored rows) with new ones
+    total = users * iterations
+    n_returning = min(int(total * returning_ratio), history_patients)
+    returning = history.drop_duplicates("Patient_ID").sample(n=n_returning, random_state=seed)
+    bp = returning["BP"].str.split("/", expand=True).astype(int)
+    returning = returning.assign(Systolic_BP=bp[0], Diastolic_BP=bp[1])
+    new = synthetic.generate_patients(max(total - n_returning, 1), seed=seed + 1)
+    patients = pd.concat([new, returning[new.columns]], ignore_index=True)
+    patients = patients.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    # Sessions write to a throwaway on-device store, not the real data directory
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="swasthya-load-"))
+    # Measure the sessions alone, without background cache refreshes
+    os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+    original_get_conn, original_groq = database.get_conn, groq.Groq
+    original_key = os.environ.get("GROQ_API_KEY")
+    database.get_conn = lambda: conn
+    groq.Groq = synthetic.FakeGroq.factory(groq_latency)
+    os.environ["GROQ_API_KEY"] = "fake-key"
+    database._read_sheet.clear()
+    tracing.reset()
+
+    tracemalloc.start()
+    baseline_mem, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            results = list(pool.map(lambda u: run_session(u, patients, iterations, timeout), range(users)))
+    finally:
+        elapsed = time.perf_counter() - start
+        current_mem, peak_mem = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        database.get_conn, groq.Groq = original_get_conn, original_groq
+        if original_key is None:
+            os.environ.pop("GROQ_API_KEY", None)
+        else:
+            os.environ["GROQ_API_KEY"] = original_key
+
+    latencies = np.array([lat for r in results for lat in r["latencies"]])
+    cache_ids = {r["cache_id"] for r in results if r["cache_id"] is not None}
+    return {
+        "users": users,
+        "diagnostics": len(latencies),
+        "errors": sum(r["errors"] for r in results),
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "p95_s": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        "p99_s": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        "memory_per_session_mb": (current_mem - baseline_mem) / users / 1e6,
+        "peak_memory_mb": (peak_mem - baseline_mem) / 1e6,
+        "session_cache_mb": sum(r["cache_bytes"] for r in results) / users / 1e6,
+        "distinct_session_caches": len(cache_ids),
+        "sheet_reads": conn.reads,
+        "sheet_writes": conn.writes,
+        "stages": tracing.stage_stats(),
+    }
+
+
+def print_report(report):
+    """Print a load test summary."""
+    print(f"Sessions: {report['users']}  Diagnostics: {report['diagnostics']}  Errors: {report['errors']}")
+    print(f"Throughput: {report['throughput_per_s']:.2f} diagnostics/s over {report['elapsed_s']:.1f}s")
+    print(f"Latency: p50 {report['p50_s'] * 1000:.0f} ms  p95 {report['p95_s'] * 1000:.0f} ms  "
+          f"p99 {report['p99_s'] * 1000:.0f} ms")
+    print(f"Memory: {report['memory_per_session_mb']:.2f} MB/session retained, "
+          f"peak {report['peak_memory_mb']:.1f} MB")
+    print(f"History cache: {report['session_cache_mb']:.2f} MB/session in "
+          f"{report['distinct_session_caches']} separate copies")
+    print(f"Upstream Sheets calls: {report['sheet_reads']} reads, {report['sheet_writes']} writes")
+    if report["distinct_session_caches"] > 1:
+        print("WARNING: each session holds its own copy of the patient history.")
+    print("\nStage timings:")
+    for s in report["stages"]:
+        print(f"  {s['stage']:<18} n={s['count']:<5} p50 {s['p50_ms']:>9.1f} ms  p95 {s['p95_ms']:>9.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent clinic sessions against stubbed backends.")
+    parser.add_argument("--users", type=int, default=10, help="concurrent sessions")
+    parser.add_argument("--iterations", type=int, default=5, help="diagnostics per session")
+    parser.add_argument("--sheets-latency", type=float, default=0.3, help="seconds per fake Sheets call")
+    parser.add_argument("--groq-latency", type=float, default=0.8, help="seconds per fake Groq call")
+    parser.add_argument("--history-patients", type=int, default=2000, help="patients in the fake sheet")
+    parser.add_argument("--returning-ratio", type=float, default=0.5, help="share of returning patients")
+    parser.add_argument("--timeout", type=float, default=120, help="per-rerun timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    report = run_load_test(args.users, args.iterations, args.sheets_latency, args.groq_latency,
+                           args.history_patients, args.returning_ratio, args.timeout, args.seed)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Synthetic patient data and fake backends for benchmarks and load tests.
+
+Vitals are drawn from per-column means/standard deviations fitted on
+sample_patient_data.csv, and names are recombined from the sample's first and
+last names, so generated data has the same shape and value ranges as real
+screening camp data.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src import database, logic, rules, sleep
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_patient_data.csv")
+
+VITAL_COLUMNS = ["Age", "Weight", "Height", "Sugar", "Systolic_BP", "Diastolic_BP"]
+
+# Clip generated vitals to the ranges accepted by the sidebar inputs
+VITAL_LIMITS = {
+    "Age": (18, 90),
+    "Weight": (35, 150),
+    "Height": (140, 200),
+    "Sugar": (60, 400),
+    "Systolic_BP": (90, 220),
+    "Diastolic_BP": (55, 130),
+}
+
+
+def _load_profile():
+    """Fit means/stds and name pools on the sample CSV."""
+    sample = pd.read_csv(SAMPLE_CSV)
+    names = sample["Name"].str.split(" ", n=1, expand=True)
+    return {
+        "mean": sample[VITAL_COLUMNS].mean().to_dict(),
+        "std": sample[VITAL_COLUMNS].std().to_dict(),
+        "male_ratio": float((sample["Gender"] == "Male").mean()),
+        "first_names": sorted(names[0].unique()),
+        "last_names": sorted(names[1].dropna().unique()),
+    }
+
+
+PROFILE = _load_profile()
+
+
+def generate_patients(n, seed=0):
+    """
+    Generate one screening visit for each of n synthetic patients.
+
+    Args:
+        n: Number of patients
+        seed: Random seed (same seed -> same data)
+
+    Returns:
+        pandas.DataFrame: Columns Patient_ID, Name, Phone, Gender, Age, Weight,
+        Height, BMI, Sugar, Systolic_BP, Diastolic_BP
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col in VITAL_COLUMNS:
+        low, high = VITAL_LIMITS[col]
+        values = rng.normal(PROFILE["mean"][col], PROFILE["std"][col], n)
+        data[col] = np.clip(np.round(values), low, high).astype(int)
+    # Keep diastolic strictly below systolic, as validate_inputs requires
+    data["Diastolic_BP"] = np.minimum(data["Diastolic_BP"], data["Systolic_BP"] - 20)
+
+    first = rng.choice(PROFILE["first_names"], n)
+    last = rng.choice(PROFILE["last_names"], n)
+    names = np.char.add(np.char.add(first.astype(str), " "), last.astype(str))
+    phones = rng.integers(7_000_000_000, 9_999_999_999, n).astype(str)
+
+    df = pd.DataFrame(data)
+    df.insert(0, "Name", names)
+    df.insert(1, "Phone", phones)
+    df.insert(2, "Gender", np.where(rng.random(n) < PROFILE["male_ratio"], "Male", "Female"))
+    # Same ID rule as the app, so returning patients find their history
+    df.insert(0, "Patient_ID", [database.generate_patient_id(nm, ph) for nm, ph in zip(names, phones)])
+    df["BMI"] = (df["Weight"] / (df["Height"] / 100) ** 2).round(1)
+    return df
+
+
+def generate_history(n_patients, visits_per_patient=6, seed=0, start="2022-01-01"):
+    """
+    Generate a patient sheet (database.SHEET_COLUMNS) with repeat visits.
+
+    Each patient's vitals drift slightly between visits, and visits are spaced
+    irregularly (2-10 weeks apart) like real follow-ups.
+
+    Args:
+        n_patients: Number of distinct patients
+        visits_per_patient: Visits per patient
+        seed: Random seed
+        start: Date of the earliest visit
+
+    Returns:
+        pandas.DataFrame: History in sheet format, sorted by Date
+    """
+    rng = np.random.default_rng(seed)
+    base = generate_patients(n_patients, seed)
+    visits = base.loc[base.index.repeat(visits_per_patient)].reset_index(drop=True)
+    visit_no = np.tile(np.arange(visits_per_patient), n_patients)
+
+    drift = rng.normal(0, [3.0, 4.0, 2.0], (len(visits), 3))
+    visits["Sugar"] = np.clip(visits["Sugar"] + drift[:, 0] * visit_no, 60, 400).round().astype(int)
+    visits["Systolic_BP"] = np.clip(visits["Systolic_BP"] + drift[:, 1] * visit_no, 90, 220).round().astype(int)
+    visits["Diastolic_BP"] = np.clip(visits["Diastolic_BP"] + drift[:, 2] * visit_no, 55, 130).round().astype(int)
+    visits["Diastolic_BP"] = np.minimum(visits["Diastolic_BP"], visits["Systolic_BP"] - 20)
+
+    gaps = rng.integers(14, 70, (n_patients, visits_per_patient))
+    gaps[:, 0] = rng.integers(0, 365, n_patients)
+    days = gaps.cumsum(axis=1).ravel()
+    dates = pd.Timestamp(start) + pd.to_timedelta(days, unit="D")
+
+    # Sidebar sleep inputs step in 15 minutes; most patients sleep around 22:00-06:00
+    bedtime = np.round(rng.normal(22.5, 1.5, len(visits)) * 4) / 4 % 24
+    waketime = np.round(rng.normal(6.5, 1.2, len(visits)) * 4) / 4 % 24
+    sleep_hours, _, chronotype = sleep.metrics(bedtime, waketime)
+    scores, labels = logic.calculate_scrs_batch(visits["Age"], visits["BMI"], visits["Sugar"],
+                                                visits["Systolic_BP"], visits["Diastolic_BP"], sleep_hours)
+    history = pd.DataFrame({
+        "Date": dates.strftime("%Y-%m-%d %H:%M"),
+        "Patient_ID": visits["Patient_ID"],
+        "Name": visits["Name"],
+        "Age": visits["Age"],
+        "Gender": visits["Gender"],
+        "Weight": visits["Weight"].astype(float),
+        "Height": visits["Height"].astype(float),
+        "BMI": visits["BMI"],
+        "Sugar": visits["Sugar"],
+        "BP": visits["Systolic_BP"].astype(str) + "/" + visits["Diastolic_BP"].astype(str),
+        "Risk_Score": scores,
+        "Label": labels,
+        "Phone": visits["Phone"],
+        "Followup_Date": "",
+        "Advice": "",
+        "Rule_Version": rules.active().version,
+        "Bedtime": bedtime,
+        "Waketime": waketime,
+        "Sleep_Hours": sleep_hours,
+        "Chronotype": chronotype,
+    })
+    return history.sort_values("Date", kind="stable").reset_index(drop=True)[database.SHEET_COLUMNS]
+
+
+class FakeSheetsConnection:
+    """
+    In-memory stand-in for the Streamlit GSheetsConnection.
+
+    Supports the read()/update()/create() calls used by src/database.py, with
+    optional artificial latency to mimic the Sheets API round trip. `data` is
+    the patient sheet (Sheet1); other worksheets live in `worksheets`.
+    """
+
+    def __init__(self, data=None, latency=0.0):
+        self.data = data if data is not None else database.empty_history()
+        self.worksheets = {}
+        self.latency = latency
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, worksheet):
+        if worksheet == "Sheet1":
+            return self.data
+        if worksheet not in self.worksheets:
+            raise ValueError(f"Worksheet {worksheet!r} not found")
+        return self.worksheets[worksheet]
+
+    def read(self, worksheet="Sheet1", usecols=None, ttl=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.reads += 1
+            df = self._get(worksheet)
+        return df.iloc[:, usecols] if usecols is not None else df.copy()
+
+    def update(self, worksheet="Sheet1", data=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self._get(worksheet)
+            self.writes += 1
+            if worksheet == "Sheet1":
+                self.data = data.reset_index(drop=True)
+            else:
+                self.worksheets[worksheet] = data.reset_index(drop=True)
+        return data
+
+    def create(self, worksheet="Sheet1", data=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if worksheet == "Sheet1" or worksheet in self.worksheets:
+                raise ValueError(f"Worksheet {worksheet!r} already exists")
+            self.writes += 1
+            self.worksheets[worksheet] = data.reset_index(drop=True)
+        return data
+
+
+class FakeGroq:
+    """
+    Stand-in for groq.Groq returning a canned care plan after a fixed latency.
+
+    Install with monkeypatching `groq.Groq = FakeGroq.factory(latency)`.
+    """
+
+    ADVICE = (
+        "1. **Dietary Adjustment**: Prefer millets and dal; avoid fried snacks and sweets.\n"
+        "2. **Lifestyle Micro-Habit**: Walk 15 mins after dinner.\n"
+        "3. **Medication Note**: Take prescribed medicines at the same time daily."
+    )
+
+    def __init__(self, api_key=None, latency=0.0, **kwargs):
+        self.latency = latency
+        self.chat = self
+        self.completions = self
+        self.calls = 0
+
+    @classmethod
+    def factory(cls, latency):
+        """Return a constructor compatible with groq.Groq(api_key=..., max_retries=...)."""
+        return lambda *args, **kwargs: cls(*args, latency=latency, **kwargs)
+
+    def create(self, messages=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        message = type("Message", (), {"content": self.ADVICE})()
+        choice = type("Choice", (), {"message": message})()
+        return type("Completion", (), {"choices": [choice]})()
@@ -0,0 +1,148 @@
+"""
+Content-addressed store for advice texts (SQLite, next to the local visit store).
+
+A care plan is saved once under the SHA-256 of its text and zlib-compressed;
+the patient sheet keeps only the reference ("sha256:<hex>"). Identical texts
+(fallback advice, cached AI advice) are stored once. Blobs are uploaded to a
+shared worksheet by the background reconciler, so other devices can resolve
+references they did not write. Older rows holding the advice text itself are
+still read as-is.
+"""
+
+import base64
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+
+from src import config
+
+REF_PREFIX = "sha256:"
+
+# Hex digits of the SHA-256 kept in a reference (128 bits)
+HASH_CHARS = 32
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def ref(text):
+    """Reference for an advice text ("" for empty text)."""
+    if not text:
+        return ""
+    return REF_PREFIX + hashlib.sha256(text.encode("utf-8")).hexdigest()[:HASH_CHARS]
+
+
+def is_ref(value):
+    """True if a sheet value is an advice reference rather than inline text."""
+    return isinstance(value, str) and value.startswith(REF_PREFIX) and len(value) == len(REF_PREFIX) + HASH_CHARS
+
+
+class AdviceStore:
+    """
+    SQLite table of compressed advice texts keyed by hash.
+
+    Args:
+        path: Database file path (":memory:" for a throwaway store)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS advice (hash TEXT PRIMARY KEY, body BLOB NOT NULL, "
+                "size INTEGER, uploaded INTEGER NOT NULL DEFAULT 0, created_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_advice_uploaded ON advice(uploaded)")
+
+    def put(self, text):
+        """
+        Save an advice text (a no-op if the same text is already stored).
+
+        Returns:
+            str: Its reference, or "" for empty text
+        """
+        key = ref(text)
+        if not key:
+            return ""
+        raw = text.encode("utf-8")
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO advice (hash, body, size, created_at) VALUES (?, ?, ?, ?)",
+                               (key, zlib.compress(raw, 9), len(raw), time.time()))
+        return key
+
+    def get(self, key):
+        """Advice text for a reference, or None if it is not on this device."""
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM advice WHERE hash = ?", (key,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def pending(self):
+        """
+        Blobs not yet uploaded to the shared worksheet.
+
+        Returns:
+            list: (reference, base64 body) tuples
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT hash, body FROM advice WHERE uploaded = 0").fetchall()
+        return [(key, base64.b64encode(body).decode("ascii")) for key, body in rows]
+
+    def mark_uploaded(self, keys):
+        """Record that blobs are now in the shared worksheet."""
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE advice SET uploaded = 1 WHERE hash = ?", [(k,) for k in keys])
+
+    def add_shared(self, rows):
+        """
+        Copy blobs read from the shared worksheet (already uploaded).
+
+        Args:
+            rows: Iterable of (reference, base64 body); invalid rows are skipped
+
+        Returns:
+            int: Number of blobs accepted
+        """
+        values = []
+        for key, body in rows:
+            try:
+                raw = base64.b64decode(body)
+                text = zlib.decompress(raw).decode("utf-8")
+            except Exception:
+                continue
+            if ref(text) == key:  # Content addressing: the body must match its hash
+                values.append((key, raw, len(text.encode("utf-8")), time.time()))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO advice (hash, body, size, uploaded, created_at) VALUES (?, ?, ?, 1, ?)", values
+            )
+        return len(values)
+
+    def stats(self):
+        """Number of stored texts and their total raw / compressed bytes."""
+        with self._lock:
+            count, raw, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM advice").fetchone()
+        return {"texts": count, "raw_bytes": raw, "stored_bytes": stored}
+
+
+def get_store(path=None):
+    """
+    Return the process-wide AdviceStore for a database file.
+
+    Args:
+        path: Database file (defaults to DATA_DIR/swasthya_local.db, shared with local_store)
+
+    Returns:
+        AdviceStore
+    """
+    path = path or config.data_path("swasthya_local.db")
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = AdviceStore(path)
+    return store
@@ -2,7 +2,31 @@
 AI-powered health advice generation using Groq API (Llama-3).
 """
 
-import os
+import re
+
+from src import config, tracing, resilience, prompts
+
+AI_TITLE = "🤖 **AI-Generated Advice**"
+FALLBACK_TITLES = {
+    "English": "📋 **Standard Medical Advice** (AI Unavailable)",
+    "Hindi": "📋 **मानक चिकित्सा सलाह** (AI अनुपलब्ध)",
+}
+
+# Care-plan sections, in display order
+SECTIONS = ("diet", "habit", "medication")
+
+# Heading words that identify a section, for both the AI headings (see
+# prompts.HEADINGS) and the fallback advice's shorter ones
+_SECTION_WORDS = {
+    "diet": ("diet", "food", "nutrition", "आहार", "भोजन"),
+    "habit": ("lifestyle", "habit", "exercise", "activity", "जीवनशैली", "आदत", "व्यायाम"),
+    "medication": ("medication", "medicine", "meds", "दवा"),
+}
+
+_MARKER = re.compile(r"^(?:#+\s*)?(?:(\d+)[.)]\s*|([-*•])\s+)?")
+_HEADING = re.compile(r"^([^:：]{1,40}?)\s*[:：]\s*(.*)$")
+_EMPHASIS = re.compile(r"\*+|__|`|^#+\s*")
+_EMOJI = re.compile(r"[\u2600-\u27bf\ufe0f\U0001f000-\U0001faff]")
 
 def get_holistic_advice(name, age, condition, history_trend, medications="", language="English", chronotype=None, sleep_hours=None):
     """
@@ -22,73 +46,44 @@ def get_holistic_advice(name, age, condition, history_trend, medications="", lan
         str: AI-generated health advice in markdown format
     """
     try:
-        import streamlit as st
         from groq import Groq
         
-        # Get API key from secrets
-        api_key = st.secrets.get("GROQ_API_KEY", os.environ.get("GROQ_API_KEY"))
+        # Get API key from secrets (or environment)
+        api_key = config.get_setting("GROQ_API_KEY")
         
         if not api_key:
             return get_fallback_advice(condition, language)
         
-        client = Groq(api_key=api_key)
-        
-        # Context building
-        trend_msg = "Improving" if history_trend == "positive" else "Worsening" if history_trend == "negative" else "Stable"
-        sleep_info = f"\nSleep: {sleep_hours} hours/night, Chronotype: {chronotype}" if sleep_hours and chronotype else ""
+        # Retries are handled by the shared resilience policy, not the SDK
+        client = Groq(api_key=api_key, max_retries=0)
         
-        # Language-specific prompt
-        if language == "Hindi":
-            prompt = f"""
-            आप एक वरिष्ठ भारतीय डॉक्टर के रूप में कार्य करें।
-            
-            रोगी: {name} ({age} वर्ष)
-            वर्तमान स्थिति: {condition}
-            प्रवृत्ति: {trend_msg}
-            वर्तमान दवाएं: {medications if medications else 'कोई नहीं'}{sleep_info}
-            
-            एक "संपूर्ण देखभाल योजना" मार्कडाउन में प्रदान करें:
-            
-            1. **आहार समायोजन**: खाने/बचने के लिए विशिष्ट भारतीय खाद्य पदार्थ
-            2. **जीवनशैली सूक्ष्म आदत**: एक छोटा बदलाव (जैसे, 'रात के खाने के बाद 15 मिनट टहलें')
-            3. **दवा नोट**: यदि दवाएं प्रदान की गई हैं, तो अनुपालन पर सलाह; अन्यथा, प्राकृतिक प्रबंधन
-            
-            इसे सख्त, छोटा (अधिकतम 150 शब्द), और सहानुभूतिपूर्ण रखें।
-            """
-        else:
-            prompt = f"""
-            Act as a senior Indian Doctor.
-            
-            Patient: {name} ({age} yrs).
-            Current Condition: {condition}.
-            Trend: {trend_msg}.
-            Current Meds: {medications if medications else 'None'}.{sleep_info}
-            
-            Provide a "Hybrid Care Plan" in markdown:
-            
-            1. **Dietary Adjustment**: Specific Indian foods to eat/avoid.
-            2. **Lifestyle Micro-Habit**: One small change (e.g., 'Walk 15 mins after dinner').
-            3. **Medication Note**: If meds provided, advice on compliance; else, natural management.
-            
-            Keep it strict, short (max 150 words), and empathetic.
-            """
+        prompt, prompt_tokens, max_tokens = prompts.build_advice_prompt(
+            name, age, condition, history_trend, medications, language, chronotype, sleep_hours)
         
         import random
         
         # Add slight temperature variation for diverse responses
         temp = random.uniform(0.6, 0.9)
         
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama-3.1-8b-instant",  # Updated from deprecated llama3-8b-8192
-            temperature=temp,
-            max_tokens=350
-        )
+        # Fails fast with CircuitOpenError while Groq is throttled -> fallback advice
+        with tracing.span("groq_call", prompt_tokens=prompt_tokens, language=language):
+            chat_completion = resilience.call_with_retry(
+                lambda: client.chat.completions.create(
+                    messages=[{"role": "user", "content": prompt}],
+                    model="llama-3.1-8b-instant",  # Updated from deprecated llama3-8b-8192
+                    temperature=temp,
+                    max_tokens=max_tokens
+                ),
+                "groq", retries=1, base_delay=0.5, max_delay=2.0
+            )
         
         advice = chat_completion.choices[0].message.content
+        usage = getattr(chat_completion, "usage", None)
+        if usage is not None:
+            tracing.incr("advice_completion_tokens_total", getattr(usage, "completion_tokens", 0) or 0, language=language)
         
         # Mark that AI was used successfully
-        return f"🤖 **AI-Generated Advice**\n\n{advice}"
+        return f"{AI_TITLE}\n\n{advice.strip()}"
     
     except Exception as e:
         # Log error for debugging
@@ -109,27 +104,22 @@ def get_fallback_advice(condition, language="English"):
         str: Standard health advice
     """
     if language == "Hindi":
-        advice = """
-        📋 **मानक चिकित्सा सलाह** (AI अनुपलब्ध)
-        
-        1. **आहार**: कम नमक, कम शक्कर, संतुलित भोजन
-        2. **व्यायाम**: प्रतिदिन 30 मिनट पैदल चलना
-        3. **दवा**: निर्धारित दवाओं का नियमित सेवन करें
-        4. **नियमित जांच**: स्वास्थ्य संबंधी नियमित जांच करवाते रहें
-        
-        कृपया एक योग्य स्वास्थ्य पेशेवर से परामर्श करें।
-        """
+        items = [
+            "1. **आहार**: कम नमक, कम शक्कर, संतुलित भोजन",
+            "2. **व्यायाम**: प्रतिदिन 30 मिनट पैदल चलना",
+            "3. **दवा**: निर्धारित दवाओं का नियमित सेवन करें",
+            "4. **नियमित जांच**: स्वास्थ्य संबंधी नियमित जांच करवाते रहें",
+        ]
+        closing = "कृपया एक योग्य स्वास्थ्य पेशेवर से परामर्श करें।"
     else:
-        advice = """
-        📋 **Standard Medical Advice** (AI Unavailable)
-        
-        1. **Diet**: Low salt, low sugar, balanced meals
-        2. **Exercise**: 30 minutes walk daily
-        3. **Medication**: Take prescribed medications regularly
-        4. **Regular Check-ups**: Maintain regular health screenings
-        
-        Please consult a qualified healthcare professional.
-        """
+        items = [
+            "1. **Diet**: Low salt, low sugar, balanced meals",
+            "2. **Exercise**: 30 minutes walk daily",
+            "3. **Medication**: Take prescribed medications regularly",
+            "4. **Regular Check-ups**: Maintain regular health screenings",
+        ]
+        closing = "Please consult a qualified healthcare professional."
+    advice = "\n\n".join([FALLBACK_TITLES["Hindi" if language == "Hindi" else "English"], "\n".join(items), closing])
     
     if "High" in condition or "Critical" in condition:
         if language == "Hindi":
@@ -139,3 +129,133 @@ def get_fallback_advice(condition, language="English"):
     
     return advice
 
+
+
+def _plain(text):
+    """Text without markdown emphasis or emojis."""
+    return " ".join(_EMOJI.sub("", _EMPHASIS.sub("", text)).split())
+
+
+def _section(label):
+    label = label.lower()
+    for key, words in _SECTION_WORDS.items():
+        if any(word in label for word in words):
+            return key
+    return None
+
+
+def parse_advice(text):
+    """
+    Parse advice text (AI or fallback) once into a care plan.
+
+    Numbered "Heading: text" items are matched to the diet, habit and
+    medication sections by their heading words; other numbered items are
+    kept as extras, bullets under an item are kept as its sub-items (with
+    their markdown), markdown titles are dropped and all remaining lines
+    (closing remarks, warnings) become notes. Responses with
+    no recognizable items keep their text as notes.
+
+    Args:
+        text: Advice markdown as returned by get_holistic_advice / get_fallback_advice
+
+    Returns:
+        dict: {"source": "ai", "fallback" or None, "title": str (markdown),
+               "diet"/"habit"/"medication": {"label", "text", "items"} or None,
+               "extra": [{"label", "text", "items"}], "notes": [markdown lines],
+               "markdown": whitespace-normalized text}
+    """
+    plan = {"source": None, "title": "", "diet": None, "habit": None, "medication": None,
+            "extra": [], "notes": [], "markdown": prompts.normalize(text or "")}
+    current = None
+    for index, line in enumerate(plan["markdown"].splitlines()):
+        if index == 0 and ("🤖" in line or "📋" in line):
+            plan["source"] = "ai" if "🤖" in line else "fallback"
+            plan["title"] = line
+            continue
+        stripped = _plain(line) if not line.startswith(("* ", "- ")) else line
+        marker = _MARKER.match(stripped)
+        numbered, bullet = marker.group(1), marker.group(2)
+        body = _plain(stripped[marker.end():])
+        heading = _HEADING.match(body)
+        key = _section(heading.group(1)) if heading else None
+        if heading and (key or numbered):
+            label, value = heading.group(1), heading.group(2)
+        elif (numbered or line.startswith("#") or "**" in line) and len(body) <= 40 and _section(body):
+            # Heading on a line of its own; its text follows as bullets
+            key, label, value = _section(body), body, ""
+        elif line.startswith("#"):
+            # Titles of the model's own ("### Care Plan") are dropped
+            continue
+        else:
+            if current is not None and bullet:
+                current["items"].append(stripped[marker.end():].strip())
+            elif current is not None and not current["text"] and not current["items"]:
+                current["text"] = body
+            else:
+                current = None
+                plan["notes"].append(line)
+            continue
+        current = {"label": label.strip(), "text": value.strip(), "items": []}
+        if key and plan[key] is None:
+            plan[key] = current
+        else:
+            plan["extra"].append(current)
+    return plan
+
+
+def _ordered(plan):
+    return [plan[key] for key in SECTIONS if plan[key]] + plan["extra"]
+
+
+def plan_items(plan):
+    """
+    Care-plan items in display order: diet, habit, medication, then extras.
+
+    Sub-items are joined into the item's text as plain text, for one-line
+    uses (PDF lines, WhatsApp); advice_markdown keeps them as nested bullets.
+
+    Returns:
+        list: (label, text) tuples
+    """
+    return [(item["label"], "; ".join(part for part in [item["text"]] + [_plain(sub) for sub in item["items"]] if part))
+            for item in _ordered(plan)]
+
+
+def advice_markdown(plan):
+    """
+    Markdown for the care plan in the UI.
+
+    Args:
+        plan: Parsed advice (see parse_advice)
+
+    Returns:
+        str: Title, numbered items (sub-items as nested bullets) and notes
+        (the normalized text when no items were found)
+    """
+    items = _ordered(plan)
+    if not items:
+        return plan["markdown"]
+    blocks = [plan["title"]] if plan["title"] else []
+    lines = []
+    for i, item in enumerate(items, 1):
+        lines.append(f"{i}. **{item['label']}**" + (f": {item['text']}" if item["text"] else ""))
+        lines.extend(f"   - {sub}" for sub in item["items"])
+    blocks.append("\n".join(lines))
+    blocks.extend(plan["notes"])
+    return "\n\n".join(blocks)
+
+
+def advice_lines(plan):
+    """
+    Plain-text lines of the care plan (no markdown or emojis) for PDF and messages.
+
+    Args:
+        plan: Parsed advice (see parse_advice)
+
+    Returns:
+        list: Lines of text
+    """
+    lines = [_plain(plan["title"])] if plan["title"] else []
+    lines.extend(f"{i}. {label}: {_plain(text)}" for i, (label, text) in enumerate(plan_items(plan), 1))
+    lines.extend(_plain(note) for note in plan["notes"])
+    return [line for line in lines if line]
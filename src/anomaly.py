@@ -0,0 +1,299 @@
+"""
+Per-patient anomaly detection on vitals against the patient's own baseline.
+
+Each patient keeps an exponentially weighted mean and variance (EWMA) of
+sugar, systolic/diastolic BP and BMI, updated in O(1) per visit and stored in
+one small row (SQLite, next to the local visit store). A new reading is scored
+as a z-score against that baseline: beyond Z_THRESHOLD it is flagged as an
+outlier, beyond ENTRY_ERROR_Z as a likely data-entry error. Population
+thresholds (calculate_scrs) and range limits (validate_inputs) still apply;
+this catches changes that are unusual for the patient, such as a sudden
+80 mg/dL jump in sugar.
+
+Readings are clipped to the flagging band before they are folded in, so a
+single mistyped value cannot drag the baseline away. The EWMA depends on visit
+order: when an offline device syncs a visit older than the patient's last
+folded visit, the patient's baseline is dropped and replayed from the full
+history on next lookup.
+"""
+
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src import config, patient_tables, tracing
+
+VITALS = ["Sugar", "Systolic_BP", "Diastolic_BP", "BMI"]
+
+# Visit fields parsed from the sheet (BP is split into Systolic_BP/Diastolic_BP)
+_VISIT_COLUMNS = ["Sugar", "BMI"]
+
+UNITS = {"Sugar": "mg/dL", "Systolic_BP": "mmHg", "Diastolic_BP": "mmHg", "BMI": "kg/m²"}
+
+# Weight of the newest reading in the running mean/variance
+ALPHA = float(config.get_setting("ANOMALY_ALPHA", 0.3))
+
+# |z| at which a reading is flagged, and at which it is more likely a typo
+Z_THRESHOLD = float(config.get_setting("ANOMALY_Z", 3.0))
+ENTRY_ERROR_Z = float(config.get_setting("ANOMALY_ENTRY_ERROR_Z", 6.0))
+
+# Readings folded in before a baseline is used for flagging
+MIN_VISITS = 3
+
+# Floor on the baseline's standard deviation (typical visit-to-visit variation
+# of one person), so very stable patients are not flagged for ordinary noise
+MIN_STD = {"Sugar": 15.0, "Systolic_BP": 10.0, "Diastolic_BP": 7.0, "BMI": 0.8}
+
+OUTLIER, ENTRY_ERROR = "outlier", "entry_error"
+
+_STATE_SUFFIXES = ["N", "Mean", "Var"]
+_COLUMNS = (["Patient_ID", "Last_Visit"]
+            + [f"{v}_{s}" for v in VITALS for s in _STATE_SUFFIXES]
+            + ["updated_at"])
+
+FLAG_COLUMNS = ["Patient_ID", "Date", "Vital", "Value", "Expected", "Z", "Kind"]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _kind(z):
+    return np.where(np.abs(z) >= ENTRY_ERROR_Z, ENTRY_ERROR, np.where(np.abs(z) >= Z_THRESHOLD, OUTLIER, ""))
+
+
+def _step(n, mean, var, x, min_std):
+    """
+    Score readings against baselines, then fold them in (arrays of equal length).
+
+    Returns:
+        tuple: (n, mean, var) after the readings, and (expected, z) before them
+        (NaN while a baseline has fewer than MIN_VISITS readings)
+    """
+    std = np.sqrt(np.maximum(var, min_std ** 2))
+    ready = n >= MIN_VISITS
+    expected = np.where(ready, mean, np.nan)
+    z = (x - expected) / std
+    x = np.where(ready, np.clip(x, mean - Z_THRESHOLD * std, mean + Z_THRESHOLD * std), x)
+    first = n == 0
+    diff = np.where(first, 0.0, x - mean)
+    increment = ALPHA * diff
+    return (n + 1, np.where(first, x, mean + increment),
+            np.where(first, 0.0, (1 - ALPHA) * (var + diff * increment))), (expected, z)
+
+
+def _fold(visits, previous):
+    """
+    Fold date-ordered visits into stored baselines, all patients at once.
+
+    Visits are processed one rank at a time (every patient's first new visit,
+    then every second one, ...), so the loop runs once per visit of the busiest
+    patient and each step is vectorized over patients.
+
+    Args:
+        visits: Output of patient_tables.visits
+        previous: Stored state indexed by Patient_ID (may lack patients)
+
+    Returns:
+        tuple: (state DataFrame indexed by Patient_ID, {vital: (expected, z)} aligned with visits)
+    """
+    pids, codes = np.unique(visits["Patient_ID"].to_numpy(), return_inverse=True)
+    old = previous.reindex(pids)
+    rank = visits.groupby("Patient_ID", sort=False).cumcount().to_numpy()
+    order = np.argsort(rank, kind="stable")
+    bounds = np.searchsorted(rank[order], np.arange(rank.max() + 2))
+    state, scores = {}, {}
+    for vital in VITALS:
+        n = np.nan_to_num(old[f"{vital}_N"].to_numpy(dtype=float, copy=True))
+        mean = old[f"{vital}_Mean"].to_numpy(dtype=float, copy=True)
+        var = np.nan_to_num(old[f"{vital}_Var"].to_numpy(dtype=float, copy=True))
+        values = visits[vital].to_numpy(dtype=float)
+        expected = np.full(len(visits), np.nan)
+        z = np.full(len(visits), np.nan)
+        for k in range(len(bounds) - 1):
+            rows = order[bounds[k]:bounds[k + 1]]
+            rows = rows[~np.isnan(values[rows])]
+            p = codes[rows]
+            (n[p], mean[p], var[p]), (expected[rows], z[rows]) = _step(n[p], mean[p], var[p], values[rows],
+                                                                       MIN_STD[vital])
+        state[f"{vital}_N"], state[f"{vital}_Mean"], state[f"{vital}_Var"] = n, mean, var
+        scores[vital] = (expected, z)
+    return pd.DataFrame(state, index=pd.Index(pids, name="Patient_ID")), scores
+
+
+def _flags(visits, scores):
+    """Flagged readings, one row per (visit, vital), in FLAG_COLUMNS."""
+    parts = []
+    for vital in VITALS:
+        expected, z = scores[vital]
+        hit = np.abs(np.nan_to_num(z)) >= Z_THRESHOLD
+        if hit.any():
+            parts.append(pd.DataFrame({
+                "Patient_ID": visits["Patient_ID"].to_numpy()[hit], "Date": visits["Date"].to_numpy()[hit],
+                "Vital": vital, "Value": visits[vital].to_numpy(dtype=float)[hit],
+                "Expected": expected[hit].round(1), "Z": z[hit].round(1), "Kind": _kind(z[hit]),
+            }))
+    if not parts:
+        return pd.DataFrame(columns=FLAG_COLUMNS)
+    return pd.concat(parts, ignore_index=True).sort_values(["Date", "Patient_ID"], kind="stable", ignore_index=True)
+
+
+def backfill(history):
+    """
+    Replay a whole history: every patient's baseline, and every reading that
+    was anomalous against the baseline before it.
+
+    Args:
+        history: pandas.DataFrame of visits in sheet format
+
+    Returns:
+        tuple: (baselines indexed by Patient_ID, flagged readings in FLAG_COLUMNS)
+    """
+    visits = patient_tables.visits(history, _VISIT_COLUMNS)
+    if visits.empty:
+        return pd.DataFrame(columns=_COLUMNS[1:-1]), pd.DataFrame(columns=FLAG_COLUMNS)
+    state, scores = _fold(visits, pd.DataFrame(columns=_COLUMNS[2:-1]))
+    state.insert(0, "Last_Visit", visits.groupby("Patient_ID")["Date"].last())
+    return state, _flags(visits, scores)
+
+
+def check(baseline, readings):
+    """
+    Score one new visit against a patient's baseline (O(1)).
+
+    Args:
+        baseline: BaselineStore.get result (None for a new patient)
+        readings: {vital: value} for some of VITALS
+
+    Returns:
+        list: Flags (dicts with vital, value, expected, std, z, kind), largest |z| first
+    """
+    if not baseline:
+        return []
+    flags = []
+    for vital, value in readings.items():
+        stats = baseline["vitals"].get(vital)
+        if stats is None or value is None or stats["n"] < MIN_VISITS:
+            continue
+        std = max(stats["std"], MIN_STD[vital])
+        z = (float(value) - stats["mean"]) / std
+        if abs(z) >= Z_THRESHOLD:
+            flags.append({"vital": vital, "value": float(value), "expected": round(stats["mean"], 1),
+                          "std": round(std, 1), "z": round(z, 1), "kind": str(_kind(np.array(z)))})
+    return sorted(flags, key=lambda f: -abs(f["z"]))
+
+
+class BaselineStore:
+    """
+    SQLite table with one EWMA baseline row per patient.
+
+    Args:
+        path: Database file path (":memory:" for a throwaway store)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        state_defs = ", ".join(f'"{v}_{s}" REAL' for v in VITALS for s in _STATE_SUFFIXES)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS vital_baseline (Patient_ID TEXT PRIMARY KEY, Last_Visit TEXT, "
+                f"{state_defs}, updated_at REAL)"
+            )
+            patient_tables.create_visit_table(self._conn, "baseline_visit", "vital_baseline")
+
+    def update(self, visits, known_only=False):
+        """
+        Fold visits into the baselines of their patients.
+
+        Visits already folded (same Patient_ID and Date) are skipped; the EWMA
+        depends on order, so a patient with a new visit dated at or before
+        Last_Visit is forgotten instead and replayed on next lookup.
+
+        Args:
+            visits: pandas.DataFrame of visits in sheet format
+            known_only: Only update patients that already have a baseline (used
+                for partial views such as the sheet without archived visits)
+
+        Returns:
+            pandas.DataFrame: Readings flagged against the baselines they were folded into
+        """
+        new = patient_tables.visits(visits, _VISIT_COLUMNS)
+        if new.empty:
+            return pd.DataFrame(columns=FLAG_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            existing = patient_tables.load(self._conn, "vital_baseline", _COLUMNS,
+                                           new["Patient_ID"].unique().tolist())
+            if known_only:
+                new = new[new["Patient_ID"].isin(existing.index).to_numpy()]
+            late = patient_tables.not_after_last(new, existing)
+            if late.any():
+                candidates = new[late]
+                late_pids = candidates["Patient_ID"][
+                    ~patient_tables.seen(self._conn, "baseline_visit", candidates)].unique().tolist()
+                if late_pids:
+                    patient_tables.delete(self._conn, "vital_baseline", "baseline_visit", late_pids)
+                    tracing.incr("baseline_replays_total", len(late_pids))
+                new = new[~late & ~new["Patient_ID"].isin(late_pids).to_numpy()].reset_index(drop=True)
+            if new.empty:
+                return pd.DataFrame(columns=FLAG_COLUMNS)
+            state, scores = _fold(new, existing)
+            state.insert(0, "Last_Visit", new.groupby("Patient_ID")["Date"].last())
+            state["updated_at"] = time.time()
+            names = ", ".join(f'"{c}"' for c in _COLUMNS)
+            marks = ", ".join("?" for _ in _COLUMNS)
+            rows = state.reset_index()[_COLUMNS].astype(object)
+            self._conn.executemany(f"INSERT OR REPLACE INTO vital_baseline ({names}) VALUES ({marks})",
+                                   rows.where(rows.notna(), None).itertuples(index=False, name=None))
+            patient_tables.add_visits(self._conn, "baseline_visit", new)
+        return _flags(new, scores)
+
+    def forget(self, patient_ids):
+        """Drop baselines; they are replayed from the full history on next lookup."""
+        with self._lock, self._conn:
+            patient_tables.delete(self._conn, "vital_baseline", "baseline_visit", patient_ids)
+
+    def get(self, patient_id):
+        """
+        Baseline of one patient.
+
+        Returns:
+            dict: Patient_ID, Last_Visit and vitals ({vital: {n, mean, std}});
+            None if the patient is unknown
+        """
+        names = ", ".join(f'"{c}"' for c in _COLUMNS)
+        with self._lock:
+            row = self._conn.execute(f"SELECT {names} FROM vital_baseline WHERE Patient_ID = ?",
+                                     (str(patient_id),)).fetchone()
+        if row is None:
+            return None
+        row = dict(zip(_COLUMNS, row))
+        vitals = {}
+        for vital in VITALS:
+            if row[f"{vital}_N"]:
+                vitals[vital] = {"n": int(row[f"{vital}_N"]), "mean": row[f"{vital}_Mean"],
+                                 "std": float(np.sqrt(row[f"{vital}_Var"] or 0.0))}
+        return {"Patient_ID": row["Patient_ID"], "Last_Visit": row["Last_Visit"], "vitals": vitals}
+
+
+def get_store(path=None):
+    """
+    Return the process-wide BaselineStore for a database file.
+
+    Args:
+        path: Database file (defaults to DATA_DIR/swasthya_local.db, shared with local_store)
+
+    Returns:
+        BaselineStore
+    """
+    path = path or config.data_path("swasthya_local.db")
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = BaselineStore(path)
+    return store
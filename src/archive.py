@@ -0,0 +1,300 @@
+"""
+Columnar archive of older visits (Parquet, partitioned by year and month).
+
+Visits older than the hot window are moved out of Google Sheets into
+    DATA_DIR/archive/year=YYYY/month=MM/part-<timestamp>.parquet
+Each part is zstd-compressed and sorted by Patient_ID, so a patient lookup
+prunes partitions by date and skips row groups using Patient_ID statistics
+instead of loading the archive.
+"""
+
+import glob
+import os
+import time
+
+import pandas as pd
+
+from src import config, tracing
+
+HAS_PYARROW = False
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    # Archive disabled - all history stays in the sheet
+    pass
+
+# Stored as float64 so missing values survive; everything else is text
+NUMERIC_COLUMNS = {"Age", "Weight", "Height", "BMI", "Sugar", "Risk_Score", "Bedtime", "Waketime", "Sleep_Hours"}
+
+ROW_GROUP_SIZE = 5000
+
+
+def archive_dir():
+    """Root folder of the archive."""
+    return config.data_path("archive", "")
+
+
+def version():
+    """Changes whenever parts are added; use as a cache key for archive reads."""
+    try:
+        return os.path.getmtime(os.path.join(archive_dir(), "_VERSION"))
+    except OSError:
+        return 0.0
+
+
+def _schema(columns):
+    return pa.schema([(c, pa.float64() if c in NUMERIC_COLUMNS else pa.string()) for c in columns])
+
+
+def to_table(df, columns):
+    """Coerce a sheet frame to the archive schema (numeric columns as float64, the rest as text)."""
+    frame = df.reindex(columns=columns)
+    for c in columns:
+        if c in NUMERIC_COLUMNS:
+            frame[c] = pd.to_numeric(frame[c], errors="coerce")
+        else:
+            frame[c] = frame[c].astype(str).where(frame[c].notna(), None)
+    return pa.Table.from_pandas(frame, schema=_schema(columns), preserve_index=False)
+
+
+def _month_bounds(start, end):
+    """(year, month) tuples for the inclusive date range; None means unbounded."""
+    lo = (start.year, start.month) if start is not None else None
+    hi = (end.year, end.month) if end is not None else None
+    return lo, hi
+
+
+def partitions(start=None, end=None):
+    """
+    List archive partitions overlapping a date range (directory pruning only).
+
+    Args:
+        start: Earliest date (datetime/str) or None
+        end: Latest date (datetime/str) or None
+
+    Returns:
+        list: (year, month, [parquet file paths]) sorted by month
+    """
+    root = archive_dir()
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    lo, hi = _month_bounds(start, end)
+    found = []
+    for year_dir in glob.glob(os.path.join(root, "year=*")):
+        year = int(os.path.basename(year_dir).split("=")[1])
+        for month_dir in glob.glob(os.path.join(year_dir, "month=*")):
+            month = int(os.path.basename(month_dir).split("=")[1])
+            if lo is not None and (year, month) < lo:
+                continue
+            if hi is not None and (year, month) > hi:
+                continue
+            files = sorted(glob.glob(os.path.join(month_dir, "*.parquet")))
+            if files:
+                found.append((year, month, files))
+    return sorted(found)
+
+
+def write(df, columns):
+    """
+    Append visits to the archive, one new part file per month.
+
+    Args:
+        df: Visits in sheet format
+        columns: Column order to store
+
+    Returns:
+        int: Number of rows archived
+    """
+    if not HAS_PYARROW or df is None or df.empty:
+        return 0
+    dates = pd.to_datetime(df["Date"], errors="coerce")
+    frame = df[dates.notna()]
+    dates = dates[dates.notna()]
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    written = 0
+    with tracing.span("archive_write", rows=len(frame)):
+        for (year, month), part in frame.groupby([dates.dt.year, dates.dt.month]):
+            folder = config.data_path("archive", f"year={year}", f"month={month:02d}", "")
+            path = os.path.join(folder, f"part-{stamp}-{os.getpid()}.parquet")
+            table = to_table(part.sort_values(["Patient_ID", "Date"]), columns)
+            tmp = path + ".tmp"
+            pq.write_table(table, tmp, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+            os.replace(tmp, path)  # readers never see a half-written part
+            written += len(part)
+    with open(os.path.join(archive_dir(), "_VERSION"), "w") as f:
+        f.write(stamp)
+    return written
+
+
+def read_month(year, month, columns):
+    """
+    All visits of one month partition, newest copy of each (Patient_ID, Date).
+
+    Args:
+        year: Partition year
+        month: Partition month
+        columns: Columns to return
+
+    Returns:
+        tuple: (pandas.DataFrame of the month's visits, list of part files read)
+    """
+    files = sorted(glob.glob(os.path.join(archive_dir(), f"year={year}", f"month={month:02d}", "*.parquet")))
+    df = _read(files, columns)
+    return df.drop_duplicates(subset=["Patient_ID", "Date"], keep="last").reset_index(drop=True), files
+
+
+def replace_month(year, month, df, columns, old_files):
+    """
+    Rewrite one month partition as a single part (e.g., after re-scoring).
+
+    The new part is in place before the old ones are removed, so readers
+    never miss a visit. Only the parts the rewrite was built from are
+    removed: a part archived meanwhile by another process is kept.
+
+    Args:
+        year: Partition year
+        month: Partition month
+        df: All visits of the month in sheet format
+        columns: Column order to store
+        old_files: Part files df was read from (as returned by read_month)
+
+    Returns:
+        int: Number of rows written
+    """
+    folder = config.data_path("archive", f"year={year}", f"month={month:02d}", "")
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    path = os.path.join(folder, f"part-{stamp}-{os.getpid()}-rewrite.parquet")
+    with tracing.span("archive_write", rows=len(df)):
+        table = to_table(df.sort_values(["Patient_ID", "Date"]), columns)
+        pq.write_table(table, path + ".tmp", compression="zstd", row_group_size=ROW_GROUP_SIZE)
+        os.replace(path + ".tmp", path)
+    for old in old_files:
+        if old != path:
+            os.remove(old)
+    with open(os.path.join(archive_dir(), "_VERSION"), "w") as f:
+        f.write(stamp)
+    return len(df)
+
+
+def _read(files, columns, filter_expr=None):
+    if not HAS_PYARROW or not files:
+        return pd.DataFrame(columns=columns)
+    dataset = ds.dataset(files, schema=_schema(columns), format="parquet")
+    table = dataset.to_table(columns=columns, filter=filter_expr)
+    return table.to_pandas()
+
+
+def read_range(columns, start=None, end=None):
+    """
+    Read archived visits within a date range.
+
+    Args:
+        columns: Columns to return
+        start: Earliest date (inclusive) or None
+        end: Latest date (inclusive) or None
+
+    Returns:
+        pandas.DataFrame: Matching visits
+    """
+    files = [f for _, _, fs in partitions(start, end) for f in fs]
+    if not files:
+        return pd.DataFrame(columns=columns)
+    with tracing.span("archive_read", files=len(files)):
+        df = _read(files, columns)
+        if start is not None or end is not None:
+            dates = pd.to_datetime(df["Date"], errors="coerce")
+            mask = pd.Series(True, index=df.index)
+            if start is not None:
+                mask &= dates >= pd.Timestamp(start)
+            if end is not None:
+                mask &= dates <= pd.Timestamp(end)
+            df = df[mask]
+    return df
+
+
+def iter_range(columns, start=None, end=None, labels=None, patient_ids=None, batch_size=ROW_GROUP_SIZE):
+    """
+    Stream archived visits in a date range, one batch at a time.
+
+    Label and patient filters are evaluated inside the Parquet scan, so row
+    groups that cannot match are skipped.
+
+    Args:
+        columns: Columns to return
+        start: Earliest date (inclusive) or None
+        end: Latest date (inclusive) or None
+        labels: Risk levels to keep, or None for all
+        patient_ids: Patient IDs to keep, or None for all
+        batch_size: Maximum rows per DataFrame
+
+    Yields:
+        pandas.DataFrame: Matching visits
+    """
+    files = [f for _, _, fs in partitions(start, end) for f in fs]
+    if not HAS_PYARROW or not files:
+        return
+    expression = None
+    if labels:
+        expression = ds.field("Label").isin(list(labels))
+    if patient_ids:
+        by_patient = ds.field("Patient_ID").isin([str(p) for p in patient_ids])
+        expression = by_patient if expression is None else expression & by_patient
+    dataset = ds.dataset(files, schema=_schema(columns), format="parquet")
+    for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size):
+        df = batch.to_pandas()
+        if start is not None or end is not None:
+            dates = pd.to_datetime(df["Date"], errors="coerce")
+            mask = pd.Series(True, index=df.index)
+            if start is not None:
+                mask &= dates >= pd.Timestamp(start)
+            if end is not None:
+                mask &= dates <= pd.Timestamp(end)
+            df = df[mask]
+        if not df.empty:
+            yield df
+
+
+def open_writer(sink, columns):
+    """ParquetWriter with the archive schema and compression (used for exports)."""
+    return pq.ParquetWriter(sink, _schema(columns), compression="zstd")
+
+
+def read_patient(patient_id, columns, start=None, end=None):
+    """
+    Read one patient's archived visits without scanning the whole archive.
+
+    Partitions outside the date range are skipped by directory name and row
+    groups whose Patient_ID min/max exclude the patient are never decoded.
+
+    Args:
+        patient_id: Patient identifier
+        columns: Columns to return
+        start: Earliest date or None
+        end: Latest date or None
+
+    Returns:
+        pandas.DataFrame: The patient's archived visits
+    """
+    files = [f for _, _, fs in partitions(start, end) for f in fs]
+    if not files:
+        return pd.DataFrame(columns=columns)
+    with tracing.span("archive_patient_read", files=len(files)):
+        return _read(files, columns, ds.field("Patient_ID") == str(patient_id))
+
+
+def summary():
+    """
+    Row counts and on-disk size per partition, from Parquet footers only.
+
+    Returns:
+        list: dicts with partition, files, rows, mb
+    """
+    rows = []
+    for year, month, files in partitions():
+        n = sum(pq.ParquetFile(f).metadata.num_rows for f in files) if HAS_PYARROW else 0
+        size = sum(os.path.getsize(f) for f in files)
+        rows.append({"partition": f"{year}-{month:02d}", "files": len(files), "rows": n, "mb": round(size / 1e6, 2)})
+    return rows
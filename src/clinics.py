@@ -0,0 +1,154 @@
+"""
+Clinic sharding of the patient store.
+
+Each clinic writes to its own worksheet, so one clinic's reads, writes and
+Sheets quota never touch another clinic's rows. A deployment serves one
+clinic (the CLINIC_ID setting); its on-device files (local store, snapshot,
+archive) live under DATA_DIR/clinics/<id> (see config.data_path). Regional
+analytics fan out to every clinic's worksheet in parallel and merge the
+results. Deployments without CLINIC_ID keep using Sheet1, as before.
+
+Settings:
+    CLINIC_ID: This deployment's clinic (empty for a single-clinic setup)
+    CLINICS:   Clinics of the region, comma-separated; "ID=Worksheet" maps a
+               clinic to a worksheet of another name (default: the ID itself)
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src import config, tracing
+
+# Worksheet of a deployment without a clinic key (the original single sheet)
+DEFAULT_WORKSHEET = "Sheet1"
+
+# Column added to visits merged from several clinics
+CLINIC_COLUMN = "Clinic"
+
+# Shards read at once by a regional query
+MAX_WORKERS = int(config.get_setting("SHARD_WORKERS", 8))
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+class ClinicError(ValueError):
+    """Raised for a malformed clinic ID."""
+
+
+def _check(clinic_id):
+    if clinic_id and not _VALID_ID.match(clinic_id):
+        raise ClinicError(f"invalid clinic ID {clinic_id!r} (letters, digits, '-' and '_' only)")
+    return clinic_id
+
+
+def _mapping():
+    """Configured clinics in order: ID -> worksheet."""
+    value = config.get_setting("CLINICS") or ""
+    entries = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    clinics = {}
+    for entry in entries:
+        clinic_id, _, worksheet = str(entry).partition("=")
+        clinic_id = _check(clinic_id.strip())
+        if clinic_id:
+            clinics[clinic_id] = worksheet.strip() or clinic_id
+    return clinics
+
+
+def current():
+    """This deployment's clinic ID ("" when not sharded)."""
+    return _check(config.clinic_id())
+
+
+def all_clinics():
+    """
+    Clinics covered by regional queries.
+
+    Returns:
+        list: Configured clinic IDs, including this deployment's clinic
+    """
+    clinics = list(_mapping())
+    if current() not in clinics:
+        clinics.insert(0, current())
+    return clinics
+
+
+def worksheet(clinic_id=None):
+    """
+    Worksheet holding a clinic's visits (routing on the clinic key).
+
+    Args:
+        clinic_id: Clinic ID (defaults to this deployment's clinic)
+
+    Returns:
+        str: Worksheet name
+    """
+    clinic_id = current() if clinic_id is None else _check(clinic_id)
+    if not clinic_id:
+        return DEFAULT_WORKSHEET
+    return _mapping().get(clinic_id, clinic_id)
+
+
+def label(clinic_id):
+    """Display name of a clinic ("" is the unsharded default clinic)."""
+    return clinic_id or DEFAULT_WORKSHEET
+
+
+def fan_out(fn, clinic_ids, max_workers=None):
+    """
+    Call fn(clinic_id) for several clinics in parallel.
+
+    A failing shard does not fail the query: its error is returned instead,
+    so regional views can show the clinics that answered.
+
+    Args:
+        fn: Function of one clinic ID (runs on worker threads)
+        clinic_ids: Clinics to query
+        max_workers: Parallel calls (default SHARD_WORKERS or 8)
+
+    Returns:
+        tuple: ({clinic_id: result}, {clinic_id: exception})
+    """
+    clinic_ids = list(dict.fromkeys(clinic_ids))
+    results, errors = {}, {}
+    if not clinic_ids:
+        return results, errors
+    workers = max(1, min(max_workers or MAX_WORKERS, len(clinic_ids)))
+    with tracing.span("shard_fan_out", shards=len(clinic_ids)):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="swasthya-shard") as pool:
+            futures = {clinic_id: pool.submit(fn, clinic_id) for clinic_id in clinic_ids}
+            for clinic_id, future in futures.items():
+                try:
+                    results[clinic_id] = future.result()
+                except Exception as e:
+                    errors[clinic_id] = e
+                    tracing.incr("shard_errors_total", clinic=label(clinic_id))
+    return results, errors
+
+
+def overview(visits):
+    """
+    Per-clinic comparison for regional analytics.
+
+    Args:
+        visits: Merged visits with a Clinic column (see database.get_regional_history)
+
+    Returns:
+        pandas.DataFrame: Visits, patients, mean risk score and share of High Risk visits per clinic
+    """
+    if visits.empty:
+        return pd.DataFrame(columns=["Visits", "Patients", "Mean_Risk_Score", "High_Risk_Pct"])
+    frame = pd.DataFrame({
+        CLINIC_COLUMN: visits[CLINIC_COLUMN].to_numpy(),
+        "Patient_ID": visits["Patient_ID"].to_numpy(),
+        "Risk_Score": pd.to_numeric(visits["Risk_Score"], errors="coerce").to_numpy(),
+        "High_Risk": (visits["Label"] == "High Risk").to_numpy(),
+    })
+    groups = frame.groupby(CLINIC_COLUMN, sort=False)
+    return pd.DataFrame({
+        "Visits": groups.size(),
+        "Patients": groups["Patient_ID"].nunique(),
+        "Mean_Risk_Score": groups["Risk_Score"].mean().round(2),
+        "High_Risk_Pct": (groups["High_Risk"].mean() * 100).round(1),
+    })
@@ -0,0 +1,80 @@
+"""
+Runtime settings shared by the backend modules.
+"""
+
+import os
+import re
+
+
+def get_setting(name, default=None):
+    """
+    Look up a setting in Streamlit secrets, falling back to environment variables.
+
+    Args:
+        name: Setting name (e.g., "GROQ_API_KEY")
+        default: Value returned when the setting is not configured
+
+    Returns:
+        The configured value, or default
+    """
+    try:
+        import streamlit as st
+        value = st.secrets.get(name)
+        if value is not None:
+            return value
+    except Exception:
+        # No secrets.toml (local runs, CLI tools, tests)
+        pass
+    return os.environ.get(name, default)
+
+
+def get_flag(name, default=False):
+    """
+    Look up a boolean setting ("1", "true", "yes", "on" are treated as True).
+
+    Args:
+        name: Setting name
+        default: Value returned when the setting is not configured
+
+    Returns:
+        bool: Parsed flag value
+    """
+    value = get_setting(name)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def clinic_id():
+    """This deployment's clinic (CLINIC_ID setting; "" for a single-clinic setup)."""
+    return str(get_setting("CLINIC_ID") or "").strip()
+
+
+def data_root():
+    """The local data directory shared by all clinics (DATA_DIR, default ./data)."""
+    return get_setting("DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def data_path(*parts):
+    """
+    Build a path under the local data directory, creating parent folders.
+
+    The directory defaults to ./data next to app.py and can be moved with the
+    DATA_DIR setting (e.g., to a persistent volume). A deployment with a
+    CLINIC_ID keeps its files in clinics/<id> below it, so clinics sharing a
+    host never share local stores or snapshots.
+
+    Args:
+        *parts: Path components below the data directory
+
+    Returns:
+        str: Absolute path
+    """
+    root = data_root()
+    if clinic_id():
+        root = os.path.join(root, "clinics", re.sub(r"[^A-Za-z0-9_-]", "_", clinic_id()))
+    path = os.path.join(root, *parts)
+    os.makedirs(os.path.dirname(path) if parts else path, exist_ok=True)
+    return path
@@ -2,8 +2,11 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import hashlib
+import os
 import time
-from functools import wraps
+import threading
+
+from src import config, tracing, resilience, local_store, archive, snapshot, search, summaries, advice_store, clinics, anomaly, sheets
 
 # Try to import Google Sheets connection, with fallback
 HAS_GSHEETS = False
@@ -14,48 +17,103 @@ except ImportError:
     # Google Sheets connection not available - app will work in fallback mode
     pass
 
+# Columns of the patient sheet, in sheet order
+SHEET_COLUMNS = ["Date", "Patient_ID", "Name", "Age", "Gender", "Weight", "Height",
+                 "BMI", "Sugar", "BP", "Risk_Score", "Label", "Phone", "Followup_Date", "Advice",
+                 "Rule_Version", "Bedtime", "Waketime", "Sleep_Hours", "Chronotype"]
+
+# Columns set by scoring (rewritten by the re-score backfill)
+SCORE_COLUMNS = ["Risk_Score", "Label", "Rule_Version"]
+
+# Fresh reads update_scores makes before giving up on a sheet that keeps changing
+UPDATE_ATTEMPTS = 3
+
+# Worksheet sharing advice texts between devices: reference -> compressed text (base64)
+ADVICE_WORKSHEET = "Advice"
+ADVICE_COLUMNS = ["Hash", "Body"]
+
+# Seconds before the shared history snapshot is refreshed from Google Sheets
+SNAPSHOT_TTL = float(config.get_setting("SNAPSHOT_TTL", 600))
+
+# Last successfully read sheet, shared by all sessions in this process
+_last_good_history = None
+
+# Bumped whenever this process writes the sheet outside a user session (the
+# reconciler), so session caches taken before that write are not reused
+_sheet_version = 0
+
+_sync_lock = threading.Lock()
+_reconciler = None
+
+# Google Sheets connection shared by every session and background thread
+_conn = None
+_conn_lock = threading.Lock()
+
+# Patient search index for this process, and the history state it was built from
+_search_index = None
+_search_key = None
+_search_lock = threading.Lock()
+
+class OfflineError(RuntimeError):
+    """Raised when no Google Sheets connection is configured or available."""
+
+class SheetChangedError(RuntimeError):
+    """Raised when the sheet keeps changing under a whole-sheet rewrite."""
+
+def empty_history():
+    """Return an empty DataFrame with the patient sheet columns."""
+    return pd.DataFrame(columns=SHEET_COLUMNS)
+
+def _store():
+    """On-device visit store (see local_store.py)."""
+    return local_store.get_store(SHEET_COLUMNS)
+
+def _advice():
+    """Content-addressed advice texts (see advice_store.py)."""
+    return advice_store.get_store()
+
+def _summaries():
+    """Per-patient summary table (see summaries.py)."""
+    return summaries.get_store()
+
+def _baselines():
+    """Per-patient vital baselines (see anomaly.py)."""
+    return anomaly.get_store()
+
 # Exponential backoff retry decorator
-def retry_with_backoff(retries=3, backoff_in_seconds=1):
+def retry_with_backoff(retries=3, backoff_in_seconds=1, backend="sheets"):
     """
-    Retry a function with exponential backoff.
+    Retry a function with jittered exponential backoff behind a circuit breaker.
     
     Args:
         retries: Number of retry attempts
         backoff_in_seconds: Initial backoff time in seconds
+        backend: Circuit breaker / metrics name for the called service
     """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            x = 0
-            while True:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    error_str = str(e)
-                    # Check if it's a rate limit error
-                    if 'RESOURCE_EXHAUSTED' in error_str or 'RATE_LIMIT_EXCEEDED' in error_str or '429' in error_str:
-                        if x == retries:
-                            # Use cached data if available
-                            if 'get_history' in func.__name__:
-                                return pd.DataFrame(columns=["Date", "Patient_ID", "Name", "Age", "Gender", "Weight", "Height", 
-                                                             "BMI", "Sugar", "BP", "Risk_Score", "Label", "Phone", "Followup_Date", "Advice"])
-                            raise e
-                        wait = backoff_in_seconds * 2 ** x
-                        time.sleep(wait)
-                        x += 1
-                    else:
-                        raise e
-        return wrapper
-    return decorator
-
-# Initialize Connection
+    return resilience.resilient(backend, retries=retries, base_delay=backoff_in_seconds)
+
 def get_conn():
-    if HAS_GSHEETS:
-        try:
-            return st.connection("gsheets", type=GSheetsConnection)
-        except Exception:
-            return None
-    return None
+    """
+    Process-wide Google Sheets connection, created on first use.
+    
+    Sessions, the reconciler and the scheduler share it (and its pooled HTTP
+    session); a failed attempt is not remembered, so the next call retries.
+    
+    Returns:
+        GSheetsConnection or None if unavailable
+    """
+    global _conn
+    if _conn is not None or not HAS_GSHEETS:
+        return _conn
+    with _conn_lock:
+        if _conn is None:
+            try:
+                conn = st.connection("gsheets", type=GSheetsConnection)
+            except Exception:
+                return None
+            sheets.pool(conn)
+            _conn = conn
+    return _conn
 
 def init_db():
     """Initialize database connection and session state for caching"""
@@ -64,63 +122,411 @@ def init_db():
         st.session_state.db_cache = None
     if 'db_cache_time' not in st.session_state:
         st.session_state.db_cache_time = 0
-    if 'pending_writes' not in st.session_state:
-        st.session_state.pending_writes = []
 
-@st.cache_data(ttl=600)  # Cache for 10 minutes (increased from 5)
-@retry_with_backoff(retries=3, backoff_in_seconds=2)
-def get_history():
+def _sheet_frame(df):
+    """Drop blank rows and align to SHEET_COLUMNS (older sheets lack Rule_Version)."""
+    return df.dropna(how="all").reindex(columns=SHEET_COLUMNS)
+
+@retry_with_backoff(retries=2, backoff_in_seconds=0.5)
+def _fetch_sheet(fresh=False):
+    """
+    Read this clinic's patient sheet. Errors propagate so failures are never cached.
+    
+    Concurrent callers share one read and one round of local bookkeeping.
+    
+    Args:
+        fresh: Bypass the connection's own 10-minute cache (scheduled refreshes)
+    """
+    conn = get_conn()
+    if conn is None:
+        raise OfflineError("Google Sheets connection not available")
+    worksheet = clinics.worksheet()
+    key = ("sheet", id(conn), worksheet, fresh, sheets.generation(worksheet))
+    return sheets.coalesce(key, lambda: _load_sheet(conn, worksheet, fresh))
+
+def _load_sheet(conn, worksheet, fresh):
+    with tracing.span("sheet_read"):
+        df = sheets.read(conn, worksheet, ttl=0 if fresh else 600)  # Increased cache TTL to 10 minutes
+    df = _sheet_frame(df)
+    # Keep a copy on this device so history (and trend prediction) works offline
+    try:
+        _store().mirror(df)
+    except Exception:
+        tracing.incr("local_store_errors_total")
+    # The sheet lacks archived visits, so only patients summarized from full history are updated
+    try:
+        _summaries().update(df, known_only=True)
+    except Exception:
+        tracing.incr("summary_errors_total")
+    try:
+        _baselines().update(df, known_only=True)
+    except Exception:
+        tracing.incr("baseline_errors_total")
+    return df
+
+@st.cache_data(ttl=600, show_spinner=False)  # Cache for 10 minutes (increased from 5)
+def _read_sheet():
+    """Per-process cached sheet read, used when snapshots are unavailable."""
+    # This cache already holds the sheet for 10 minutes; a second one in the
+    # connection would hand back an older copy after clear() or a refresh
+    return _fetch_sheet(fresh=True)
+
+def _publish(df):
     """
-    Fetch all patient records from Google Sheet with enhanced caching and retry logic.
+    Share the latest sheet contents with every app process on this host.
     
     Returns:
-        pandas.DataFrame: DataFrame containing all patient records, or empty DataFrame if error occurs.
+        pandas.DataFrame: The memory-mapped snapshot (or df itself without pyarrow)
     """
-    # Check session state cache first (in-memory cache)
+    global _last_good_history
+    try:
+        df = snapshot.publish(df, SHEET_COLUMNS)
+    except Exception:
+        tracing.incr("snapshot_errors_total")
+    _last_good_history = df
+    return df
+
+def _with_pending(df):
+    """Append visits saved on this device that have not reached the sheet yet."""
+    try:
+        pending = _store().pending()
+        if pending.empty:
+            return df
+        new_rows, _, _ = local_store.classify_pending(pending, df)
+    except Exception:
+        tracing.incr("local_store_errors_total")
+        return df
+    if new_rows.empty:
+        return df
+    return pd.concat([df, new_rows], ignore_index=True)
+
+def _sheet_history():
+    """
+    Current sheet contents from the session cache or a (cached) sheet read.
+    
+    Raises:
+        Exception: Whatever the sheet read raises when no fresh session copy exists
+    """
+    global _last_good_history
     current_time = time.time()
-    if st.session_state.get('db_cache') is not None:
+    
+    # Shared snapshot: all sessions and processes read one mapped copy
+    if snapshot.HAS_PYARROW:
+        df = snapshot.load(max_age=SNAPSHOT_TTL)
+        if df is None:
+            # Sessions missing the snapshot together publish one new generation
+            worksheet = clinics.worksheet()
+            df = sheets.coalesce(("snapshot", worksheet, sheets.generation(worksheet)), lambda: _publish(_fetch_sheet()))
+        st.session_state.db_cache = df
+        st.session_state.db_cache_time = current_time
+        st.session_state.db_cache_version = _sheet_version
+        _last_good_history = df
+        return df
+    
+    # Check session state cache first (in-memory cache)
+    if st.session_state.get('db_cache') is not None and st.session_state.get('db_cache_version') == _sheet_version:
         cache_age = current_time - st.session_state.get('db_cache_time', 0)
         # Use session cache if less than 5 minutes old
         if cache_age < 300:
             return st.session_state.db_cache
     
+    df = _read_sheet()
+    
+    # Update session state cache
+    st.session_state.db_cache = df
+    st.session_state.db_cache_time = current_time
+    st.session_state.db_cache_version = _sheet_version
+    _last_good_history = df
+    return df
+
+def _hot_history():
+    """
+    Fetch the records currently in Google Sheet with enhanced caching and retry logic.
+    
+    When Sheets is throttled (or its circuit breaker is open) the last good copy
+    is served immediately instead of waiting on retries. Without a connection,
+    the visits stored on this device are returned. Visits saved offline and not
+    yet synced are always included.
+    
+    Returns:
+        pandas.DataFrame: DataFrame containing all patient records, or empty DataFrame if error occurs.
+    """
     try:
+        df = _sheet_history()
+    except Exception as e:
+        cached = st.session_state.get('db_cache')
+        if cached is None:
+            cached = _last_good_history
+        if cached is None:
+            # Published by this or another process, however old
+            cached = snapshot.load()
+        if cached is not None:
+            # If rate limited and we have cached data, use it
+            if resilience.is_rate_limited(e):
+                st.info("ℹ️ Using cached data due to rate limits. Data may be slightly outdated.")
+            return _with_pending(cached)
+        # Offline (or failing backend): serve the visits stored on this device
+        try:
+            return _store().history()
+        except Exception:
+            return empty_history()
+    return _with_pending(df)
+
+@st.cache_data(ttl=600, max_entries=8, show_spinner=False)
+def _read_archive(start_date, end_date, version):
+    """Archived visits in a date range (version invalidates after rotation)."""
+    return archive.read_range(SHEET_COLUMNS, start_date, end_date)
+
+def _merge_archive(archived, hot):
+    """Combine archived and hot visits, dropping rows present in both."""
+    if archived is None or archived.empty:
+        return hot
+    if hot.empty:
+        return archived
+    merged = pd.concat([archived, hot], ignore_index=True)
+    return merged.drop_duplicates(subset=["Patient_ID", "Date"], keep="last")
+
+def _filter_dates(df, start_date, end_date):
+    if df.empty or (start_date is None and end_date is None):
+        return df
+    dates = pd.to_datetime(df["Date"], errors="coerce")
+    mask = pd.Series(True, index=df.index)
+    if start_date is not None:
+        mask &= dates >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= dates <= pd.Timestamp(end_date)
+    return df[mask]
+
+def get_history(start_date=None, end_date=None):
+    """
+    Fetch patient records, merging the hot sheet with archived partitions.
+    
+    Args:
+        start_date: Earliest visit date to include (None = no lower bound)
+        end_date: Latest visit date to include (None = no upper bound)
+    
+    Returns:
+        pandas.DataFrame: DataFrame containing matching patient records, or empty DataFrame if error occurs.
+    """
+    hot = _filter_dates(_hot_history(), start_date, end_date)
+    if not archive.HAS_PYARROW:
+        return hot
+    archived = _read_archive(
+        str(start_date) if start_date is not None else None,
+        str(end_date) if end_date is not None else None,
+        archive.version()
+    )
+    return _merge_archive(archived, hot)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _read_clinic_sheet(worksheet, _conn):
+    """Another clinic's worksheet (cached per worksheet); never mirrored on this device."""
+    with tracing.span("sheet_read", worksheet=worksheet):
+        df = resilience.call_with_retry(lambda: sheets.read(_conn, worksheet, ttl=600), "sheets", retries=1)
+    return _sheet_frame(df)
+
+def get_regional_history(clinic_ids=None, start_date=None, end_date=None):
+    """
+    Visits of several clinics for regional analytics.
+    
+    This deployment's clinic comes from get_history (hot, pending and archived
+    visits); the other clinics' worksheets are read in parallel and merged.
+    
+    Args:
+        clinic_ids: Clinics to include (default: all configured clinics)
+        start_date: Earliest visit date to include (None = no lower bound)
+        end_date: Latest visit date to include (None = no upper bound)
+    
+    Returns:
+        tuple: (DataFrame of visits with a Clinic column, list of clinic IDs that could not be read)
+    """
+    clinic_ids = clinics.all_clinics() if clinic_ids is None else list(dict.fromkeys(clinic_ids))
+    own = clinics.current()
+    frames, failed = {}, []
+    if own in clinic_ids:
+        frames[own] = get_history(start_date, end_date)
+    others = [c for c in clinic_ids if c != own]
+    if others:
         conn = get_conn()
         if conn is None:
-            return pd.DataFrame(columns=["Date", "Patient_ID", "Name", "Age", "Gender", "Weight", "Height", 
-                                         "BMI", "Sugar", "BP", "Risk_Score", "Label", "Phone", "Followup_Date", "Advice"])
-        df = conn.read(worksheet="Sheet1", usecols=list(range(15)), ttl=600)  # Increased cache TTL to 10 minutes
-        df = df.dropna(how="all")
-        
-        # Update session state cache
-        st.session_state.db_cache = df
-        st.session_state.db_cache_time = current_time
-        
-        return df
-    except Exception as e:
-        error_str = str(e)
-        # If rate limited and we have cached data, use it
-        if st.session_state.get('db_cache') is not None and ('RESOURCE_EXHAUSTED' in error_str or 'RATE_LIMIT' in error_str):
-            st.info("ℹ️ Using cached data due to rate limits. Data may be slightly outdated.")
-            return st.session_state.db_cache
-        # Log error but don't crash the app
-        return pd.DataFrame(columns=["Date", "Patient_ID", "Name", "Age", "Gender", "Weight", "Height", 
-                                     "BMI", "Sugar", "BP", "Risk_Score", "Label", "Phone", "Followup_Date", "Advice"])
+            failed = others
+        else:
+            results, errors = clinics.fan_out(
+                lambda c: _filter_dates(_read_clinic_sheet(clinics.worksheet(c), conn), start_date, end_date), others
+            )
+            frames.update(results)
+            failed = [c for c in others if c in errors]
+    parts = [frames[c].assign(**{clinics.CLINIC_COLUMN: clinics.label(c)}) for c in clinic_ids if c in frames]
+    if not parts:
+        return empty_history().assign(**{clinics.CLINIC_COLUMN: ""}), failed
+    return pd.concat(parts, ignore_index=True), failed
 
 def get_patient_history(patient_id):
     """
     Get history for a specific patient by Patient ID.
     
+    Archived visits are included via partition pruning, without loading the
+    whole archive.
+    
     Args:
         patient_id: Unique patient identifier
     
     Returns:
         pandas.DataFrame: Patient's historical records
     """
-    df = get_history()
-    if df.empty or 'Patient_ID' not in df.columns:
+    df = _hot_history()
+    if 'Patient_ID' not in df.columns:
+        return pd.DataFrame()
+    with tracing.span("patient_filter", rows=len(df)):
+        patient_df = df[df['Patient_ID'] == patient_id]
+    if archive.HAS_PYARROW:
+        patient_df = _merge_archive(archive.read_patient(patient_id, SHEET_COLUMNS), patient_df)
+    if patient_df.empty:
         return pd.DataFrame()
-    return df[df['Patient_ID'] == patient_id].sort_values('Date')
+    return patient_df.sort_values('Date')
+
+def get_patient_summary(patient_id):
+    """
+    Pre-aggregated summary of a patient: visit count, running min/mean/max of
+    each vital, the last visits and the next-visit forecast.
+    
+    Read from the summary table in one lookup; a patient seen for the first
+    time is summarized from the full history (hot and archived) once.
+    
+    Args:
+        patient_id: Unique patient identifier
+    
+    Returns:
+        dict: See summaries.SummaryStore.get; None if the patient has no visits
+    """
+    try:
+        store = _summaries()
+        summary = store.get(patient_id)
+    except Exception:
+        # Summary table unavailable: summarize in memory for this request
+        tracing.incr("summary_errors_total")
+        store, summary = summaries.SummaryStore(":memory:"), None
+    if summary is None:
+        history = get_patient_history(patient_id)
+        if history.empty:
+            return None
+        with tracing.span("summary_seed", rows=len(history)):
+            store.update(history)
+        summary = store.get(patient_id)
+    return summary
+
+def get_vital_baseline(patient_id):
+    """
+    The patient's own running baseline (EWMA mean and spread) of sugar, BP and BMI.
+    
+    Read in one lookup; a patient seen for the first time is replayed from
+    the full history (hot and archived) once.
+    
+    Args:
+        patient_id: Unique patient identifier
+    
+    Returns:
+        dict: See anomaly.BaselineStore.get; None if the patient has no visits
+    """
+    try:
+        store = _baselines()
+        baseline = store.get(patient_id)
+    except Exception:
+        tracing.incr("baseline_errors_total")
+        store, baseline = anomaly.BaselineStore(":memory:"), None
+    if baseline is None:
+        history = get_patient_history(patient_id)
+        if history.empty:
+            return None
+        with tracing.span("baseline_seed", rows=len(history)):
+            store.update(history)
+        baseline = store.get(patient_id)
+    return baseline
+
+def _history_key():
+    """Changes when any process publishes new history or visits are archived."""
+    return (snapshot.generation() if snapshot.HAS_PYARROW else _sheet_version, archive.version())
+
+def get_search_index(history=None):
+    """
+    Patient search index over hot and archived visits.
+    
+    Built on first use and rebuilt when another process publishes new history;
+    visits saved by this process are added in place by add_record.
+    
+    Args:
+        history: Visits to build from if a rebuild is needed (default get_history())
+    
+    Returns:
+        search.PatientIndex
+    """
+    global _search_index, _search_key
+    with _search_lock:
+        if _search_index is None or _search_key != _history_key():
+            history = get_history() if history is None else history
+            with tracing.span("search_index_build", rows=len(history)):
+                _search_index = search.PatientIndex(history)
+            _search_key = _history_key()
+        return _search_index
+
+def _background_history():
+    """Hot and archived visits for background jobs, which have no session state."""
+    hot = _last_good_history
+    if hot is None:
+        hot = _store().history()
+    hot = _with_pending(hot)
+    if not archive.HAS_PYARROW:
+        return hot
+    return _merge_archive(_read_archive(None, None, archive.version()), hot)
+
+def refresh_history():
+    """
+    Re-read this clinic's sheet ahead of cache expiry and rebuild the search
+    index, so sessions find warm data (run by the background scheduler).
+    
+    With snapshots, a new generation is published for every process on the
+    host; otherwise this process's sheet cache is replaced and session copies
+    taken before the refresh are dropped.
+    
+    Returns:
+        dict: Visits in the sheet and patients in the search index
+    
+    Raises:
+        OfflineError: If no Google Sheets connection is available
+    """
+    global _sheet_version, _last_good_history
+    if snapshot.HAS_PYARROW:
+        df = _publish(_fetch_sheet(fresh=True))
+    else:
+        _read_sheet.clear()
+        df = _read_sheet()
+        _last_good_history = df
+        _sheet_version += 1
+    index = get_search_index(_background_history())
+    return {"visits": len(df), "indexed_patients": len(index)}
+
+def refresh_summaries():
+    """
+    Fold the full history (hot and archived) into every patient's summary,
+    forecast and vital baseline, so first lookups need no history scan
+    (nightly job; patients already up to date are skipped).
+    
+    Returns:
+        dict: Visits scanned and patient summaries written
+    """
+    history = _background_history()
+    with tracing.span("summary_refresh", rows=len(history)):
+        updated = _summaries().update(history)
+        _baselines().update(history)
+    return {"visits": len(history), "summaries_updated": updated}
+
+def _index_visit(new_row):
+    """Add a saved visit to the search index without rebuilding it."""
+    global _search_key
+    with _search_lock:
+        if _search_index is not None:
+            _search_index.add(new_row)
+            _search_key = _history_key()
 
 def generate_patient_id(name, phone):
     """
@@ -152,20 +558,382 @@ def generate_patient_id(name, phone):
     
     return f"{name_part}{phone_part}-{year}"
 
+def _read_fresh(conn):
+    """This clinic's sheet read directly (bypassing caches), e.g. right before a write."""
+    return _sheet_frame(resilience.call_with_retry(
+        lambda: sheets.read(conn, clinics.worksheet(), ttl=0), "sheets", retries=1
+    ))
+
+def _push_pending(conn, sheet_df, extra_rows=None):
+    """
+    Upload visits waiting on this device to the sheet in one batch write.
+    
+    Pending visits whose (Patient_ID, Date) already exist in the sheet are marked
+    synced when identical and conflict when they differ; the rest are appended.
+    
+    Args:
+        conn: Google Sheets connection
+        sheet_df: Current sheet contents
+        extra_rows: Rows to append that could not be stored locally
+    
+    Returns:
+        pandas.DataFrame: Sheet contents after the write
+    """
+    with _sync_lock:
+        store = _store()
+        new_rows, synced, conflicts = local_store.classify_pending(store.pending(), sheet_df)
+        if conflicts:
+            store.mark(conflicts, local_store.CONFLICT)
+        if synced:
+            store.mark(synced, local_store.SYNCED)
+        if extra_rows is not None:
+            new_rows = pd.concat([new_rows, extra_rows], ignore_index=True)
+        if new_rows.empty:
+            return sheet_df
+        
+        updated_df = pd.concat([sheet_df, new_rows], ignore_index=True)
+        with tracing.span("sheet_write", rows=len(updated_df)):
+            resilience.call_with_retry(
+                lambda: sheets.write(conn, clinics.worksheet(), updated_df),
+                "sheets", retries=1
+            )
+        store.mark(zip(new_rows["Patient_ID"], new_rows["Date"]), local_store.SYNCED)
+        return updated_df
+
+def _advice_frame(df):
+    return df.dropna(how="all").reindex(columns=ADVICE_COLUMNS)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _read_advice_sheet():
+    """Shared advice blobs (cached); only read when a reference is missing on this device."""
+    conn = get_conn()
+    if conn is None:
+        raise OfflineError("Google Sheets connection not available")
+    with tracing.span("advice_read"):
+        return _advice_frame(sheets.read(conn, ADVICE_WORKSHEET, ttl=600))
+
+def _push_advice(conn, prefetched=None):
+    """
+    Upload advice texts saved on this device to the shared Advice worksheet.
+    
+    Runs from the reconciler, so the advice of many visits goes out in one write.
+    
+    Args:
+        conn: Google Sheets connection
+        prefetched: Advice worksheet as just read, if the caller has it
+    
+    Returns:
+        int: Number of new texts written to the worksheet
+    """
+    blobs = _advice().pending()
+    if not blobs:
+        return 0
+    try:
+        if prefetched is None:
+            prefetched = resilience.call_with_retry(
+                lambda: sheets.read(conn, ADVICE_WORKSHEET, ttl=0), "sheets", retries=1
+            )
+        shared = _advice_frame(prefetched)
+    except Exception:
+        shared = None  # No Advice worksheet yet
+    known = set(shared["Hash"]) if shared is not None else set()
+    new_blobs = pd.DataFrame([b for b in blobs if b[0] not in known], columns=ADVICE_COLUMNS)
+    if not new_blobs.empty:
+        with tracing.span("advice_write", rows=len(new_blobs)):
+            if shared is None:
+                resilience.call_with_retry(
+                    lambda: sheets.write(conn, ADVICE_WORKSHEET, new_blobs, create=True), "sheets", retries=1
+                )
+            else:
+                updated = pd.concat([shared, new_blobs], ignore_index=True)
+                resilience.call_with_retry(
+                    lambda: sheets.write(conn, ADVICE_WORKSHEET, updated), "sheets", retries=1
+                )
+        _read_advice_sheet.clear()
+    _advice().mark_uploaded([key for key, _ in blobs])
+    return len(new_blobs)
+
+def get_advice(value):
+    """
+    Full advice text for a stored Advice value.
+    
+    References are resolved from this device first, then from the shared
+    Advice worksheet; rows saved before advice was stored by reference hold
+    the text itself and are returned unchanged.
+    
+    Args:
+        value: Advice cell of a visit
+    
+    Returns:
+        str: Advice text ("" if unknown or unavailable)
+    """
+    if not advice_store.is_ref(value):
+        return "" if value is None or pd.isna(value) else str(value)
+    try:
+        text = _advice().get(value)
+        if text is None:
+            shared = _read_advice_sheet()
+            _advice().add_shared(shared.itertuples(index=False, name=None))
+            text = _advice().get(value)
+    except Exception:
+        tracing.incr("advice_store_errors_total")
+        text = None
+    return text or ""
+
+def sync_pending():
+    """
+    Upload visits saved while offline (called by the background reconciler).
+    
+    Reads the sheet fresh (bypassing caches) so conflict detection sees rows
+    written by other devices.
+    
+    Returns:
+        dict: Visit counts per sync state after the attempt, or None if offline
+    """
+    global _sheet_version, _last_good_history
+    store = _store()
+    visits_waiting = bool(store.counts().get(local_store.PENDING))
+    advice_waiting = bool(_advice().pending())
+    if not visits_waiting and not advice_waiting:
+        return store.counts()
+    conn = get_conn()
+    if conn is None:
+        return None
+    frames = {}
+    if visits_waiting and advice_waiting:
+        # Both worksheets are needed: read them in parallel (failures are retried below)
+        frames, _ = sheets.read_many(conn, [clinics.worksheet(), ADVICE_WORKSHEET])
+    if visits_waiting:
+        worksheet = clinics.worksheet()
+        sheet_df = _sheet_frame(frames[worksheet]) if worksheet in frames else _read_fresh(conn)
+        updated_df = _push_pending(conn, sheet_df)
+        if updated_df is not sheet_df:
+            _sheet_version += 1
+            _publish(updated_df)
+            _read_sheet.clear()
+    _push_advice(conn, frames.get(ADVICE_WORKSHEET))
+    return store.counts()
+
+def migrate_legacy_store():
+    """
+    Move visits still waiting for upload from the pre-clinic local store.
+    
+    Setting CLINIC_ID moves this device's files from DATA_DIR to
+    DATA_DIR/clinics/<id> and its uploads from Sheet1 to the clinic's
+    worksheet. Pending visits (and advice texts not uploaded yet) left in
+    DATA_DIR/swasthya_local.db are copied to the clinic's store, so they sync
+    to the clinic's worksheet; the old rows are marked moved. Rows already
+    in Sheet1 and visits in conflict stay where they are.
+    
+    Returns:
+        int: Number of visits moved (0 without CLINIC_ID or a legacy store)
+    """
+    legacy_path = os.path.join(config.data_root(), "swasthya_local.db")
+    if not config.clinic_id() or not os.path.exists(legacy_path):
+        return 0
+    legacy = local_store.get_store(SHEET_COLUMNS, legacy_path)
+    pending = legacy.pending()
+    if not pending.empty:
+        _store().add_pending(pending)
+        legacy.mark(zip(pending["Patient_ID"], pending["Date"]), local_store.MOVED)
+    legacy_advice = advice_store.get_store(legacy_path)
+    for key, _ in legacy_advice.pending():
+        text = legacy_advice.get(key)
+        if text:
+            _advice().put(text)
+    if not pending.empty:
+        tracing.incr("legacy_visits_moved_total", len(pending))
+    return len(pending)
+
+def legacy_pending():
+    """Visits still pending in the pre-clinic local store (0 without CLINIC_ID)."""
+    legacy_path = os.path.join(config.data_root(), "swasthya_local.db")
+    if not config.clinic_id() or not os.path.exists(legacy_path):
+        return 0
+    return int(local_store.get_store(SHEET_COLUMNS, legacy_path).counts().get(local_store.PENDING, 0))
+
+def start_reconciler(interval=None):
+    """
+    Start the background thread that syncs offline visits (once per process).
+    
+    Args:
+        interval: Seconds between sync attempts (defaults to SYNC_INTERVAL or 60)
+    """
+    global _reconciler
+    with _sync_lock:
+        if _reconciler is not None and _reconciler.is_alive():
+            return
+        interval = float(interval or config.get_setting("SYNC_INTERVAL", 60))
+        try:
+            migrate_legacy_store()
+        except Exception:
+            tracing.incr("sync_errors_total")
+        
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    sync_pending()
+                except Exception:
+                    tracing.incr("sync_errors_total")
+        
+        _reconciler = threading.Thread(target=loop, name="swasthya-reconciler", daemon=True)
+        _reconciler.start()
+
+def archive_old_records(older_than_days=None):
+    """
+    Move visits older than the hot window from the sheet into the archive.
+    
+    The archive is written first; the sheet is only rewritten after the
+    partitions are safely on disk, and duplicates are dropped on read.
+    
+    Args:
+        older_than_days: Hot window in days (defaults to HOT_WINDOW_DAYS or 365)
+    
+    Returns:
+        int: Number of visits archived
+    """
+    global _sheet_version, _last_good_history
+    if not archive.HAS_PYARROW:
+        return 0
+    conn = get_conn()
+    if conn is None:
+        return 0
+    days = int(older_than_days or config.get_setting("HOT_WINDOW_DAYS", 365))
+    cutoff = pd.Timestamp.now().normalize() - pd.Timedelta(days=days)
+    
+    with _sync_lock:
+        sheet_df = _read_fresh(conn)
+        old = pd.to_datetime(sheet_df["Date"], errors="coerce") < cutoff
+        if not old.any():
+            return 0
+        archived = archive.write(sheet_df[old], SHEET_COLUMNS)
+        hot_df = sheet_df[~old].reset_index(drop=True)
+        with tracing.span("sheet_write", rows=len(hot_df)):
+            resilience.call_with_retry(lambda: sheets.write(conn, clinics.worksheet(), hot_df), "sheets", retries=1)
+        _sheet_version += 1
+        _publish(hot_df)
+        _read_sheet.clear()
+        _store().prune(cutoff.strftime("%Y-%m-%d"))
+    return archived
+
+def read_sheet_fresh():
+    """
+    Current contents of this clinic's sheet, bypassing all caches.
+    
+    Raises:
+        OfflineError: If no Google Sheets connection is available
+    """
+    conn = get_conn()
+    if conn is None:
+        raise OfflineError("Google Sheets connection not available")
+    return _read_fresh(conn)
+
+def update_scores(changes):
+    """
+    Overwrite Risk_Score, Label and Rule_Version of sheet rows (re-score backfill).
+    
+    Google Sheets only offers whole-worksheet writes, so the sheet is read
+    fresh, updated and written back. `_sync_lock` only keeps this process's
+    reconciler out; to narrow the window for other processes (the app's
+    reconciler while the rescore CLI runs), the sheet is read again right
+    before the write, and the update is rebuilt when rows were added or
+    removed meanwhile. A write by another device between that check and the
+    write itself can still be overwritten, so pause data entry during a
+    re-score.
+    
+    Args:
+        changes: pandas.DataFrame with Patient_ID, Date and SCORE_COLUMNS
+    
+    Returns:
+        int: Number of sheet rows updated
+    
+    Raises:
+        OfflineError: If no Google Sheets connection is available
+        SheetChangedError: If the sheet kept changing over UPDATE_ATTEMPTS reads
+    """
+    global _sheet_version
+    if changes.empty:
+        return 0
+    conn = get_conn()
+    if conn is None:
+        raise OfflineError("Google Sheets connection not available")
+    new = changes.set_index([changes["Patient_ID"].astype(str), changes["Date"].astype(str)])
+    new = new[~new.index.duplicated(keep="last")]
+    with _sync_lock:
+        sheet_df = _read_fresh(conn)
+        for _ in range(UPDATE_ATTEMPTS):
+            position = new.index.get_indexer(
+                pd.MultiIndex.from_arrays([sheet_df["Patient_ID"].astype(str), sheet_df["Date"].astype(str)])
+            )
+            hit = position >= 0
+            if not hit.any():
+                return 0
+            updated_df = sheet_df.copy()
+            for column in SCORE_COLUMNS:
+                values = updated_df[column].to_numpy(dtype=object, copy=True)
+                values[hit] = new[column].to_numpy(dtype=object)[position[hit]]
+                updated_df[column] = values
+            latest = _read_fresh(conn)
+            if len(latest) == len(sheet_df):
+                break
+            tracing.incr("rescore_sheet_changed_total")
+            sheet_df = latest
+        else:
+            raise SheetChangedError("The sheet kept changing during the re-score write; rerun to resume")
+        with tracing.span("sheet_write", rows=len(updated_df)):
+            resilience.call_with_retry(
+                lambda: sheets.write(conn, clinics.worksheet(), updated_df), "sheets", retries=1
+            )
+        _sheet_version += 1
+        _publish(updated_df)
+        _read_sheet.clear()
+        try:
+            _store().mirror(updated_df)
+        except Exception:
+            tracing.incr("local_store_errors_total")
+    return int(hit.sum())
+
+def sync_status():
+    """
+    Visit counts per sync state on this device.
+    
+    Returns:
+        dict: e.g. {"synced": 120, "pending": 3, "conflict": 0}
+    """
+    try:
+        return _store().counts()
+    except Exception:
+        return {}
+
+def get_conflicts():
+    """Visits saved on this device that clash with a different sheet row."""
+    return _store().conflicts()
+
+def _blank_if_none(value):
+    """Optional fields (sleep data) are stored as empty cells when not recorded."""
+    return "" if value is None else value
+
+def _advice_ref(text):
+    """Save advice in the content-addressed store; the sheet keeps only its reference."""
+    text = str(text or "")
+    try:
+        return _advice().put(text)
+    except Exception:
+        tracing.incr("advice_store_errors_total")
+        return text[:500]  # Store unavailable: keep a shortened copy inline
+
 def add_record(data):
     """
     Append a new patient record to the Google Sheet using batch write (quota-safe).
     
+    The record is saved on this device first, so it is never lost when the
+    connection is down; the background reconciler uploads it later.
+    
     Args:
         data: Dictionary containing patient information and health metrics
     """
     try:
-        conn = get_conn()
-        
-        if conn is None:
-            st.warning("⚠️ Database connection not available. Record not saved. Please configure Google Sheets connection.")
-            return
-        
         # Generate Patient ID if not provided
         patient_id = data.get('patient_id') or generate_patient_id(
             data.get('name', 'Unknown'),
@@ -188,37 +956,64 @@ def add_record(data):
             "Label": str(data.get('label', 'Unknown')),
             "Phone": str(data.get('phone', '')),
             "Followup_Date": data.get('followup_date', ''),
-            "Advice": str(data.get('advice', ''))[:500]  # Limit length
+            "Advice": _advice_ref(data.get('advice')),
+            "Rule_Version": str(data.get('rule_version', '')),
+            "Bedtime": _blank_if_none(data.get('bedtime')),
+            "Waketime": _blank_if_none(data.get('waketime')),
+            "Sleep_Hours": _blank_if_none(data.get('sleep_hours')),
+            "Chronotype": _blank_if_none(data.get('chronotype'))
         }])
         
+        # Save on this device first so the visit survives connectivity loss
+        stored_locally = True
+        try:
+            _store().add_pending(new_row)
+        except Exception:
+            stored_locally = False
+            tracing.incr("local_store_errors_total")
+        try:
+            _summaries().update(new_row, known_only=True)
+        except Exception:
+            tracing.incr("summary_errors_total")
+        try:
+            _baselines().update(new_row, known_only=True)
+        except Exception:
+            tracing.incr("baseline_errors_total")
+        
+        conn = get_conn()
+        if conn is None:
+            if stored_locally:
+                _index_visit(new_row)
+                st.info("📴 Offline: record saved on this device. It will sync to Google Sheets automatically when the connection returns.")
+            else:
+                st.warning("⚠️ Database connection not available. Record not saved. Please configure Google Sheets connection.")
+            return
+        
         # ✅ QUOTA-SAFE: Use batch update with optimized caching
         try:
             # Use cached data if available to reduce reads
-            if st.session_state.get('db_cache') is not None:
-                cache_age = time.time() - st.session_state.get('db_cache_time', 0)
-                if cache_age < 300:  # Use cache if less than 5 minutes old
-                    existing_data = st.session_state.db_cache
-                else:
-                    existing_data = get_history()
-            else:
-                existing_data = get_history()
-            
-            updated_df = pd.concat([existing_data, new_row], ignore_index=True)
-            conn.update(worksheet="Sheet1", data=updated_df)
+            existing_data = _sheet_history()
+            updated_df = _push_pending(conn, existing_data, None if stored_locally else new_row)
+            if updated_df is not existing_data:
+                updated_df = _publish(updated_df)
             
             # Update session cache with new data instead of clearing
             st.session_state.db_cache = updated_df
             st.session_state.db_cache_time = time.time()
+            st.session_state.db_cache_version = _sheet_version
             
             # Only clear Streamlit cache if successful (not session cache)
             # This prevents excessive API calls
             try:
-                get_history.clear()
+                _read_sheet.clear()
             except:
                 pass  # If cache clear fails, it's not critical
             
+            _index_visit(new_row)
             st.success("✅ Record saved successfully!")
         except Exception as update_error:
+            if stored_locally:
+                _index_visit(new_row)  # Still listed in history as a pending visit
             error_msg = str(update_error)
             if "Public Spreadsheet cannot be written" in error_msg or "Service Account" in error_msg or "cannot be written" in error_msg.lower():
                 st.warning("""
@@ -238,7 +1033,8 @@ def add_record(data):
                 
                 **Note:** The app works normally - all features function. Only data saving is disabled.
                 """)
-            elif 'RESOURCE_EXHAUSTED' in error_msg or 'RATE_LIMIT' in error_msg or '429' in error_msg:
+            elif resilience.is_rate_limited(update_error) and stored_locally:
+                # Queued only if the local store took it; otherwise it falls to the warning below
                 st.warning("""
                 ⚠️ **Rate Limit Temporarily Exceeded**
                 
@@ -253,10 +1049,8 @@ def add_record(data):
                 
                 The app continues to work normally.
                 """)
-                # Store record for later retry
-                if 'pending_writes' not in st.session_state:
-                    st.session_state.pending_writes = []
-                st.session_state.pending_writes.append(new_row)
+            elif stored_locally:
+                st.info(f"📴 Could not reach Google Sheets ({error_msg}). Record saved on this device and will sync automatically.")
             else:
                 st.warning(f"⚠️ Could not save record: {error_msg}. The app continues to work normally.")
     except KeyError as e:
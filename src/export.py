@@ -0,0 +1,300 @@
+"""
+Streaming export of stored visits as CSV, Parquet or FHIR Observation bundles.
+
+Visits are read and written CHUNK_ROWS at a time: archived months one
+Parquet batch at a time, then the visits held on this device (the local
+store mirrors every sheet read and keeps visits not yet uploaded), so an
+export of any size runs in constant memory. The mirror is only as recent as
+the last sheet read, so callers run refresh() first; when the sheet cannot be
+reached the export still runs but misses visits other devices saved since. Advice stored by reference is
+written out as its text in CSV and Parquet. Used by the Patient Records tab
+and from the command line:
+
+    python -m src.export --format csv --start 2024-01-01 --end 2024-12-31 \
+        --label "High Risk" --output high_risk_2024.csv
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from src import advice_store, archive, config, database, local_store, logic, tracing
+
+FORMATS = ("csv", "parquet", "fhir")
+
+# File extension and MIME type per format
+FILE_TYPES = {
+    "csv": (".csv", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "fhir": (".json", "application/fhir+json"),
+}
+
+# Visits read and written per step; bounds the memory used by an export
+CHUNK_ROWS = int(config.get_setting("EXPORT_CHUNK_ROWS", 20_000))
+
+# Visit times are recorded in clinic local time; FHIR dateTimes need an offset
+FHIR_TIMEZONE = config.get_setting("FHIR_TIMEZONE", "+05:30")
+
+LOINC = "http://loinc.org"
+UCUM = "http://unitsofmeasure.org"
+
+# Column -> (LOINC code, display, UCUM unit, observation category)
+FHIR_VITALS = {
+    "Weight": ("29463-7", "Body weight", "kg", "vital-signs"),
+    "Height": ("8302-2", "Body height", "cm", "vital-signs"),
+    "BMI": ("39156-5", "Body mass index (BMI) [Ratio]", "kg/m2", "vital-signs"),
+    "Sugar": ("2339-0", "Glucose [Mass/volume] in Blood", "mg/dL", "laboratory"),
+    "Sleep_Hours": ("93832-4", "Sleep duration", "h", "activity"),
+}
+
+
+class ExportError(ValueError):
+    """Raised for an unknown format or one that needs a missing dependency."""
+
+
+def _matches(df, start=None, end=None, labels=None, patient_ids=None):
+    """Rows of a chunk inside the date range with one of the labels and patients."""
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None or end is not None:
+        dates = pd.to_datetime(df["Date"], errors="coerce")
+        if start is not None:
+            mask &= (dates >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (dates <= pd.Timestamp(end)).to_numpy()
+    if labels:
+        mask &= df["Label"].isin(labels).to_numpy()
+    if patient_ids:
+        mask &= df["Patient_ID"].astype(str).isin(patient_ids).to_numpy()
+    return df[mask]
+
+
+def iter_visits(start=None, end=None, labels=None, patient_ids=None, chunk_rows=None):
+    """
+    Stored visits matching the filters, in chunks (archived months first).
+
+    Args:
+        start: Earliest visit date/time (inclusive) or None
+        end: Latest visit date/time (inclusive) or None
+        labels: Risk levels to keep (e.g., ["High Risk"]) or None for all
+        patient_ids: Patient IDs to keep or None for all
+        chunk_rows: Rows read per step (default CHUNK_ROWS)
+
+    Yields:
+        pandas.DataFrame: Non-empty chunks in sheet format
+    """
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    labels = list(labels) if labels else None
+    patient_ids = {str(p) for p in patient_ids} if patient_ids else None
+    yield from archive.iter_range(database.SHEET_COLUMNS, start, end, labels, patient_ids, chunk_rows)
+    for chunk in local_store.get_store(database.SHEET_COLUMNS).iter_history(chunk_rows):
+        chunk = _matches(chunk, start, end, labels, patient_ids)
+        if not chunk.empty:
+            yield chunk
+
+
+def refresh():
+    """
+    Re-read the sheet into this device's local store before an export.
+
+    Returns:
+        str: Why the sheet could not be read, or None if the mirror is current
+    """
+    try:
+        database.refresh_history()
+        return None
+    except Exception as e:
+        tracing.incr("export_refresh_errors_total")
+        return str(e) or type(e).__name__
+
+
+def _with_advice(chunk):
+    """Replace advice references with their text (database.get_advice), once per distinct reference."""
+    values = chunk["Advice"]
+    refs = values.map(advice_store.is_ref).to_numpy(dtype=bool)
+    if not refs.any():
+        return chunk
+    texts = {ref: database.get_advice(ref) for ref in pd.unique(values[refs])}
+    chunk = chunk.copy()
+    chunk.loc[refs, "Advice"] = values[refs].map(texts)
+    return chunk
+
+
+def _fhir_time(dates):
+    stamps = pd.DatetimeIndex(pd.to_datetime(dates, errors="coerce"))
+    return np.where(stamps.notna(), stamps.strftime("%Y-%m-%dT%H:%M:%S") + FHIR_TIMEZONE, None)
+
+
+def _observation(obs_id, code, subject, when, category):
+    return {
+        "resourceType": "Observation",
+        "id": obs_id,
+        "status": "final",
+        "category": [{"coding": [{"system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                                  "code": category}]}],
+        "code": code,
+        "subject": subject,
+        "effectiveDateTime": when,
+    }
+
+
+def _quantity(value, unit):
+    return {"value": value, "unit": unit, "system": UCUM, "code": unit}
+
+
+def fhir_observations(df):
+    """
+    FHIR R4 Observations for visits: weight, height, BMI, blood glucose, blood
+    pressure (panel with systolic/diastolic components), sleep duration and the
+    SCRS risk score with its level.
+
+    Args:
+        df: Visits in sheet format
+
+    Yields:
+        dict: Observation resources
+    """
+    frame = pd.DataFrame({"pid": df["Patient_ID"].astype(str).to_numpy(),
+                          "name": df["Name"].to_numpy(dtype=object), "when": _fhir_time(df["Date"])})
+    frame["key"] = frame["pid"] + "-" + df["Date"].astype(str).str.replace(r"\D", "", regex=True).to_numpy()
+    for column in ["Risk_Score", *FHIR_VITALS]:
+        frame[column] = pd.to_numeric(df[column], errors="coerce").to_numpy()
+    frame["sys"], frame["dia"] = logic.split_bp(df["BP"].astype(str).to_numpy())
+    frame["label"], frame["version"] = df["Label"].to_numpy(dtype=object), df["Rule_Version"].to_numpy(dtype=object)
+
+    for row in frame.to_dict("records"):
+        if row["when"] is None:
+            continue
+        subject = {"reference": f"Patient/{row['pid']}"}
+        if isinstance(row["name"], str) and row["name"]:
+            subject["display"] = row["name"]
+        for column, (code, display, unit, category) in FHIR_VITALS.items():
+            if row[column] == row[column]:  # not NaN
+                obs = _observation(f"{row['key']}-{code}", {"coding": [{"system": LOINC, "code": code, "display": display}]},
+                                   subject, row["when"], category)
+                obs["valueQuantity"] = _quantity(row[column], unit)
+                yield obs
+        if row["sys"] == row["sys"] and row["dia"] == row["dia"]:
+            obs = _observation(f"{row['key']}-85354-9",
+                               {"coding": [{"system": LOINC, "code": "85354-9", "display": "Blood pressure panel"}]},
+                               subject, row["when"], "vital-signs")
+            obs["component"] = [
+                {"code": {"coding": [{"system": LOINC, "code": "8480-6", "display": "Systolic blood pressure"}]},
+                 "valueQuantity": _quantity(row["sys"], "mm[Hg]")},
+                {"code": {"coding": [{"system": LOINC, "code": "8462-4", "display": "Diastolic blood pressure"}]},
+                 "valueQuantity": _quantity(row["dia"], "mm[Hg]")},
+            ]
+            yield obs
+        if row["Risk_Score"] == row["Risk_Score"]:
+            obs = _observation(f"{row['key']}-scrs", {"text": "Swasthya Composite Risk Score"},
+                               subject, row["when"], "survey")
+            obs["valueInteger"] = int(row["Risk_Score"])
+            if isinstance(row["label"], str) and row["label"]:
+                obs["interpretation"] = [{"text": row["label"]}]
+            if isinstance(row["version"], str) and row["version"]:
+                obs["method"] = {"text": f"Rule set {row['version']}"}
+            yield obs
+
+
+def _write_csv(chunks, out):
+    rows = 0
+    for chunk in chunks:
+        out.write(chunk.to_csv(index=False, header=rows == 0).encode("utf-8"))
+        rows += len(chunk)
+    if rows == 0:
+        out.write((",".join(database.SHEET_COLUMNS) + "\n").encode("utf-8"))
+    return rows
+
+
+def _write_parquet(chunks, out):
+    rows = 0
+    with archive.open_writer(out, database.SHEET_COLUMNS) as writer:
+        for chunk in chunks:
+            writer.write_table(archive.to_table(chunk, database.SHEET_COLUMNS), row_group_size=archive.ROW_GROUP_SIZE)
+            rows += len(chunk)
+    return rows
+
+
+def _write_fhir(chunks, out):
+    # One collection Bundle; entries are appended as they are generated
+    out.write(b'{"resourceType": "Bundle", "type": "collection", "entry": [')
+    rows, parts, separator = 0, [], ""
+    for chunk in chunks:
+        for obs in fhir_observations(chunk):
+            parts.append(separator + '\n{"resource": ' + json.dumps(obs, ensure_ascii=False) + "}")
+            separator = ","
+            if len(parts) == 1000:
+                out.write("".join(parts).encode("utf-8"))
+                parts = []
+        rows += len(chunk)
+    out.write("".join(parts).encode("utf-8"))
+    out.write(b"\n]}\n")
+    return rows
+
+
+def export(fmt, out, start=None, end=None, labels=None, patient_ids=None, chunk_rows=None):
+    """
+    Write stored visits matching the filters to a binary file object.
+
+    Args:
+        fmt: "csv", "parquet" or "fhir" (a FHIR R4 collection Bundle of Observations)
+        out: Writable binary file object
+        start, end, labels, patient_ids, chunk_rows: See iter_visits
+
+    Returns:
+        int: Number of visits exported
+    """
+    writers = {"csv": _write_csv, "parquet": _write_parquet, "fhir": _write_fhir}
+    if fmt not in writers:
+        raise ExportError(f"unknown export format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    if fmt == "parquet" and not archive.HAS_PYARROW:
+        raise ExportError("install pyarrow to export Parquet")
+    chunks = iter_visits(start, end, labels, patient_ids, chunk_rows)
+    if fmt != "fhir":
+        chunks = (_with_advice(chunk) for chunk in chunks)
+    with tracing.span("export", format=fmt):
+        rows = writers[fmt](chunks, out)
+    tracing.incr("export_rows_total", rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export patient visits (sheet, local store and archive).")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--output", "-o", help="output file (default: stdout, not for parquet)")
+    parser.add_argument("--start", help="earliest visit date, e.g. 2024-01-01")
+    parser.add_argument("--end", help="latest visit date (whole day included)")
+    parser.add_argument("--label", action="append", help="risk level to keep, e.g. 'High Risk' (repeatable)")
+    parser.add_argument("--patient", action="append", help="Patient ID to keep (repeatable)")
+    parser.add_argument("--patients-file", help="file with one Patient ID per line")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="visits per chunk")
+    args = parser.parse_args(argv)
+
+    patient_ids = list(args.patient or [])
+    if args.patients_file:
+        with open(args.patients_file, encoding="utf-8") as f:
+            patient_ids += [line.strip() for line in f if line.strip()]
+    end = f"{args.end} 23:59" if args.end and len(args.end) == 10 else args.end
+    if args.output is None and args.format == "parquet":
+        parser.error("--output is required for parquet")
+
+    error = refresh()
+    if error:
+        print(f"Warning: could not read the patient sheet ({error}); exporting the visits last "
+              "synced to this device, so newer visits from other devices may be missing", file=sys.stderr)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        rows = export(args.format, out, args.start, end, args.label, patient_ids or None, args.chunk_rows)
+    except ExportError as e:
+        parser.error(str(e))
+    finally:
+        if args.output:
+            out.close()
+    print(f"Exported {rows} visits", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
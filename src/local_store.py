@@ -0,0 +1,264 @@
+"""
+Durable on-device store for patient visits (SQLite).
+
+Every visit is written here first, so screening camps keep working without
+connectivity. Rows carry a sync_state:
+    pending  -> saved locally, not yet in Google Sheets
+    synced   -> present in Google Sheets (mirrored on each sheet read)
+    conflict -> the sheet already holds a different visit with the same
+                Patient_ID and Date; kept locally for manual review
+    moved    -> handed to a clinic's own store when CLINIC_ID was set on
+                this device (see database.migrate_legacy_store)
+"""
+
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src import config
+
+PENDING, SYNCED, CONFLICT, MOVED = "pending", "synced", "conflict", "moved"
+
+# Columns compared when a pending visit meets a sheet row with the same key
+COMPARE_COLUMNS = ["Age", "Weight", "Height", "BMI", "Sugar", "BP", "Risk_Score"]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _py(value):
+    """Convert numpy/pandas scalars to values sqlite3 can bind."""
+    if value is None:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d %H:%M")
+    return value
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class LocalStore:
+    """
+    SQLite table of visits keyed on (Patient_ID, Date).
+
+    Args:
+        path: Database file path
+        columns: Visit columns in sheet order; missing columns are added on open
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        # WAL lets several app processes on one host read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+
+    def _migrate(self):
+        with self._lock, self._conn:
+            column_defs = ", ".join(_quote(c) for c in self.columns)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS visits ({column_defs}, sync_state TEXT NOT NULL DEFAULT 'synced', "
+                f"updated_at REAL, PRIMARY KEY (Patient_ID, Date))"
+            )
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(visits)")}
+            for column in self.columns:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE visits ADD COLUMN {_quote(column)}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_visits_state ON visits(sync_state)")
+
+    def _rows(self, df):
+        frame = df.reindex(columns=self.columns)
+        return [[_py(v) for v in row] for row in frame.itertuples(index=False, name=None)]
+
+    def add_pending(self, df):
+        """
+        Save new visits locally, awaiting upload.
+
+        Args:
+            df: DataFrame of visits in sheet format
+        """
+        names = ", ".join(_quote(c) for c in self.columns)
+        marks = ", ".join("?" for _ in self.columns)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO visits ({names}, sync_state, updated_at) VALUES ({marks}, ?, ?)",
+                [row + [PENDING, now] for row in self._rows(df)],
+            )
+
+    def mirror(self, df):
+        """
+        Copy rows read from the sheet so history stays available offline.
+
+        Rows that are still pending or in conflict locally are left untouched.
+
+        Args:
+            df: DataFrame read from Google Sheets
+        """
+        if df is None or df.empty:
+            return
+        names = ", ".join(_quote(c) for c in self.columns)
+        marks = ", ".join("?" for _ in self.columns)
+        updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in self.columns)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO visits ({names}, sync_state, updated_at) VALUES ({marks}, '{SYNCED}', ?) "
+                f"ON CONFLICT(Patient_ID, Date) DO UPDATE SET {updates}, updated_at = excluded.updated_at "
+                f"WHERE visits.sync_state = '{SYNCED}'",
+                [row + [now] for row in self._rows(df.dropna(subset=["Patient_ID", "Date"]))],
+            )
+
+    def mark(self, keys, state):
+        """
+        Set the sync state of visits.
+
+        Args:
+            keys: Iterable of (Patient_ID, Date) tuples
+            state: PENDING, SYNCED or CONFLICT
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE visits SET sync_state = ?, updated_at = ? WHERE Patient_ID = ? AND Date = ?",
+                [(state, now, _py(pid), _py(date)) for pid, date in keys],
+            )
+
+    def prune(self, before_date):
+        """
+        Drop synced visits older than a date (they live in the archive now).
+
+        Args:
+            before_date: "YYYY-MM-DD" string; visits with an earlier Date are removed
+
+        Returns:
+            int: Rows deleted
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM visits WHERE sync_state = ? AND Date < ?", (SYNCED, str(before_date))
+            )
+        return cursor.rowcount
+
+    def _query(self, where="", params=()):
+        names = ", ".join(_quote(c) for c in self.columns)
+        with self._lock:
+            df = pd.read_sql_query(f"SELECT {names} FROM visits {where} ORDER BY Date", self._conn, params=params)
+        return df
+
+    def history(self):
+        """All visits known on this device (synced and pending), ordered by Date."""
+        return self._query(f"WHERE sync_state != '{CONFLICT}'")
+
+    def iter_history(self, chunk_rows):
+        """
+        All visits known on this device in chunks, ordered by Date.
+
+        Reads on its own connection (WAL), so writers are never blocked while
+        a long export is consumed.
+
+        Args:
+            chunk_rows: Rows per DataFrame
+
+        Yields:
+            pandas.DataFrame: Up to chunk_rows visits
+        """
+        names = ", ".join(_quote(c) for c in self.columns)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            yield from pd.read_sql_query(f"SELECT {names} FROM visits WHERE sync_state != '{CONFLICT}' ORDER BY Date",
+                                         conn, chunksize=chunk_rows)
+        finally:
+            conn.close()
+
+    def patient_history(self, patient_id):
+        """Visits of one patient, ordered by Date."""
+        return self._query(f"WHERE Patient_ID = ? AND sync_state != '{CONFLICT}'", (patient_id,))
+
+    def pending(self):
+        """Visits saved locally that are not yet in Google Sheets."""
+        return self._query("WHERE sync_state = ?", (PENDING,))
+
+    def conflicts(self):
+        """Visits whose key clashes with a different row in Google Sheets."""
+        return self._query("WHERE sync_state = ?", (CONFLICT,))
+
+    def counts(self):
+        """Number of visits per sync state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT sync_state, COUNT(*) FROM visits GROUP BY sync_state").fetchall()
+        return {state: count for state, count in rows}
+
+
+def get_store(columns, path=None):
+    """
+    Return the process-wide LocalStore for a database file.
+
+    Args:
+        columns: Visit columns in sheet order
+        path: Database file (defaults to DATA_DIR/swasthya_local.db)
+
+    Returns:
+        LocalStore
+    """
+    path = path or config.data_path("swasthya_local.db")
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = LocalStore(path, columns)
+    return store
+
+
+def classify_pending(pending_df, sheet_df):
+    """
+    Split pending visits against the current sheet contents.
+
+    Args:
+        pending_df: Visits awaiting upload
+        sheet_df: Current Google Sheets data
+
+    Returns:
+        tuple: (new_rows DataFrame, already_synced keys, conflict keys)
+    """
+    if pending_df.empty:
+        return pending_df, [], []
+    if sheet_df is None or sheet_df.empty:
+        return pending_df, [], []
+
+    sheet = sheet_df.dropna(subset=["Patient_ID", "Date"]).drop_duplicates(["Patient_ID", "Date"], keep="last")
+    sheet = sheet.set_index(["Patient_ID", "Date"])
+    keys = list(zip(pending_df["Patient_ID"], pending_df["Date"]))
+    in_sheet = pd.Series([key in sheet.index for key in keys], index=pending_df.index)
+
+    synced, conflicts = [], []
+    for idx in pending_df.index[in_sheet.values]:
+        key = (pending_df.at[idx, "Patient_ID"], pending_df.at[idx, "Date"])
+        local = pending_df.loc[idx, COMPARE_COLUMNS].astype(str).tolist()
+        remote = sheet.loc[key, COMPARE_COLUMNS].astype(str).tolist()
+        (synced if _same_values(local, remote) else conflicts).append(key)
+    return pending_df[~in_sheet.values], synced, conflicts
+
+
+def _same_values(local, remote):
+    """Compare row values, treating 70 / 70.0 / "70" as equal."""
+    for a, b in zip(local, remote):
+        if a == b:
+            continue
+        try:
+            if float(a) == float(b):
+                continue
+        except ValueError:
+            pass
+        return False
+    return True
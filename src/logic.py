@@ -1,57 +1,51 @@
-def calculate_scrs(age, bmi, sugar, sys_bp, dia_bp, sleep_hours=None):
+import numpy as np
+import pandas as pd
+
+from src import rules, sleep
+
+def calculate_scrs(age, bmi, sugar, sys_bp, dia_bp, sleep_hours=None, version=None):
     """
     Swasthya Composite Risk Score (SCRS)
     Input: Vitals and optional sleep data
-    Output: Risk Score (0-10), Risk Level, Color
-    Logic: Asian-Indian Standards with sleep integration
-    """
-    score = 0
-    risk_factors = []
-    
-    # 1. BMI (Indian Standard: >23 is Overweight, >25 is Obese)
-    if bmi >= 25:
-        score += 3
-        risk_factors.append("Obesity (Indian Std)")
-    elif bmi >= 23:
-        score += 2
-        risk_factors.append("Overweight")
-    
-    # 2. Diabetes (ICMR Standard)
-    if sugar > 126:
-        score += 3
-        risk_factors.append("Diabetic Range")
-    elif sugar > 100:
-        score += 1
-        risk_factors.append("Prediabetic")
-    
-    # 3. Hypertension (AHA Standard)
-    if sys_bp >= 140 or dia_bp >= 90:
-        score += 3
-        risk_factors.append("Hypertension")
-    elif sys_bp >= 130 or dia_bp >= 80:
-        score += 1
-        risk_factors.append("Elevated BP")
-    
-    # 4. Sleep Quality (if provided)
-    if sleep_hours is not None:
-        if sleep_hours < 6:
-            score += 1
-            risk_factors.append("Sleep Deprivation")
-        elif sleep_hours > 9:
-            score += 1
-            risk_factors.append("Excessive Sleep")
-    
-    # 5. Age Synergy (Risk increases with age)
-    if age > 45 and len(risk_factors) > 0:
-        score += 1  # Bonus risk point for age + comorbidity
-    
-    # Result Interpretation
-    if score == 0:
-        return score, "Low Risk", "green", risk_factors
-    elif score <= 4:
-        return score, "Moderate Risk", "orange", risk_factors
-    else:
-        return score, "High Risk", "red", risk_factors
+    Output: Risk Score (0-10), Risk Level, Color, Risk Factors
+    Logic: Thresholds come from the active rule set (rules/scrs-1.json by default:
+    Asian-Indian BMI, ICMR sugar, AHA blood pressure, sleep and age synergy)
+    """
+    return rules.get(version).score(age, bmi, sugar, sys_bp, dia_bp, sleep_hours)
+
+
+def calculate_scrs_batch(age, bmi, sugar, sys_bp, dia_bp, sleep_hours=None, version=None):
+    """
+    Vectorized SCRS for many visits at once (same rules as calculate_scrs).
+    
+    Args:
+        age, bmi, sugar, sys_bp, dia_bp: Array-likes of equal length
+        sleep_hours: Optional array-like; NaN means not recorded
+        version: Rule set version; None means the active one
+    
+    Returns:
+        tuple: (scores int array, labels object array)
+    """
+    return rules.get(version).score_batch(age, bmi, sugar, sys_bp, dia_bp, sleep_hours)
+
+
+def rescore_history(df, version=None):
+    """
+    Re-score stored visits under a rule set (e.g., to preview a threshold change).
+    
+    Args:
+        df: pandas.DataFrame in sheet format (Age, BMI, Sugar, BP, optional Sleep_Hours)
+        version: Rule set version; None means the active one
+    
+    Returns:
+        pandas.DataFrame: Risk_Score, Label and Rule_Version, aligned to df.index
+    """
+    ruleset = rules.get(version)
+    sys_bp, dia_bp = split_bp(df["BP"].to_numpy())
+    sleep_hours = to_float(df["Sleep_Hours"].to_numpy()) if "Sleep_Hours" in df.columns else None
+    scores, labels = ruleset.score_batch(to_float(df["Age"].to_numpy()), to_float(df["BMI"].to_numpy()),
+                                         to_float(df["Sugar"].to_numpy()), sys_bp, dia_bp, sleep_hours)
+    return pd.DataFrame({"Risk_Score": scores, "Label": labels, "Rule_Version": ruleset.version}, index=df.index)
 
 
 def detect_chronotype(bedtime, waketime):
@@ -59,30 +53,46 @@ def detect_chronotype(bedtime, waketime):
     Detects patient chronotype (sleep pattern) based on mid-sleep point.
     
     Args:
-        bedtime: Bedtime hour (24-hour format, e.g., 22 for 10 PM)
-        waketime: Wake time hour (24-hour format, e.g., 6 for 6 AM)
+        bedtime: Bedtime (24-hour format, e.g., 22 or "22:30" for 10:30 PM)
+        waketime: Wake time (24-hour format, e.g., 6 or "06:15")
     
     Returns:
-        str: Chronotype classification ("Early Bird", "Night Owl", or "Intermediate")
-    """
-    # Calculate mid-sleep point
-    # Handle overnight sleep (e.g., 22:00 to 06:00)
-    if bedtime > waketime:
-        # Sleep spans midnight
-        total_sleep_hours = (24 - bedtime) + waketime
-        mid_sleep_hour = (bedtime + total_sleep_hours / 2) % 24
-    else:
-        # Normal same-day sleep
-        total_sleep_hours = waketime - bedtime
-        mid_sleep_hour = bedtime + total_sleep_hours / 2
-    
-    # Classify chronotype
-    if mid_sleep_hour < 3.0:
-        return "Early Bird (Lark)"
-    elif mid_sleep_hour > 5.5:
-        return "Night Owl"
-    else:
-        return "Intermediate"
+        str: Chronotype classification ("Early Bird (Lark)", "Night Owl", or "Intermediate")
+    """
+    return sleep.metrics(bedtime, waketime)[2]
+
+# Validation checks: bit flag, short name and message template. validate_inputs
+# returns the messages; validate_batch returns the flags as a per-row bitmask.
+ERR_AGE = 1 << 0
+ERR_WEIGHT = 1 << 1
+ERR_HEIGHT = 1 << 2
+ERR_SUGAR = 1 << 3
+ERR_SYS_BP = 1 << 4
+ERR_DIA_BP = 1 << 5
+ERR_BP_ORDER = 1 << 6
+ERR_BMI = 1 << 7
+ERR_BMI_MISMATCH = 1 << 8
+
+VALIDATION_CHECKS = [
+    (ERR_AGE, "age", "Invalid Age: {age}. Must be between 1 and 119 years."),
+    (ERR_WEIGHT, "weight", "Invalid Weight: {weight} kg. Must be between 20 and 200 kg."),
+    (ERR_HEIGHT, "height", "Invalid Height: {height} cm. Must be between 50 and 250 cm."),
+    (ERR_SUGAR, "sugar", "Invalid Blood Sugar: {sugar} mg/dL. Must be between 50 and 500 mg/dL."),
+    (ERR_SYS_BP, "systolic_bp", "Invalid Systolic BP: {sys_bp} mmHg. Must be between 50 and 250 mmHg."),
+    (ERR_DIA_BP, "diastolic_bp", "Invalid Diastolic BP: {dia_bp} mmHg. Must be between 30 and 150 mmHg."),
+    (ERR_BP_ORDER, "bp_order", "Invalid BP: Systolic ({sys_bp}) must be greater than Diastolic ({dia_bp})."),
+    (ERR_BMI, "bmi", "Implausible BMI: {bmi}. Weight and height give a BMI outside 10-60; check the units."),
+    (ERR_BMI_MISMATCH, "bmi_mismatch", "Inconsistent BMI: recorded {recorded_bmi} but weight and height give {bmi}."),
+]
+
+# Plausible adult BMI range; values outside almost always mean a unit or typing error
+BMI_RANGE = (10, 60)
+
+# A recorded BMI further than this from weight/height is flagged as inconsistent
+BMI_TOLERANCE = 1.0
+
+def _format_messages(mask, values):
+    return [template.format(**values) for flag, _, template in VALIDATION_CHECKS if mask & flag]
 
 def validate_inputs(age, weight, height, sugar, sys_bp, dia_bp):
     """
@@ -99,34 +109,164 @@ def validate_inputs(age, weight, height, sugar, sys_bp, dia_bp):
     Returns:
         List of error messages. Empty list if all inputs are valid.
     """
-    errors = []
+    mask = 0
     
     # Age validation
     if not (0 < age < 120):
-        errors.append(f"Invalid Age: {age}. Must be between 1 and 119 years.")
+        mask |= ERR_AGE
     
     # Weight validation
     if not (20 < weight < 200):
-        errors.append(f"Invalid Weight: {weight} kg. Must be between 20 and 200 kg.")
+        mask |= ERR_WEIGHT
     
     # Height validation
     if not (50 < height < 250):
-        errors.append(f"Invalid Height: {height} cm. Must be between 50 and 250 cm.")
+        mask |= ERR_HEIGHT
     
     # Blood sugar validation
     if not (50 < sugar < 500):
-        errors.append(f"Invalid Blood Sugar: {sugar} mg/dL. Must be between 50 and 500 mg/dL.")
+        mask |= ERR_SUGAR
     
     # Blood pressure validation
     if not (50 <= sys_bp <= 250):
-        errors.append(f"Invalid Systolic BP: {sys_bp} mmHg. Must be between 50 and 250 mmHg.")
+        mask |= ERR_SYS_BP
     
     if not (30 <= dia_bp <= 150):
-        errors.append(f"Invalid Diastolic BP: {dia_bp} mmHg. Must be between 30 and 150 mmHg.")
+        mask |= ERR_DIA_BP
     
     # Logical validation: Systolic must be greater than Diastolic
-    if sys_bp <= dia_bp:
-        errors.append(f"Invalid BP: Systolic ({sys_bp}) must be greater than Diastolic ({dia_bp}).")
+    if not (sys_bp > dia_bp):
+        mask |= ERR_BP_ORDER
     
-    return errors
+    # Plausibility: weight and height must give a human BMI
+    bmi = weight * 10000 / (height * height) if height > 0 else float("inf")
+    if not (BMI_RANGE[0] <= bmi <= BMI_RANGE[1]):
+        mask |= ERR_BMI
+    
+    if not mask:
+        return []
+    return _format_messages(mask, dict(age=age, weight=weight, height=height, sugar=sugar,
+                                       sys_bp=sys_bp, dia_bp=dia_bp, bmi=round(bmi, 1), recorded_bmi=None))
 
+def split_bp(bp):
+    """
+    Split "140/90" blood pressure strings into systolic and diastolic arrays.
+    
+    Args:
+        bp: Array-like of "sys/dia" strings
+    
+    Returns:
+        tuple: (systolic, diastolic) float arrays; malformed entries are NaN
+    """
+    parts = np.char.partition(np.asarray(bp, dtype=str), "/")
+    return to_float(parts[:, 0]), to_float(parts[:, 2])
+
+def to_float(values):
+    """Numbers or numeric strings to float; unparseable entries become NaN."""
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+
+
+def _display(value):
+    """Show 70.0 as 70, 11.5683 as 11.6 and NaN as "missing" in messages."""
+    if value is None or np.isnan(value):
+        return "missing"
+    return int(value) if float(value).is_integer() else round(float(value), 1)
+
+
+class BatchValidation:
+    """
+    Result of validate_batch: a per-row bitmask with messages formatted on demand.
+    
+    Attributes:
+        mask: numpy uint16 array, one entry per row (0 = valid); test bits with the ERR_* flags
+        index: Row labels of the validated DataFrame
+    """
+    
+    def __init__(self, mask, index, values):
+        self.mask = mask
+        self.index = index
+        self._values = values
+    
+    def __len__(self):
+        return len(self.mask)
+    
+    @property
+    def valid(self):
+        """Boolean array, True where a row passed every check."""
+        return self.mask == 0
+    
+    def counts(self):
+        """Number of failing rows per check name."""
+        return {name: int(np.count_nonzero(self.mask & flag)) for flag, name, _ in VALIDATION_CHECKS}
+    
+    def messages(self, position):
+        """Error messages for one row (by position), in validate_inputs wording."""
+        values = {key: _display(column[position]) for key, column in self._values.items()}
+        return _format_messages(int(self.mask[position]), values)
+    
+    def errors(self, limit=None):
+        """
+        Yield (row label, messages) for failing rows, formatting only what is consumed.
+        
+        Args:
+            limit: Stop after this many failing rows
+        """
+        for count, position in enumerate(np.flatnonzero(self.mask)):
+            if limit is not None and count >= limit:
+                return
+            yield self.index[position], self.messages(position)
+
+
+def validate_batch(df):
+    """
+    Validate many visits at once, column-wise (same rules as validate_inputs).
+    
+    Expects Age, Weight, Height, Sugar and either Systolic_BP/Diastolic_BP or
+    a "140/90" BP column; a BMI column, when present, must match weight/height.
+    Missing or non-numeric values fail the corresponding check.
+    
+    Args:
+        df: pandas.DataFrame of visits (sheet or import format)
+    
+    Returns:
+        BatchValidation: Bitmask per row, with lazily formatted messages
+    """
+    n = len(df)
+    
+    def column(name):
+        if name not in df.columns:
+            return np.full(n, np.nan)
+        return to_float(df[name].to_numpy())
+    
+    age, weight, height, sugar = column("Age"), column("Weight"), column("Height"), column("Sugar")
+    if "Systolic_BP" in df.columns or "BP" not in df.columns:
+        sys_bp, dia_bp = column("Systolic_BP"), column("Diastolic_BP")
+    else:
+        sys_bp, dia_bp = split_bp(df["BP"].to_numpy())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bmi = weight / (height / 100) ** 2
+    recorded_bmi = column("BMI")
+    
+    # Written as "not (in range)" so NaN (missing or non-numeric) fails the check
+    checks = [
+        (ERR_AGE, ~((age > 0) & (age < 120))),
+        (ERR_WEIGHT, ~((weight > 20) & (weight < 200))),
+        (ERR_HEIGHT, ~((height > 50) & (height < 250))),
+        (ERR_SUGAR, ~((sugar > 50) & (sugar < 500))),
+        (ERR_SYS_BP, ~((sys_bp >= 50) & (sys_bp <= 250))),
+        (ERR_DIA_BP, ~((dia_bp >= 30) & (dia_bp <= 150))),
+        (ERR_BP_ORDER, ~(sys_bp > dia_bp)),
+        (ERR_BMI, ~((bmi >= BMI_RANGE[0]) & (bmi <= BMI_RANGE[1]))),
+        # A missing recorded BMI is not an error
+        (ERR_BMI_MISMATCH, np.abs(recorded_bmi - bmi) > BMI_TOLERANCE),
+    ]
+    mask = np.zeros(n, dtype=np.uint16)
+    for flag, failed in checks:
+        mask |= failed.astype(np.uint16) * np.uint16(flag)
+    
+    values = dict(age=age, weight=weight, height=height, sugar=sugar, sys_bp=sys_bp, dia_bp=dia_bp,
+                  bmi=np.round(bmi, 1), recorded_bmi=recorded_bmi)
+    return BatchValidation(mask, df.index, values)
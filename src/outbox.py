@@ -0,0 +1,532 @@
+"""
+Follow-up reminder outbox.
+
+Patients whose latest visit set a follow-up date that is now due get a
+reminder message in English or Hindi (see reports.followup_message).
+Reminders are queued durably in this device's SQLite file
+(swasthya_local.db), once per patient, follow-up date and channel, so queueing
+the same day twice never sends twice. A dispatcher claims queued reminders
+in batches, hands each batch to a sender paced by a rate limiter, and records
+the outcome: sent, queued again with backoff, or failed after MAX_ATTEMPTS.
+
+Senders are pluggable. A sender has send_batch(messages), taking dicts with
+id, to, channel and body, and returns {id: error message or None}; raising
+fails the whole batch. Two ship here:
+
+    webhook  POSTs each batch as JSON to OUTBOX_WEBHOOK_URL (an SMS or
+             WhatsApp Business gateway)
+    fake     keeps the messages in memory (tests, benchmarks, rehearsals)
+
+Queue and send from cron, or from the admin panel:
+
+    python -m src.outbox queue --language Hindi
+    python -m src.outbox send
+
+Settings:
+    OUTBOX_SENDER:         "webhook" (default) or "fake"
+    OUTBOX_WEBHOOK_URL:    Gateway endpoint; OUTBOX_WEBHOOK_TOKEN is sent as a bearer token
+    OUTBOX_CHANNEL:        "whatsapp" (default) or "sms"
+    OUTBOX_RATE:           Messages per second (default 1; 0 = unlimited)
+    OUTBOX_BATCH:          Messages per sender call (default 50)
+    OUTBOX_MAX_ATTEMPTS:   Sends tried before a reminder is marked failed (default 5)
+    FOLLOWUP_DAYS_AHEAD:   Remind this many days before the follow-up date (default 1)
+    FOLLOWUP_OVERDUE_DAYS: Keep reminding up to this many days after it (default 7)
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import urllib.request
+from datetime import date, datetime
+
+import pandas as pd
+
+from src import config, database, reports, resilience, search, tracing
+
+QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+STATES = (QUEUED, SENDING, SENT, FAILED)
+CHANNELS = ("whatsapp", "sms")
+
+CHANNEL = config.get_setting("OUTBOX_CHANNEL", "whatsapp")
+RATE = float(config.get_setting("OUTBOX_RATE", 1.0))
+BATCH_SIZE = int(config.get_setting("OUTBOX_BATCH", 50))
+MAX_ATTEMPTS = int(config.get_setting("OUTBOX_MAX_ATTEMPTS", 5))
+DAYS_AHEAD = int(config.get_setting("FOLLOWUP_DAYS_AHEAD", 1))
+OVERDUE_DAYS = int(config.get_setting("FOLLOWUP_OVERDUE_DAYS", 7))
+
+# Visits read when looking for due follow-ups (follow-ups are set 30 days out)
+LOOKBACK_DAYS = 120
+
+# Retry delay after the n-th failed send: 1, 2, 4 ... minutes, at most an hour
+RETRY_BASE = 60.0
+RETRY_MAX = 3600.0
+
+# A claim older than this was left by a dispatcher that died mid-batch
+STALE_CLAIM = 600.0
+
+DUE_COLUMNS = ["Patient_ID", "Name", "Phone", "Label", "Followup_Date"]
+
+_stores = {}
+_stores_lock = threading.Lock()
+_dispatch_lock = threading.Lock()
+_dispatcher_lock = threading.Lock()
+_dispatcher = None
+
+
+class OutboxError(RuntimeError):
+    """Raised when no usable sender is configured."""
+
+
+def normalize_phone(value):
+    """
+    Phone number in international format, digits only.
+
+    Ten-digit numbers are taken as Indian mobiles (country code 91). Float
+    and missing values from the sheet are handled as in search.phone_digits.
+
+    Returns:
+        str: Digits, or "" if the value is not a usable number
+    """
+    digits = search.phone_digits(value).lstrip("0")
+    if len(digits) == 10:
+        return "91" + digits
+    return digits if 11 <= len(digits) <= 15 else ""
+
+
+def due_followups(history, on_date=None, days_ahead=None, overdue_days=None):
+    """
+    Patients whose latest visit has a follow-up date that is due.
+
+    A later visit replaces the follow-up of an earlier one, so a patient who
+    already came back is not reminded.
+
+    Args:
+        history: Visits (Date, Patient_ID, Name, Phone, Label, Followup_Date)
+        on_date: Day the reminders go out (default today)
+        days_ahead: Remind this many days before the follow-up date
+        overdue_days: Keep reminding up to this many days after it
+
+    Returns:
+        pandas.DataFrame: One row per due patient (DUE_COLUMNS), earliest follow-up first
+    """
+    if history.empty or "Followup_Date" not in history.columns:
+        return pd.DataFrame(columns=DUE_COLUMNS)
+    on_date = pd.Timestamp(on_date or date.today()).normalize()
+    days_ahead = DAYS_AHEAD if days_ahead is None else days_ahead
+    overdue_days = OVERDUE_DAYS if overdue_days is None else overdue_days
+
+    visits = history.assign(_when=pd.to_datetime(history["Date"], errors="coerce"))
+    latest = visits.sort_values("_when", kind="stable").drop_duplicates("Patient_ID", keep="last")
+    followup = pd.to_datetime(latest["Followup_Date"], errors="coerce").dt.normalize()
+    due = (followup >= on_date - pd.Timedelta(days=overdue_days)) & (followup <= on_date + pd.Timedelta(days=days_ahead))
+    result = latest.loc[due, DUE_COLUMNS[:-1]].assign(Followup_Date=followup[due].dt.strftime("%Y-%m-%d"))
+    return result.sort_values("Followup_Date", kind="stable").reset_index(drop=True)
+
+
+def build_reminders(due, language="English", channel=None):
+    """
+    Reminder messages for due follow-ups.
+
+    Args:
+        due: Output of due_followups
+        language: "English" or "Hindi"
+        channel: "whatsapp" or "sms" (default OUTBOX_CHANNEL)
+
+    Returns:
+        tuple: (list of reminder dicts for OutboxStore.enqueue, patients skipped for lack of a phone number)
+    """
+    channel = channel or CHANNEL
+    if channel not in CHANNELS:
+        raise OutboxError(f"unknown channel {channel!r} (expected one of {', '.join(CHANNELS)})")
+    reminders, skipped = [], 0
+    for row in due.itertuples(index=False):
+        phone = normalize_phone(row.Phone)
+        if not phone:
+            skipped += 1
+            continue
+        reminders.append({
+            "key": f"{row.Patient_ID}|{row.Followup_Date}|{channel}",
+            "patient_id": str(row.Patient_ID), "phone": phone, "channel": channel, "language": language,
+            "followup_date": row.Followup_Date,
+            "body": reports.followup_message(row.Name, row.Followup_Date, row.Label, language),
+        })
+    return reminders, skipped
+
+
+class OutboxStore:
+    """
+    SQLite queue of reminder messages and their delivery state.
+
+    Args:
+        path: Database file path (":memory:" for a throwaway store)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE NOT NULL, "
+                "patient_id TEXT, phone TEXT, channel TEXT, language TEXT, followup_date TEXT, body TEXT, "
+                "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, "
+                "next_attempt REAL NOT NULL DEFAULT 0, claimed_at REAL, created_at REAL, sent_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox(state, next_attempt)")
+
+    def enqueue(self, reminders):
+        """
+        Queue reminders; ones already queued (same patient, follow-up date and channel) are skipped.
+
+        Returns:
+            int: Reminders newly queued
+        """
+        now = time.time()
+        rows = [(r["key"], r["patient_id"], r["phone"], r["channel"], r["language"], r["followup_date"],
+                 r["body"], QUEUED, now) for r in reminders]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO outbox (key, patient_id, phone, channel, language, followup_date, body, "
+                "state, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return self._conn.total_changes - before
+
+    def claim(self, limit, now=None):
+        """
+        Take up to `limit` reminders that are due to be sent and mark them sending.
+
+        Returns:
+            list: Dicts with id, to, channel and body (the sender's message shape)
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            # Take the write lock before reading, so a dispatcher in another
+            # process (the cron CLI) cannot claim the same rows
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, phone, channel, body FROM outbox WHERE state = ? AND next_attempt <= ? "
+                "ORDER BY id LIMIT ?", (QUEUED, now, int(limit))).fetchall()
+            self._conn.executemany("UPDATE outbox SET state = ?, claimed_at = ? WHERE id = ? AND state = ?",
+                                   [(SENDING, now, row[0], QUEUED) for row in rows])
+        return [{"id": row[0], "to": row[1], "channel": row[2], "body": row[3]} for row in rows]
+
+    def complete(self, results, max_attempts=None, now=None):
+        """
+        Record the outcome of a batch.
+
+        Args:
+            results: {id: error message, or None when sent}
+            max_attempts: Sends tried before a reminder is marked failed
+            now: Current time (epoch seconds)
+
+        Returns:
+            dict: Reminders sent, queued again for retry, and failed for good
+        """
+        now = time.time() if now is None else now
+        max_attempts = max_attempts or MAX_ATTEMPTS
+        outcome = {SENT: 0, QUEUED: 0, FAILED: 0}
+        ids = list(results)
+        with self._lock, self._conn:
+            attempts = {}
+            for start in range(0, len(ids), 500):  # Stay under SQLite's bound-parameter limit
+                chunk = ids[start:start + 500]
+                attempts.update(self._conn.execute(
+                    f"SELECT id, attempts FROM outbox WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+            for message_id, error in results.items():
+                tries = attempts.get(message_id, 0) + 1
+                if error is None:
+                    state, retry_at = SENT, 0
+                elif tries >= max_attempts:
+                    state, retry_at = FAILED, 0
+                else:
+                    state, retry_at = QUEUED, now + min(RETRY_MAX, RETRY_BASE * 2 ** (tries - 1))
+                self._conn.execute(
+                    "UPDATE outbox SET state = ?, attempts = ?, last_error = ?, next_attempt = ?, "
+                    "sent_at = CASE WHEN ? = 'sent' THEN ? ELSE sent_at END WHERE id = ?",
+                    (state, tries, None if error is None else str(error)[:500], retry_at, state, now, message_id))
+                outcome[state] += 1
+        return outcome
+
+    def recover(self, older_than=STALE_CLAIM):
+        """Return reminders claimed by a dispatcher that stopped mid-batch to the queue."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("UPDATE outbox SET state = ? WHERE state = ? AND claimed_at < ?",
+                                        (QUEUED, SENDING, time.time() - older_than))
+        return cursor.rowcount
+
+    def retry_failed(self):
+        """Queue failed reminders again with a fresh attempt count."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE outbox SET state = ?, attempts = 0, next_attempt = 0 WHERE state = ?", (QUEUED, FAILED))
+        return cursor.rowcount
+
+    def counts(self):
+        """Reminders per delivery state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall()
+        return {state: dict(rows).get(state, 0) for state in STATES}
+
+    def recent(self, state=None, limit=50):
+        """
+        Latest reminders, optionally in one state.
+
+        Returns:
+            pandas.DataFrame: Patient_ID, Phone, Channel, Followup_Date, State, Attempts, Last_Error, Message
+        """
+        where, params = ("WHERE state = ?", (state,)) if state else ("", ())
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT patient_id, phone, channel, followup_date, state, attempts, last_error, body FROM outbox "
+                f"{where} ORDER BY id DESC LIMIT ?", params + (int(limit),)).fetchall()
+        return pd.DataFrame(rows, columns=["Patient_ID", "Phone", "Channel", "Followup_Date", "State",
+                                           "Attempts", "Last_Error", "Message"])
+
+
+def get_store(path=None):
+    """
+    Return the process-wide OutboxStore for a database file.
+
+    Args:
+        path: Database file (defaults to DATA_DIR/swasthya_local.db, shared with local_store)
+
+    Returns:
+        OutboxStore
+    """
+    path = path or config.data_path("swasthya_local.db")
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = OutboxStore(path)
+    return store
+
+
+class FakeSender:
+    """
+    Sender that keeps messages in memory.
+
+    Args:
+        fail_every: Fail every n-th message (0 = never)
+        latency: Seconds added to every batch
+    """
+
+    def __init__(self, fail_every=0, latency=0.0):
+        self.fail_every = fail_every
+        self.latency = latency
+        self.sent = []
+        self.batches = 0
+        self._seen = 0
+
+    def send_batch(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        self.batches += 1
+        results = {}
+        for message in messages:
+            self._seen += 1
+            if self.fail_every and self._seen % self.fail_every == 0:
+                results[message["id"]] = "fake delivery failure"
+            else:
+                self.sent.append(message)
+                results[message["id"]] = None
+        return results
+
+
+class WebhookSender:
+    """
+    Sender that POSTs each batch to a messaging gateway.
+
+    The request body is {"messages": [{id, to, channel, body}, ...]}. Any 2xx
+    reply counts as delivered, unless its JSON carries {"results": {id: error}}
+    for messages the gateway rejected.
+
+    Args:
+        url: Gateway endpoint (default OUTBOX_WEBHOOK_URL)
+        token: Bearer token (default OUTBOX_WEBHOOK_TOKEN)
+        timeout: Seconds per request
+    """
+
+    def __init__(self, url=None, token=None, timeout=15):
+        self.url = url or config.get_setting("OUTBOX_WEBHOOK_URL")
+        if not self.url:
+            raise OutboxError("OUTBOX_WEBHOOK_URL is not set")
+        self.token = token or config.get_setting("OUTBOX_WEBHOOK_TOKEN")
+        self.timeout = timeout
+
+    def send_batch(self, messages):
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.url, data=json.dumps({"messages": messages}).encode("utf-8"),
+                                         headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            raw = response.read()
+        results = {message["id"]: None for message in messages}
+        try:
+            rejected = json.loads(raw or b"{}").get("results") or {}
+        except (ValueError, AttributeError):
+            rejected = {}
+        for message_id, error in rejected.items():
+            if error and int(message_id) in results:
+                results[int(message_id)] = str(error)
+        return results
+
+
+SENDERS = {"webhook": WebhookSender, "fake": FakeSender}
+
+
+def get_sender(name=None):
+    """
+    Create the configured sender.
+
+    Args:
+        name: Sender name (default OUTBOX_SENDER or "webhook")
+
+    Raises:
+        OutboxError: If the sender is unknown or not configured
+    """
+    name = name or config.get_setting("OUTBOX_SENDER", "webhook")
+    if name not in SENDERS:
+        raise OutboxError(f"unknown sender {name!r} (expected one of {', '.join(SENDERS)})")
+    return SENDERS[name]()
+
+
+def queue_due(history=None, language="English", channel=None, on_date=None, store=None):
+    """
+    Queue reminders for every patient whose follow-up is due.
+
+    Args:
+        history: Visits to scan (default: the last LOOKBACK_DAYS of stored history)
+        language: "English" or "Hindi"
+        channel: "whatsapp" or "sms" (default OUTBOX_CHANNEL)
+        on_date: Day the reminders go out (default today)
+        store: OutboxStore (default: this device's)
+
+    Returns:
+        dict: Patients due, reminders newly queued, and patients skipped for lack of a phone number
+    """
+    if history is None:
+        start = (pd.Timestamp(on_date or date.today()) - pd.Timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+        history = database.get_history(start_date=start)
+    with tracing.span("outbox_queue"):
+        due = due_followups(history, on_date)
+        reminders, skipped = build_reminders(due, language, channel)
+        queued = (store or get_store()).enqueue(reminders)
+    tracing.incr("outbox_queued_total", queued)
+    return {"due": len(due), "queued": queued, "skipped_no_phone": skipped}
+
+
+def dispatch(sender=None, store=None, limit=None, batch_size=None, rate=None, max_attempts=None, limiter=None):
+    """
+    Send queued reminders in rate-limited batches until the queue is drained.
+
+    Args:
+        sender: Sender (default get_sender())
+        store: OutboxStore (default: this device's)
+        limit: Stop after this many reminders (None = all that are due)
+        batch_size: Reminders per sender call (default OUTBOX_BATCH)
+        rate: Messages per second (default OUTBOX_RATE; 0 = unlimited)
+        max_attempts: Sends tried before a reminder is marked failed
+        limiter: resilience.RateLimiter to pace with (overrides rate)
+
+    Returns:
+        dict: Reminders sent, queued again for retry and failed, and sender calls made
+    """
+    sender = sender or get_sender()
+    store = store or get_store()
+    batch_size = batch_size or BATCH_SIZE
+    limiter = limiter or resilience.RateLimiter(RATE if rate is None else rate, burst=batch_size)
+    stats = {"sent": 0, "retrying": 0, "failed": 0, "batches": 0}
+    with _dispatch_lock, tracing.span("outbox_dispatch"):
+        store.recover()
+        while limit is None or stats["sent"] + stats["retrying"] + stats["failed"] < limit:
+            take = batch_size if limit is None else min(batch_size, limit - stats["sent"] - stats["retrying"] - stats["failed"])
+            messages = store.claim(take)
+            if not messages:
+                break
+            limiter.acquire(len(messages))
+            try:
+                results = sender.send_batch(messages)
+            except Exception as e:
+                tracing.incr("outbox_errors_total")
+                results = {message["id"]: f"{type(e).__name__}: {e}" for message in messages}
+            # A message the sender did not report on is treated as failed, not lost
+            results = {message["id"]: results.get(message["id"], "no result from sender") for message in messages}
+            outcome = store.complete(results, max_attempts)
+            stats["sent"] += outcome[SENT]
+            stats["retrying"] += outcome[QUEUED]
+            stats["failed"] += outcome[FAILED]
+            stats["batches"] += 1
+    tracing.incr("outbox_sent_total", stats["sent"])
+    tracing.incr("outbox_failed_total", stats["failed"])
+    return stats
+
+
+def start_dispatcher(sender=None):
+    """
+    Drain the queue on a background thread (once at a time per process).
+
+    Returns:
+        bool: True if a new dispatcher was started, False if one is already running
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None and _dispatcher.is_alive():
+            return False
+        sender = sender or get_sender()
+
+        def run():
+            try:
+                dispatch(sender)
+            except Exception:
+                tracing.incr("outbox_errors_total")
+
+        _dispatcher = threading.Thread(target=run, name="swasthya-outbox", daemon=True)
+        _dispatcher.start()
+    return True
+
+
+def dispatcher_running():
+    """True while a background dispatcher is sending."""
+    return _dispatcher is not None and _dispatcher.is_alive()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue and send follow-up reminders.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    queue_cmd = commands.add_parser("queue", help="queue reminders for follow-ups that are due")
+    queue_cmd.add_argument("--language", choices=("English", "Hindi"), default="English")
+    queue_cmd.add_argument("--channel", choices=CHANNELS, default=CHANNEL)
+    queue_cmd.add_argument("--date", help="day the reminders go out (YYYY-MM-DD, default today)")
+    send_cmd = commands.add_parser("send", help="send queued reminders")
+    send_cmd.add_argument("--sender", choices=tuple(SENDERS), help="default: OUTBOX_SENDER")
+    send_cmd.add_argument("--limit", type=int, help="stop after this many reminders")
+    send_cmd.add_argument("--rate", type=float, default=RATE, help="messages per second (0 = unlimited)")
+    send_cmd.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="messages per sender call")
+    commands.add_parser("retry-failed", help="queue failed reminders again")
+    commands.add_parser("status", help="reminders per delivery state")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "queue":
+            on_date = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else None
+            stats = queue_due(language=args.language, channel=args.channel, on_date=on_date)
+            print(f"{stats['due']} follow-ups due, {stats['queued']} reminders queued, "
+                  f"{stats['skipped_no_phone']} skipped (no phone number)")
+        elif args.command == "send":
+            stats = dispatch(get_sender(args.sender), limit=args.limit, batch_size=args.batch_size, rate=args.rate)
+            print(f"{stats['sent']} sent, {stats['retrying']} to retry, {stats['failed']} failed "
+                  f"in {stats['batches']} batches")
+        elif args.command == "retry-failed":
+            print(f"{get_store().retry_failed()} failed reminders queued again")
+        for state, count in get_store().counts().items():
+            print(f"  {state}: {count}")
+    except (OutboxError, ValueError) as e:
+        parser.exit(1, f"outbox: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
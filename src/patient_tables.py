@@ -0,0 +1,105 @@
+"""
+Shared pieces of the per-patient SQLite tables (summaries, anomaly baselines).
+
+Both stores keep one row per patient, folded from visits in sheet format, and
+a key table with the (Patient_ID, Date) of every folded visit so the same rows
+can be passed again without effect and a late-synced older visit is noticed.
+The visit normalisation, row loading and key bookkeeping live here so the two
+stores dedupe visits the same way.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src import logic
+
+# Above this many patients one full-table read beats an IN (...) list
+MAX_IN_IDS = 500
+
+
+def visits(df, columns):
+    """
+    Visits with text Date and float vitals, one row per (Patient_ID, Date), in date order.
+
+    Args:
+        df: pandas.DataFrame of visits in sheet format
+        columns: Numeric columns to parse as floats; "BP" keeps the text reading
+            (Systolic_BP and Diastolic_BP are always split from it)
+
+    Returns:
+        pandas.DataFrame: Patient_ID, Date, the columns, Systolic_BP and Diastolic_BP
+    """
+    df = df.dropna(subset=["Patient_ID", "Date"])
+    out = pd.DataFrame({"Patient_ID": df["Patient_ID"].astype(str).to_numpy(),
+                        "Date": df["Date"].astype(str).to_numpy()})
+    bp = df["BP"].astype(str).to_numpy() if "BP" in df.columns else np.full(len(df), "nan")
+    for column in columns:
+        if column == "BP":
+            out["BP"] = bp
+        else:
+            out[column] = logic.to_float(df[column].to_numpy()) if column in df.columns else np.nan
+    out["Systolic_BP"], out["Diastolic_BP"] = logic.split_bp(bp)
+    out = out.drop_duplicates(["Patient_ID", "Date"], keep="last")
+    return out.sort_values(["Patient_ID", "Date"], kind="stable").reset_index(drop=True)
+
+
+def _select(conn, table, columns, patient_ids):
+    names = ", ".join(f'"{c}"' for c in columns)
+    if len(patient_ids) > MAX_IN_IDS:
+        df = pd.read_sql_query(f"SELECT {names} FROM {table}", conn)
+        return df[df["Patient_ID"].isin(patient_ids)]
+    marks = ", ".join("?" for _ in patient_ids)
+    return pd.read_sql_query(f"SELECT {names} FROM {table} WHERE Patient_ID IN ({marks})",
+                             conn, params=list(patient_ids))
+
+
+def load(conn, table, columns, patient_ids):
+    """Existing rows of a per-patient table for some patients, indexed by Patient_ID."""
+    return _select(conn, table, columns, patient_ids).set_index("Patient_ID")
+
+
+def create_visit_table(conn, visit_table, row_table):
+    """
+    Create the visit-key table of a per-patient table.
+
+    Rows written before the key table existed cannot tell which visits they
+    hold, so they are deleted and rebuilt from the history on next lookup.
+    Run inside the store's creation transaction.
+
+    Args:
+        conn: sqlite3 connection
+        visit_table: Name of the (Patient_ID, Date) key table
+        row_table: Name of the per-patient table it tracks
+    """
+    legacy = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (visit_table,)).fetchone()
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {visit_table} (Patient_ID TEXT, Date TEXT, "
+                 "PRIMARY KEY (Patient_ID, Date)) WITHOUT ROWID")
+    if legacy:
+        conn.execute(f"DELETE FROM {row_table}")
+
+
+def not_after_last(new, existing):
+    """Mask of visits dated at or before their patient's stored Last_Visit (maybe folded already)."""
+    last = new["Patient_ID"].map(existing["Last_Visit"])
+    return (last.notna() & (new["Date"] <= last.fillna(""))).to_numpy()
+
+
+def seen(conn, visit_table, candidates):
+    """Mask of candidate visits whose (Patient_ID, Date) is in the key table."""
+    pids = candidates["Patient_ID"].unique().tolist()
+    keys = _select(conn, visit_table, ["Patient_ID", "Date"], pids)
+    return pd.MultiIndex.from_frame(candidates[["Patient_ID", "Date"]]).isin(pd.MultiIndex.from_frame(keys))
+
+
+def add_visits(conn, visit_table, new):
+    """Record the (Patient_ID, Date) of folded visits."""
+    conn.executemany(f"INSERT OR IGNORE INTO {visit_table} (Patient_ID, Date) VALUES (?, ?)",
+                     new[["Patient_ID", "Date"]].itertuples(index=False, name=None))
+
+
+def delete(conn, row_table, visit_table, patient_ids):
+    """Delete patients' rows and visit keys (rebuilt from the history on next lookup)."""
+    pids = [(str(pid),) for pid in patient_ids]
+    conn.executemany(f"DELETE FROM {row_table} WHERE Patient_ID = ?", pids)
+    conn.executemany(f"DELETE FROM {visit_table} WHERE Patient_ID = ?", pids)
@@ -1,92 +1,250 @@
 """
-Prediction module using Linear Regression to forecast patient health trends.
+Prediction module forecasting patient health trends with time-aware linear regression.
+
+Each vital is regressed on the days elapsed since the patient's first visit, so
+irregular gaps between visits are respected. Fits use closed-form least squares
+over per-patient sums, which lets a whole population be forecast in one pass.
 """
 
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from scipy import stats
 from datetime import datetime, timedelta
 
-def predict_trends(history_df):
+from src import logic, tracing
+
+# Forecast vitals and the range each forecast is clamped to
+VITAL_RANGES = {
+    "Sugar": (50, 500),
+    "Systolic_BP": (90, 250),
+    "Diastolic_BP": (40, 150),
+    "BMI": (10, 60),
+}
+
+# Gap assumed until the next visit when a patient has no usable gaps
+DEFAULT_GAP_DAYS = 30
+
+def _column(history_df, name):
+    if name not in history_df.columns:
+        return np.full(len(history_df), np.nan)
+    return logic.to_float(history_df[name].to_numpy())
+
+def _prepare(history_df, by_patient=True):
     """
-    Predicts next visit values based on past visits using Linear Regression.
+    Turn a history frame into per-visit arrays grouped by patient.
     
-    Input: DataFrame of patient history with columns: Date, Sugar, BP (or Systolic_BP, Diastolic_BP)
-    Output: Dictionary of predictions {'Sugar': value, 'BP': value} or None if insufficient data
+    Visits are sorted by patient and date, and each gets the days elapsed since
+    that patient's first visit. BP stored as "140/90" is split into systolic and
+    diastolic; without a Date column visits count as one day apart.
     
     Args:
-        history_df: pandas.DataFrame with patient historical data
+        history_df: Visits in sheet format
+        by_patient: False treats all rows as one patient's visits
     
     Returns:
-        dict: Dictionary with predicted values, or None if insufficient data
+        dict: codes, patients, starts, days, stamps and one array per vital
     """
-    if history_df is None or len(history_df) < 2:
-        return None  # Need at least 2 points to draw a line
+    n = len(history_df)
+    if by_patient and "Patient_ID" in history_df.columns:
+        codes, patients = pd.factorize(history_df["Patient_ID"].to_numpy())
+    else:
+        codes, patients = np.zeros(n, dtype=np.int64), np.array(["patient"], dtype=object)
+    if "Date" in history_df.columns:
+        dates = pd.to_datetime(history_df["Date"].to_numpy(), errors="coerce", format="ISO8601")
+        dates = dates.to_numpy(dtype="datetime64[s]")
+    else:
+        dates = np.full(n, np.datetime64("NaT"), dtype="datetime64[s]")
+    stamp = np.where(np.isnat(dates), np.nan, dates.astype("int64") / 86400.0)
+    
+    data = {name: _column(history_df, name) for name in ["Age", "Sugar", "BMI", "Systolic_BP", "Diastolic_BP"]}
+    if "BP" in history_df.columns:
+        systolic, diastolic = logic.split_bp(history_df["BP"].to_numpy())
+        # Explicit columns (e.g., Systolic_BP prepared by the caller) win over BP
+        if "Systolic_BP" not in history_df.columns:
+            data["Systolic_BP"] = systolic
+        if "Diastolic_BP" not in history_df.columns:
+            data["Diastolic_BP"] = diastolic
     
-    # Ensure DataFrame is sorted by date
-    if 'Date' in history_df.columns:
-        history_df = history_df.sort_values('Date')
+    # Sort by patient, then date; input order breaks ties and orders undated visits
+    order = np.lexsort((np.arange(n), np.where(np.isnan(stamp), np.inf, stamp), codes))
+    codes, stamp = codes[order], stamp[order]
+    data = {name: values[order] for name, values in data.items()}
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if n else np.array([], dtype=int)
+    
+    if np.isnan(stamp).all():
+        counts = np.diff(np.r_[starts, n])
+        days = np.arange(n, dtype=float) - np.repeat(starts, counts)
     else:
-        # If no Date column, assume chronological order
-        history_df = history_df.reset_index(drop=True)
+        first = np.fmin.reduceat(stamp, starts)
+        days = stamp - np.repeat(first, np.diff(np.r_[starts, n]))
+    data.update(codes=codes, patients=patients, starts=starts, days=days, stamps=stamp)
+    return data
+
+def _fit_groups(codes, n_groups, days, values, t_next, level):
+    """
+    Ordinary least squares of values on days for every patient at once.
     
-    # Prepare Data (X = Visit Number, y = Value)
-    X = np.arange(len(history_df)).reshape(-1, 1)
+    Returns:
+        tuple: (forecast, lower, upper, slope per day, visits used) arrays by patient
+    """
+    mask = ~np.isnan(values) & ~np.isnan(days)
+    c, t, y = codes[mask], days[mask], values[mask]
+    n = np.bincount(c, minlength=n_groups).astype(float)
+    sum_t = np.bincount(c, t, n_groups)
+    sum_y = np.bincount(c, y, n_groups)
+    sum_tt = np.bincount(c, t * t, n_groups)
+    sum_ty = np.bincount(c, t * y, n_groups)
+    sum_yy = np.bincount(c, y * y, n_groups)
     
-    # Next Visit Index
-    next_X = np.array([[len(history_df)]])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_bar = sum_t / n
+        y_bar = sum_y / n
+        sxx = sum_tt - n * t_bar ** 2
+        sxy = sum_ty - n * t_bar * y_bar
+        has_trend = sxx > 1e-9
+        slope = np.where(has_trend, sxy / sxx, 0.0)
+        forecast = y_bar + slope * (t_next - t_bar)
+        
+        # Residual variance; a patient seen twice on the same day has no trend to fit
+        sse = np.maximum(sum_yy - n * y_bar ** 2 - slope * sxy, 0.0)
+        dof = n - np.where(has_trend, 2, 1)
+        s2 = np.where(dof > 0, sse / dof, np.nan)
+        leverage = np.where(has_trend, (t_next - t_bar) ** 2 / sxx, 0.0)
+        se = np.sqrt(s2 * (1 + 1 / n + leverage))
+        q = stats.t.ppf(0.5 + level / 2, np.where(dof > 0, dof, np.nan))
+    forecast = np.where(n >= 2, forecast, np.nan)
+    return forecast, forecast - q * se, forecast + q * se, slope, n
+
+def _score(age, bmi, sugar, sys_bp, dia_bp):
+    """Composite score of forecast vitals; missing vitals score as normal."""
+    return logic.calculate_scrs_batch(
+        np.nan_to_num(age, nan=0), np.nan_to_num(bmi, nan=18.5), np.nan_to_num(sugar, nan=90),
+        np.nan_to_num(sys_bp, nan=110), np.nan_to_num(dia_bp, nan=70)
+    )
+
+def _forecast(history_df, horizon_days, level, by_patient=True):
+    """Forecast columns (arrays aligned with the returned patients)."""
+    data = _prepare(history_df, by_patient)
+    codes, starts, days = data["codes"], data["starts"], data["days"]
+    n_groups = len(data["patients"])
+    ends = np.r_[starts[1:], len(codes)] - 1
     
-    predictions = {}
+    last_day = np.fmax.reduceat(days, starts) if n_groups else np.array([])
+    if horizon_days is None:
+        gaps = np.diff(days, prepend=np.nan)
+        gaps[starts] = np.nan
+        gaps[gaps <= 0] = np.nan
+        if n_groups == 1:
+            median_gap = np.array([np.nan if np.isnan(gaps).all() else np.nanmedian(gaps)])
+        else:
+            median_gap = pd.Series(gaps).groupby(codes).median().to_numpy()
+        default_gap = DEFAULT_GAP_DAYS if not np.isnan(data["stamps"]).all() else 1
+        horizon = np.where(np.isnan(median_gap), default_gap, median_gap)
+    else:
+        horizon = np.full(n_groups, float(horizon_days))
+    t_next = last_day + horizon
+    
+    result = {}
+    last_stamp = np.fmax.reduceat(data["stamps"], starts) if n_groups else np.array([])
+    forecast_stamp = (last_stamp + horizon) * 86400
+    result["Forecast_Date"] = np.where(
+        np.isnan(forecast_stamp), np.datetime64("NaT"),
+        np.nan_to_num(forecast_stamp).astype("int64").astype("datetime64[s]")
+    ).astype("datetime64[ns]")
+    for vital, (low, high) in VITAL_RANGES.items():
+        forecast, lower, upper, slope, n = _fit_groups(codes, n_groups, days, data[vital], t_next, level)
+        result[vital] = np.clip(forecast, low, high)
+        result[f"{vital}_Lower"] = np.clip(lower, low, high)
+        result[f"{vital}_Upper"] = np.clip(upper, low, high)
+        result[f"{vital}_Slope_30d"] = slope * 30
+        if vital == "Sugar":
+            result["Visits"] = n.astype(int)
+    
+    # The score rises with every vital, so scoring the bounds bounds the score
+    scored = ["BMI", "Sugar", "Systolic_BP", "Diastolic_BP"]
+    def vitals(suffix):
+        out = []
+        for vital in scored:
+            values = np.where(np.isnan(result[vital + suffix]), result[vital], result[vital + suffix])
+            out.append(np.where(np.isnan(values), data[vital][ends], values))
+        return out
+    age = data["Age"][ends]
+    result["Risk_Score"], result["Label"] = _score(age, *vitals(""))
+    result["Risk_Score_Lower"], _ = _score(age, *vitals("_Lower"))
+    result["Risk_Score_Upper"], _ = _score(age, *vitals("_Upper"))
+    return result, data["patients"]
+
+@tracing.traced("regression")
+def forecast_population(history_df, horizon_days=None, level=0.8):
+    """
+    Forecast every patient's next-visit vitals and composite risk score.
+    
+    Args:
+        history_df: Visits of one or many patients (sheet format)
+        horizon_days: Days ahead to forecast; defaults to each patient's median visit gap
+        level: Coverage of the prediction intervals (e.g., 0.8 for 80%)
+    
+    Returns:
+        pandas.DataFrame: One row per Patient_ID with Forecast_Date, Visits and,
+        for each vital and Risk_Score, the forecast plus _Lower/_Upper bounds and
+        a _Slope_30d trend (change per 30 days)
+    """
+    result, patients = _forecast(history_df, horizon_days, level)
+    return pd.DataFrame(result, index=pd.Index(patients, name="Patient_ID"))
+
+def predict_trends(history_df, level=0.8):
+    """
+    Predicts next visit values for one patient from the dates of past visits.
+    
+    Input: DataFrame of patient history with columns: Date, Sugar, BP (or Systolic_BP, Diastolic_BP), BMI, Age
+    Output: Dictionary of predictions {'Sugar': value, 'Systolic_BP': value, ...} or None if insufficient data
+    
+    Args:
+        history_df: pandas.DataFrame with patient historical data
+        level: Coverage of the prediction intervals
+    
+    Returns:
+        dict: Predicted vitals, 'Risk_Score', 'Label', 'Forecast_Date' and
+        'intervals' ({name: (lower, upper)}), or None if insufficient data
+    """
+    if history_df is None or len(history_df) < 2:
+        return None  # Need at least 2 points to draw a line
     
     try:
-        # Predict Sugar
-        if 'Sugar' in history_df.columns:
-            model = LinearRegression()
-            sugar_values = pd.to_numeric(history_df['Sugar'], errors='coerce').dropna()
-            if len(sugar_values) >= 2:
-                X_sugar = np.arange(len(sugar_values)).reshape(-1, 1)
-                model.fit(X_sugar, sugar_values.values)
-                pred_sugar = model.predict(next_X)[0]
-                predictions['Sugar'] = max(50, min(500, int(pred_sugar)))  # Clamp to valid range
-        
-        # Predict Blood Pressure
-        # Try different column name formats
-        bp_columns = ['Systolic_BP', 'sys_bp', 'BP']
-        sys_bp_col = None
-        dia_bp_col = None
-        
-        for col in history_df.columns:
-            if 'sys' in col.lower() or 'systolic' in col.lower():
-                sys_bp_col = col
-            if 'dia' in col.lower() or 'diastolic' in col.lower():
-                dia_bp_col = col
-        
-        # If BP is stored as "140/90" format
-        if 'BP' in history_df.columns and sys_bp_col is None:
-            # Extract systolic values
-            bp_values = history_df['BP'].apply(lambda x: int(str(x).split('/')[0]) if '/' in str(x) else None)
-            bp_values = bp_values.dropna()
-            if len(bp_values) >= 2:
-                X_bp = np.arange(len(bp_values)).reshape(-1, 1)
-                model = LinearRegression()
-                model.fit(X_bp, bp_values.values)
-                pred_sys = model.predict(next_X)[0]
-                predictions['Systolic_BP'] = max(90, min(250, int(pred_sys)))
-        
-        elif sys_bp_col:
-            sys_bp_values = pd.to_numeric(history_df[sys_bp_col], errors='coerce').dropna()
-            if len(sys_bp_values) >= 2:
-                X_bp = np.arange(len(sys_bp_values)).reshape(-1, 1)
-                model = LinearRegression()
-                model.fit(X_bp, sys_bp_values.values)
-                pred_sys = model.predict(next_X)[0]
-                predictions['Systolic_BP'] = max(90, min(250, int(pred_sys)))
-        
+        with tracing.span("regression"):
+            result, _ = _forecast(history_df, None, level, by_patient=False)
+        row = {name: values[0] for name, values in result.items()}
     except Exception as e:
         # If prediction fails, return None
         return None
+    return as_trends(row)
+
+def as_trends(row):
+    """
+    Convert one forecast_population row (dict or Series) to the predict_trends format.
+    
+    Returns:
+        dict: As returned by predict_trends, or None if no vital could be forecast
+    """
+    predictions = {}
+    intervals = {}
+    for vital in VITAL_RANGES:
+        if pd.isna(row[vital]):
+            continue
+        # BMI keeps one decimal; the other vitals are whole numbers, as entered
+        as_value = (lambda v: round(float(v), 1)) if vital == "BMI" else (lambda v: int(round(v)))
+        predictions[vital] = as_value(row[vital])
+        if pd.notna(row[f"{vital}_Lower"]):
+            intervals[vital] = (as_value(row[f"{vital}_Lower"]), as_value(row[f"{vital}_Upper"]))
+    if not predictions:
+        return None
     
-    return predictions if predictions else None
+    predictions["Risk_Score"] = int(row["Risk_Score"])
+    predictions["Label"] = row["Label"]
+    intervals["Risk_Score"] = (int(row["Risk_Score_Lower"]), int(row["Risk_Score_Upper"]))
+    predictions["Forecast_Date"] = pd.Timestamp(row["Forecast_Date"]) if pd.notna(row["Forecast_Date"]) else None
+    predictions["intervals"] = intervals
+    return predictions
 
 def calculate_followup_date(risk_score, days_offset=30):
     """
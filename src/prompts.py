@@ -0,0 +1,167 @@
+"""
+Prompt templates for the Groq advice call.
+
+Templates are kept compact: every line is stripped and runs of spaces are
+collapsed before sending, so the model is billed only for content, not for
+source-code indentation. Each built prompt is measured in tokens (tiktoken's
+cl100k_base when installed, otherwise a character-class estimate) and the
+counts are exported per language, next to the response budget it is sent
+with.
+
+Settings:
+    ADVICE_MAX_TOKENS:       Response budget for English advice (default 220)
+    ADVICE_MAX_TOKENS_HINDI: Response budget for Hindi advice (default 350;
+                             Devanagari costs several tokens per word)
+"""
+
+import math
+import re
+
+from src import config, tracing
+
+HAS_TIKTOKEN = False
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    # Token counts fall back to an estimate
+    pass
+
+# Section headings, in the order the model is asked to write them. ai_advice
+# parses responses on these (and on the fallback advice's shorter headings).
+HEADINGS = {
+    "English": {"diet": "Dietary Adjustment", "habit": "Lifestyle Micro-Habit", "medication": "Medication Note"},
+    "Hindi": {"diet": "आहार समायोजन", "habit": "जीवनशैली सूक्ष्म आदत", "medication": "दवा नोट"},
+}
+
+ADVICE_TEMPLATES = {
+    "English": """
+        Act as a senior Indian doctor.
+        Patient: {name} ({age} yrs). Condition: {condition}. Trend: {trend}. Meds: {medications}.{sleep}
+        Write a care plan in markdown, max {words} words, strict and empathetic:
+        1. **{diet}**: specific Indian foods to eat/avoid.
+        2. **{habit}**: one small change (e.g. 'Walk 15 mins after dinner').
+        3. **{medication}**: compliance advice if meds given, else natural management.
+    """,
+    "Hindi": """
+        वरिष्ठ भारतीय डॉक्टर के रूप में उत्तर दें।
+        रोगी: {name} ({age} वर्ष)। स्थिति: {condition}। प्रवृत्ति: {trend}। दवाएं: {medications}।{sleep}
+        मार्कडाउन में देखभाल योजना, अधिकतम {words} शब्द, सख्त और सहानुभूतिपूर्ण:
+        1. **{diet}**: खाने/बचने के लिए विशिष्ट भारतीय खाद्य पदार्थ।
+        2. **{habit}**: एक छोटा बदलाव (जैसे 'रात के खाने के बाद 15 मिनट टहलें')।
+        3. **{medication}**: दवाएं हों तो अनुपालन पर सलाह, अन्यथा प्राकृतिक प्रबंधन।
+    """,
+}
+
+TRENDS = {
+    "English": {"positive": "Improving", "negative": "Worsening"},
+    "Hindi": {"positive": "सुधार", "negative": "बिगड़ती"},
+}
+STABLE = {"English": "Stable", "Hindi": "स्थिर"}
+NO_MEDS = {"English": "None", "Hindi": "कोई नहीं"}
+SLEEP = {"English": " Sleep: {hours}h/night, {chronotype}.", "Hindi": " नींद: {hours} घंटे/रात, {chronotype}।"}
+
+# Words asked for in the plan
+MAX_WORDS = 120
+
+MAX_TOKENS = {
+    "English": int(config.get_setting("ADVICE_MAX_TOKENS", 220)),
+    "Hindi": int(config.get_setting("ADVICE_MAX_TOKENS_HINDI", 350)),
+}
+
+_SPACES = re.compile(r"[ \t\u00a0]+")
+# Estimate: ~4 Latin letters or digits per token, ~2 characters per token for
+# other scripts (Devanagari), one per ASCII punctuation mark and one per line
+# break or run of indentation
+_LATIN = re.compile(r"[A-Za-z0-9]+")
+_OTHER = re.compile(r"[^\x00-\x7f\s]+")
+_PUNCT = re.compile(r"[!-/:-@\[-`{-~]")
+_BREAKS = re.compile(r"\n\s*|[ \t]{2,}")
+
+_encoding = None
+
+
+def normalize(text):
+    """
+    Whitespace-normalize a prompt: strip every line, collapse runs of spaces
+    and drop blank lines.
+
+    Args:
+        text: Raw template or rendered prompt
+
+    Returns:
+        str: Compact prompt text
+    """
+    lines = (_SPACES.sub(" ", line).strip() for line in str(text).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def count_tokens(text):
+    """
+    Tokens in a prompt (cl100k_base with tiktoken, otherwise estimated).
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        int: Token count
+    """
+    global _encoding
+    if HAS_TIKTOKEN:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    latin = sum(math.ceil(len(word) / 4) for word in _LATIN.findall(text))
+    other = sum(math.ceil(len(word) / 2) for word in _OTHER.findall(text))
+    return latin + other + len(_PUNCT.findall(text)) + len(_BREAKS.findall(text))
+
+
+def _render(name, age, condition, history_trend, medications, language, chronotype, sleep_hours):
+    sleep = SLEEP[language].format(hours=sleep_hours, chronotype=chronotype) if sleep_hours and chronotype else ""
+    return normalize(ADVICE_TEMPLATES[language].format(
+        name=name, age=age, condition=condition,
+        trend=TRENDS[language].get(history_trend, STABLE[language]),
+        medications=_SPACES.sub(" ", str(medications or "")).strip() or NO_MEDS[language],
+        sleep=sleep, words=MAX_WORDS, **HEADINGS[language],
+    ))
+
+
+def build_advice_prompt(name, age, condition, history_trend, medications="", language="English",
+                        chronotype=None, sleep_hours=None):
+    """
+    Render the care-plan prompt for one patient.
+
+    Args:
+        name: Patient name
+        age: Patient age
+        condition: Current risk level
+        history_trend: "positive", "negative", or "stable"
+        medications: Current medications (comma-separated)
+        language: "English" or "Hindi"
+        chronotype: Sleep pattern type, if known
+        sleep_hours: Total sleep duration in hours, if known
+
+    Returns:
+        tuple: (prompt text, prompt tokens, response token budget)
+    """
+    language = "Hindi" if language == "Hindi" else "English"
+    prompt = _render(name, age, condition, history_trend, medications, language, chronotype, sleep_hours)
+    tokens = count_tokens(prompt)
+    tracing.set_gauge("advice_prompt_tokens", tokens, language=language)
+    tracing.incr("advice_prompt_tokens_total", tokens, language=language)
+    return prompt, tokens, MAX_TOKENS[language]
+
+
+def token_report():
+    """
+    Prompt size per language for a typical patient, with the response budget.
+
+    Returns:
+        dict: {language: {"prompt_tokens": int, "max_tokens": int}}
+    """
+    report = {}
+    for language in ADVICE_TEMPLATES:
+        prompt = _render("Asha Verma", 54, "Moderate Risk", "negative", "Metformin 500mg",
+                         language, "Night Owl", 6.5)
+        report[language] = {"prompt_tokens": count_tokens(prompt), "max_tokens": MAX_TOKENS[language]}
+    return report
@@ -1,6 +1,12 @@
 from fpdf import FPDF
 import urllib.parse
 
+from src import ai_advice, tracing
+
+# Care-plan items longer than this are shortened in WhatsApp messages
+WHATSAPP_ITEM_CHARS = 160
+
+@tracing.traced("pdf_render")
 def create_pdf(data, language="English"):
     """
     Generates a professional PDF health report for the patient.
@@ -50,20 +56,14 @@ def create_pdf(data, language="English"):
             pdf.cell(0, 10, "Clinical Recommendations:", ln=True)
         pdf.set_font("Arial", size=12)
         
-        # AI Advice if available
-        if data.get('advice'):
-            advice_text = str(data.get('advice', ''))
-            # Remove markdown, emojis, and special characters
-            advice_clean = advice_text.replace('**', '').replace('#', '').replace('*', '')
-            advice_clean = advice_clean.replace('🤖', '').replace('📋', '').replace('AI-Generated Advice', 'AI Advice')
-            advice_clean = advice_clean.strip()
-            
-            # Encode to latin-1, removing unsupported characters
-            advice_clean = advice_clean.encode('latin-1', 'ignore').decode('latin-1')
-            
-            # Split into lines and add
-            for line in advice_clean.split('\n'):
-                line_clean = line.strip()
+        # Advice if available, parsed once by the caller (advice_plan) or here
+        plan = data.get('advice_plan')
+        if plan is None and data.get('advice'):
+            plan = ai_advice.parse_advice(str(data.get('advice')))
+        if plan:
+            for line in ai_advice.advice_lines(plan):
+                # Encode to latin-1, removing unsupported characters
+                line_clean = line.replace('AI-Generated Advice', 'AI Advice').encode('latin-1', 'ignore').decode('latin-1').strip()
                 if line_clean and len(line_clean) > 2:
                     # Break long lines
                     if len(line_clean) > 80:
@@ -137,7 +137,20 @@ def create_pdf(data, language="English"):
             # If even error PDF fails, return None to trigger proper error handling
             return None
 
-def get_whatsapp_link(name, score, label, language="English"):
+def whatsapp_url(msg, phone=""):
+    """
+    WhatsApp share link for a message.
+    
+    Args:
+        msg: Message text
+        phone: Recipient in international format, digits only ("" lets the user pick a chat)
+    
+    Returns:
+        str: wa.me link
+    """
+    return f"https://wa.me/{phone}?text={urllib.parse.quote(msg)}"
+
+def get_whatsapp_link(name, score, label, language="English", advice_plan=None):
     """
     Encodes message for WhatsApp API with language support.
     
@@ -146,6 +159,7 @@ def get_whatsapp_link(name, score, label, language="English"):
         score: Risk score
         label: Risk label
         language: Language for message ("English" or "Hindi")
+        advice_plan: Parsed advice (ai_advice.parse_advice); its care-plan items are appended
     
     Returns:
         str: WhatsApp share link
@@ -154,5 +168,34 @@ def get_whatsapp_link(name, score, label, language="English"):
         msg = f"नमस्ते {name},\nआपकी स्वास्थ्य जांच रिपोर्ट:\nजोखिम स्कोर: {score}/10\nस्थिति: {label}\nकृपया यदि जोखिम अधिक है तो डॉक्टर से परामर्श करें।"
     else:
         msg = f"Hello {name},\nYour Swasthya Health Checkup Report:\nRisk Score: {score}/10\nStatus: {label}\nPlease consult a doctor if Risk is High."
-    return f"https://wa.me/?text={urllib.parse.quote(msg)}"
+    items = ai_advice.plan_items(advice_plan) if advice_plan else []
+    if items:
+        msg += "\n\n" + ("देखभाल योजना:" if language == "Hindi" else "Care Plan:")
+        for item_label, text in items:
+            if len(text) > WHATSAPP_ITEM_CHARS:
+                text = text[:WHATSAPP_ITEM_CHARS - 1].rstrip() + "…"
+            msg += f"\n- {item_label}: {text}"
+    return whatsapp_url(msg)
 
+def followup_message(name, followup_date, label="", language="English"):
+    """
+    Follow-up reminder text (short enough for a single SMS in English).
+    
+    Args:
+        name: Patient name
+        followup_date: Recommended follow-up date (YYYY-MM-DD)
+        label: Risk label of the last visit
+        language: Language for message ("English" or "Hindi")
+    
+    Returns:
+        str: Reminder message
+    """
+    if language == "Hindi":
+        msg = f"नमस्ते {name}, आपकी स्वास्थ्य जांच की अनुवर्ती तिथि {followup_date} है।"
+        if "High" in str(label):
+            msg += " पिछली जांच में जोखिम अधिक था।"
+        return msg + " कृपया क्लिनिक आएं।"
+    msg = f"Hello {name}, your Swasthya health checkup follow-up is due on {followup_date}."
+    if "High" in str(label):
+        msg += " Your last check showed high risk."
+    return msg + " Please visit the clinic."
@@ -0,0 +1,308 @@
+"""
+Resumable re-score backfill of stored visits.
+
+Risk_Score and Label are frozen when a visit is saved, so a rule change leaves
+older visits scored under the old rules. This job streams the stored history
+(archived months one partition at a time, then this clinic's sheet in chunks),
+re-scores each chunk with the rule set's vectorized scorer and writes back the visits
+whose score, level or rule version changed:
+
+    archive  one rewrite per month partition that changed
+    sheet    batches of BATCH_ROWS changed visits, at most one write every
+             WRITE_INTERVAL seconds; each batch is a fresh read and a single
+             worksheet update (the only write the Sheets connection offers)
+
+Progress is checkpointed after every month and sheet batch, so an interrupted
+run resumes where it stopped. Visits still waiting on this device to sync are
+picked up by a later run once they are in the sheet. Run it from the command
+line, first as a dry run:
+
+    python -m src.rescore --dry-run --diff-output changes.csv
+    python -m src.rescore --version scrs-who-1
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src import archive, clinics, config, database, logic, rules, summaries, tracing
+
+# Visits re-scored per step
+CHUNK_ROWS = int(config.get_setting("RESCORE_CHUNK_ROWS", 20_000))
+
+# Changed visits per sheet write, and the minimum gap between writes (Sheets
+# allows 60 requests per minute; each batch costs a read and a write)
+BATCH_ROWS = int(config.get_setting("RESCORE_BATCH_ROWS", 5_000))
+WRITE_INTERVAL = float(config.get_setting("RESCORE_WRITE_INTERVAL", 2.0))
+
+SOURCES = ("archive", "sheet")
+
+DIFF_COLUMNS = ["Source", "Patient_ID", "Date", "Old_Risk_Score", "New_Risk_Score",
+                "Old_Label", "New_Label", "Old_Rule_Version", "New_Rule_Version"]
+
+
+def _checkpoint_path():
+    return config.data_path("rescore_checkpoint.json")
+
+
+def _load_checkpoint(version, worksheet):
+    """Saved progress of an interrupted run towards the same rule set and sheet, or None."""
+    try:
+        with open(_checkpoint_path(), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("version") != version or state.get("worksheet") != worksheet:
+        return None
+    return state
+
+
+def _save_checkpoint(state):
+    path = _checkpoint_path()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def _clear_checkpoint():
+    try:
+        os.remove(_checkpoint_path())
+    except OSError:
+        pass
+
+
+def diff(df, version=None, source=""):
+    """
+    Visits whose stored score, risk level or rule version differ from a re-score.
+
+    Visits whose vitals cannot be parsed are left alone.
+
+    Args:
+        df: Visits in sheet format
+        version: Rule set version; None means the active one
+        source: Value of the Source column (e.g., "sheet" or "archive 2023-04")
+
+    Returns:
+        pandas.DataFrame: DIFF_COLUMNS for the changed visits, indexed like df
+    """
+    if df.empty:
+        return pd.DataFrame(columns=DIFF_COLUMNS)
+    # Same inputs as logic.rescore_history, parsed once to also find unscorable visits
+    ruleset = rules.get(version)
+    sys_bp, dia_bp = logic.split_bp(df["BP"].astype(str).to_numpy())
+    age, bmi, sugar = (logic.to_float(df[column].to_numpy()) for column in ("Age", "BMI", "Sugar"))
+    sleep_hours = logic.to_float(df["Sleep_Hours"].to_numpy()) if "Sleep_Hours" in df.columns else None
+    scores, labels = ruleset.score_batch(age, bmi, sugar, sys_bp, dia_bp, sleep_hours)
+    scorable = ~(np.isnan(age) | np.isnan(bmi) | np.isnan(sugar) | np.isnan(sys_bp) | np.isnan(dia_bp))
+
+    old_score = logic.to_float(df["Risk_Score"].to_numpy())
+    old_label = df["Label"].astype(str).where(df["Label"].notna(), "").to_numpy()
+    old_version = df["Rule_Version"].astype(str).where(df["Rule_Version"].notna(), "").to_numpy()
+    changed = scorable & ((old_score != scores) | (old_label != labels) | (old_version != ruleset.version))
+    return pd.DataFrame({
+        "Source": source,
+        "Patient_ID": df["Patient_ID"].to_numpy()[changed],
+        "Date": df["Date"].astype(str).to_numpy()[changed],
+        "Old_Risk_Score": old_score[changed],
+        "New_Risk_Score": scores[changed],
+        "Old_Label": old_label[changed],
+        "New_Label": labels[changed],
+        "Old_Rule_Version": old_version[changed],
+        "New_Rule_Version": ruleset.version,
+    }, index=df.index[changed])
+
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _new_scores(changes):
+    """Changed visits in the shape database.update_scores expects."""
+    return pd.DataFrame({"Patient_ID": changes["Patient_ID"], "Date": changes["Date"],
+                         "Risk_Score": changes["New_Risk_Score"], "Label": changes["New_Label"],
+                         "Rule_Version": changes["New_Rule_Version"]}, index=changes.index)
+
+
+def _forget_summaries(changes):
+    """Summaries hold running Risk_Score stats; re-scored patients are rebuilt on next lookup."""
+    try:
+        summaries.get_store().forget(changes["Patient_ID"].astype(str).unique())
+    except Exception:
+        tracing.incr("summary_errors_total")
+
+
+class _Run:
+    """Counters and checkpoint of one backfill run."""
+
+    def __init__(self, version, dry_run, state, on_diff, log):
+        self.version = version
+        self.dry_run = dry_run
+        self.state = state
+        self.on_diff = on_diff
+        self.log = log
+        self.stats = {"version": version, "dry_run": dry_run,
+                      "resumed": bool(state["archive_done"] or state["sheet_cursor"]),
+                      "scanned": 0, "changed": 0, "level_changes": 0, "written": 0, "transitions": {}}
+
+    def record(self, changes, scanned):
+        self.stats["scanned"] += scanned
+        self.stats["changed"] += len(changes)
+        moved = changes[changes["Old_Label"] != changes["New_Label"]]
+        self.stats["level_changes"] += len(moved)
+        for (old, new), count in moved.groupby(["Old_Label", "New_Label"]).size().items():
+            key = f"{old or '(none)'} -> {new}"
+            self.stats["transitions"][key] = self.stats["transitions"].get(key, 0) + int(count)
+        if self.on_diff is not None and not changes.empty:
+            self.on_diff(changes)
+
+    def checkpoint(self, **progress):
+        if self.dry_run:
+            return
+        self.state.update(progress)
+        _save_checkpoint(self.state)
+
+
+def _rescore_archive(run, chunk_rows):
+    done = set(run.state["archive_done"])
+    for year, month, _ in archive.partitions():
+        key = f"{year}-{month:02d}"
+        if key in done:
+            continue
+        month_df, month_files = archive.read_month(year, month, database.SHEET_COLUMNS)
+        changes = pd.concat([diff(chunk, run.version, f"archive {key}") for chunk in _chunks(month_df, chunk_rows)])
+        run.record(changes, len(month_df))
+        if not run.dry_run and not changes.empty:
+            month_df.loc[changes.index, database.SCORE_COLUMNS] = _new_scores(changes)[database.SCORE_COLUMNS]
+            archive.replace_month(year, month, month_df, database.SHEET_COLUMNS, month_files)
+            run.stats["written"] += len(changes)
+            _forget_summaries(changes)
+        done.add(key)
+        run.checkpoint(archive_done=sorted(done))
+        run.log(f"archive {key}: {len(changes)} of {len(month_df)} visits changed")
+
+
+def _rescore_sheet(run, chunk_rows, batch_rows, write_interval):
+    sheet = database.read_sheet_fresh()
+    keys = pd.DataFrame({"Date": sheet["Date"].astype(str), "Patient_ID": sheet["Patient_ID"].astype(str)})
+    order = np.lexsort((keys["Patient_ID"].to_numpy(), keys["Date"].to_numpy()))
+    sheet, keys = sheet.iloc[order], keys.iloc[order]
+    cursor = run.state["sheet_cursor"]
+    if cursor:
+        after = (keys["Date"] > cursor[0]) | ((keys["Date"] == cursor[0]) & (keys["Patient_ID"] > cursor[1]))
+        sheet, keys = sheet[after.to_numpy()], keys[after.to_numpy()]
+
+    pending, last_write = [], 0.0
+    for position, chunk in enumerate(_chunks(sheet, chunk_rows)):
+        changes = diff(chunk, run.version, "sheet")
+        run.record(changes, len(chunk))
+        pending.append(changes)
+        last_chunk = (position + 1) * chunk_rows >= len(sheet)
+        if sum(len(c) for c in pending) < batch_rows and not last_chunk:
+            continue
+        batch = pd.concat(pending)
+        pending = []
+        if not run.dry_run and not batch.empty:
+            wait = last_write + write_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            run.stats["written"] += database.update_scores(_new_scores(batch))
+            last_write = time.monotonic()
+            _forget_summaries(batch)
+        end = keys.loc[chunk.index[-1]]
+        run.checkpoint(sheet_cursor=[end["Date"], end["Patient_ID"]])
+        run.log(f"sheet: {len(batch)} changed visits {'found' if run.dry_run else 'written'} "
+                f"(through {end['Date']})")
+
+
+def run(version=None, dry_run=False, restart=False, sources=SOURCES, chunk_rows=None, batch_rows=None,
+        write_interval=None, on_diff=None, log=None):
+    """
+    Re-score stored visits and write back the ones that changed.
+
+    Args:
+        version: Rule set version; None means the active one
+        dry_run: Only report the changes (no writes, no checkpoint)
+        restart: Ignore the checkpoint of an interrupted run
+        sources: "archive" and/or "sheet"
+        chunk_rows: Visits re-scored per step (default CHUNK_ROWS)
+        batch_rows: Changed visits per sheet write (default BATCH_ROWS)
+        write_interval: Minimum seconds between sheet writes (default WRITE_INTERVAL)
+        on_diff: Called with each DataFrame of changed visits (DIFF_COLUMNS)
+        log: Called with progress messages
+
+    Returns:
+        dict: version, dry_run, resumed, scanned, changed, level_changes,
+        written and transitions ({"old -> new" risk level: visits})
+
+    Raises:
+        database.OfflineError: If the sheet is included and cannot be reached
+            (completed archive months stay checkpointed)
+    """
+    version = rules.get(version).version
+    worksheet = clinics.worksheet()
+    state = None if (dry_run or restart) else _load_checkpoint(version, worksheet)
+    state = state or {"version": version, "worksheet": worksheet, "archive_done": [], "sheet_cursor": None}
+    job = _Run(version, dry_run, state, on_diff, log or (lambda message: None))
+    if job.stats["resumed"]:
+        job.log(f"resuming: {len(state['archive_done'])} archive months done, sheet through {state['sheet_cursor']}")
+    with tracing.span("rescore", version=version, dry_run=dry_run):
+        if "archive" in sources and archive.HAS_PYARROW:
+            _rescore_archive(job, chunk_rows or CHUNK_ROWS)
+        if "sheet" in sources:
+            _rescore_sheet(job, chunk_rows or CHUNK_ROWS, batch_rows or BATCH_ROWS,
+                           WRITE_INTERVAL if write_interval is None else write_interval)
+    if not dry_run:
+        _clear_checkpoint()
+        tracing.incr("rescore_rows_total", job.stats["written"])
+    return job.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-score stored visits with the current (or a given) rule set.",
+        epilog="Each sheet batch rewrites the whole worksheet. Pause data entry on every device while the "
+               "sheet is re-scored: a visit synced between the last check and a write is overwritten.")
+    parser.add_argument("--version", help="rule set version (default: the active one)")
+    parser.add_argument("--dry-run", action="store_true", help="report the changes without writing them")
+    parser.add_argument("--diff-output", help="CSV file listing every changed visit")
+    parser.add_argument("--source", choices=("all",) + SOURCES, default="all")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of an interrupted run")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="visits re-scored per step")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="changed visits per sheet write")
+    parser.add_argument("--write-interval", type=float, default=WRITE_INTERVAL, help="seconds between sheet writes")
+    args = parser.parse_args(argv)
+
+    diff_file = open(args.diff_output, "w", encoding="utf-8", newline="") if args.diff_output else None
+    written_header = []
+
+    def write_diff(changes):
+        changes.to_csv(diff_file, index=False, header=not written_header)
+        written_header.append(True)
+
+    try:
+        stats = run(args.version, args.dry_run, args.restart, SOURCES if args.source == "all" else (args.source,),
+                    args.chunk_rows, args.batch_rows, args.write_interval,
+                    on_diff=write_diff if diff_file else None, log=lambda message: print(message, file=sys.stderr))
+    except (rules.RuleError, database.OfflineError, database.SheetChangedError) as e:
+        parser.exit(1, f"rescore: {e}\n")
+    finally:
+        if diff_file:
+            if not written_header:
+                diff_file.write(",".join(DIFF_COLUMNS) + "\n")
+            diff_file.close()
+
+    verb = "would change" if stats["dry_run"] else "changed"
+    print(f"Rule set {stats['version']}: {stats['scanned']} visits scanned, {stats['changed']} {verb} "
+          f"({stats['level_changes']} risk level changes), {stats['written']} written")
+    for transition, count in sorted(stats["transitions"].items(), key=lambda item: -item[1]):
+        print(f"  {transition}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Resilience helpers for calls to Google Sheets and Groq.
+
+Provides jittered exponential backoff, a process-wide retry budget (so a
+throttled backend is not hammered by every session at once) and a circuit
+breaker per backend that fails fast while the backend is throttled, letting
+callers serve cached data immediately instead of sleeping in the request.
+A blocking rate limiter paces bulk traffic such as follow-up reminders.
+"""
+
+import random
+import socket
+import threading
+import time
+from functools import wraps
+
+from src import tracing
+
+# Network failures worth retrying; other OSErrors (a missing or unreadable
+# file, a full disk) fail the same way on every attempt
+NETWORK_ERRORS = (ConnectionError, TimeoutError, socket.gaierror, socket.herror)
+try:
+    # requests' connection errors derive from OSError but not ConnectionError
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+    NETWORK_ERRORS += (RequestsConnectionError, RequestsTimeout)
+except ImportError:
+    pass
+
+# Error markers used when an exception carries no HTTP status
+RATE_LIMIT_MARKERS = ("RESOURCE_EXHAUSTED", "RATE_LIMIT_EXCEEDED", "Too Many Requests")
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the backend's circuit is open."""
+
+
+def _status_code(exc):
+    """Extract an HTTP status code from an exception or its response, if any."""
+    for obj in (exc, getattr(exc, "response", None)):
+        if obj is None:
+            continue
+        for attr in ("status_code", "status", "code"):
+            value = getattr(obj, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_rate_limited(exc):
+    """
+    Check whether an exception means the backend is throttling us.
+
+    Uses the HTTP status (gspread APIError, Groq RateLimitError, httpx/requests
+    responses) and only falls back to message markers when none is available.
+
+    Args:
+        exc: Exception raised by the backend call
+
+    Returns:
+        bool: True for HTTP 429 / quota exhaustion errors
+    """
+    if isinstance(exc, CircuitOpenError):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429
+    message = str(exc)
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def is_transient(exc):
+    """
+    Check whether an exception is worth retrying (throttling, 5xx, network).
+
+    Args:
+        exc: Exception raised by the backend call
+
+    Returns:
+        bool: True if a retry may succeed
+    """
+    if is_rate_limited(exc):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status >= 500
+    return isinstance(exc, NETWORK_ERRORS)
+
+
+class RetryBudget:
+    """
+    Token bucket shared by all sessions in the process.
+
+    Every retry spends one token; tokens refill slowly. When the bucket is
+    empty callers stop retrying and fall back, so a throttled backend sees
+    a bounded amount of retry traffic no matter how many users are active.
+    """
+
+    def __init__(self, capacity=10, refill_per_second=0.2):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take one retry token. Returns False if the budget is exhausted."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class RateLimiter:
+    """
+    Blocking token bucket for outgoing traffic with a fixed allowance.
+
+    acquire(n) waits until n units fit under the rate, so a loop sending
+    batches never exceeds `rate` units per second on average, with bursts
+    of at most `burst` units. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, self.rate))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1):
+        """
+        Take n units, sleeping as long as needed.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Go into debt for batches larger than the burst; the wait pays it back
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker.
+
+    closed    -> calls pass through; consecutive transient failures are counted
+    open      -> calls are rejected immediately for reset_timeout seconds
+    half_open -> one probe call is let through; success closes, failure reopens
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        tracing.set_gauge("circuit_open", 0, backend=name)
+
+    def allow(self):
+        """Return True if a call may proceed now."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._leave_open("half_open")
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        """Mark a successful call."""
+        with self._lock:
+            if self.state == "open":
+                self._leave_open("closed")
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """Mark a transient failure; opens the circuit past the threshold."""
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.state = "open"
+                    self._opened_at = time.monotonic()
+                    tracing.incr("circuit_opened_total", backend=self.name)
+                    tracing.set_gauge("circuit_open", 1, backend=self.name)
+                self._probing = False
+
+    def open_seconds(self):
+        """Seconds the circuit has currently been open (0 if not open)."""
+        with self._lock:
+            return time.monotonic() - self._opened_at if self.state == "open" else 0.0
+
+    def _leave_open(self, new_state):
+        # Caller holds the lock
+        tracing.incr("circuit_open_seconds_total", round(time.monotonic() - self._opened_at, 3), backend=self.name)
+        tracing.set_gauge("circuit_open", 0, backend=self.name)
+        self.state = new_state
+
+
+RETRY_BUDGET = RetryBudget()
+
+BREAKERS = {
+    "sheets": CircuitBreaker("sheets", failure_threshold=3, reset_timeout=60),
+    "groq": CircuitBreaker("groq", failure_threshold=3, reset_timeout=30),
+}
+
+
+def get_breaker(name):
+    """Return the shared circuit breaker for a backend, creating it if needed."""
+    breaker = BREAKERS.get(name)
+    if breaker is None:
+        breaker = BREAKERS.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def call_with_retry(func, backend, retries=2, base_delay=0.5, max_delay=4.0, budget=None):
+    """
+    Call func() with jittered exponential backoff behind the backend's circuit breaker.
+
+    Args:
+        func: Zero-argument callable performing the backend request
+        backend: Breaker name ("sheets" or "groq")
+        retries: Maximum retry attempts after the first call
+        base_delay: Backoff base in seconds
+        max_delay: Upper bound for a single sleep in seconds
+        budget: RetryBudget to draw from (defaults to the process-wide budget)
+
+    Returns:
+        The result of func()
+
+    Raises:
+        CircuitOpenError: If the circuit is open (or opens while retrying)
+        Exception: The last error if it is not transient or retries run out
+    """
+    breaker = get_breaker(backend)
+    budget = budget or RETRY_BUDGET
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            tracing.incr("circuit_rejected_total", backend=backend)
+            raise CircuitOpenError(f"{backend} circuit is open")
+        try:
+            result = func()
+        except Exception as e:
+            if not is_transient(e):
+                # The backend answered; the error is ours (auth, bad request)
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt >= retries:
+                raise
+            if not budget.try_acquire():
+                tracing.incr("retry_budget_exhausted_total", backend=backend)
+                raise
+            # Full jitter keeps sessions from retrying in lockstep
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+            tracing.incr("retries_total", backend=backend)
+            attempt += 1
+        else:
+            breaker.record_success()
+            return result
+
+
+def resilient(backend, retries=2, base_delay=0.5, max_delay=4.0, fallback=None):
+    """
+    Decorator form of call_with_retry().
+
+    Args:
+        backend: Breaker name ("sheets" or "groq")
+        retries: Maximum retry attempts after the first call
+        base_delay: Backoff base in seconds
+        max_delay: Upper bound for a single sleep in seconds
+        fallback: Optional callable(*args, **kwargs) used instead of raising
+            when the circuit is open or a transient error persists
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return call_with_retry(lambda: func(*args, **kwargs), backend, retries, base_delay, max_delay)
+            except Exception as e:
+                if fallback is not None and is_transient(e):
+                    return fallback(*args, **kwargs)
+                raise
+        return wrapper
+    return decorator
@@ -0,0 +1,257 @@
+"""
+Declarative risk-scoring rules (SCRS) loaded from JSON or YAML.
+
+A rule set lists factors, each with ordered tiers ("first match wins"), plus
+the score bands that map a total to a risk level. At load time every rule
+set is compiled into two plain Python functions: a scalar scorer for one
+patient and a numpy scorer for whole columns. Rule sets live in rules/ as
+<version>.json (or .yaml) and the active one is chosen with the RULESET
+setting, so each stored score can record the version that produced it.
+"""
+
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from src import config
+
+HAS_YAML = False
+try:
+    import yaml
+    HAS_YAML = True
+except ImportError:
+    # YAML rule files disabled - JSON still works
+    pass
+
+DEFAULT_VERSION = "scrs-1"
+
+# Inputs a condition may test; risk_factors counts labelled factors matched so far
+FIELDS = ("age", "bmi", "sugar", "sys_bp", "dia_bp", "sleep_hours", "risk_factors")
+OPERATORS = ("<", "<=", ">", ">=", "==", "!=")
+
+_cache = {}
+_cache_lock = threading.Lock()
+_active = None
+
+
+class RuleError(ValueError):
+    """Raised when a rule file is missing or malformed."""
+
+
+def rules_dir():
+    """Folder holding the rule set files (RULES_DIR setting, default ./rules)."""
+    default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules")
+    return config.get_setting("RULES_DIR") or default
+
+
+def _condition(spec, vectorized, where):
+    """Python expression source for a condition."""
+    if not isinstance(spec, dict):
+        raise RuleError(f"{where}: condition must be an object")
+    for combinator, joiner in (("any", " | " if vectorized else " or "), ("all", " & " if vectorized else " and ")):
+        if combinator in spec:
+            parts = spec[combinator]
+            if not isinstance(parts, list) or not parts:
+                raise RuleError(f"{where}: '{combinator}' needs a non-empty list")
+            return "(" + joiner.join(_condition(p, vectorized, where) for p in parts) + ")"
+    field, op, value = spec.get("field"), spec.get("op"), spec.get("value")
+    if field not in FIELDS:
+        raise RuleError(f"{where}: unknown field {field!r} (expected one of {', '.join(FIELDS)})")
+    if op not in OPERATORS:
+        raise RuleError(f"{where}: unknown operator {op!r}")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleError(f"{where}: value must be a number, got {value!r}")
+    if not math.isfinite(value):
+        raise RuleError(f"{where}: value must be finite, got {value!r}")
+    number = int(value) if float(value).is_integer() else float(value)
+    if vectorized:
+        return f"({field} {op} {number!r})"
+    if field == "risk_factors":
+        return f"(len(factors) {op} {number!r})"
+    if field == "sleep_hours":
+        # Optional input: None (not recorded) never matches, like NaN in score_batch
+        return f"(sleep_hours is not None and sleep_hours {op} {number!r})"
+    return f"({field} {op} {number!r})"
+
+
+def _compile(spec):
+    """Generate and compile the scalar and vectorized scorers for a rule set."""
+    def text(value):
+        # repr() of a str is always a plain literal, so labels cannot inject code
+        return repr(value)
+
+    scalar = [
+        "def score(age, bmi, sugar, sys_bp, dia_bp, sleep_hours=None):",
+        "    score = 0",
+        "    factors = []",
+    ]
+    vector = [
+        "def score_batch(age, bmi, sugar, sys_bp, dia_bp, sleep_hours=None):",
+        "    age, bmi, sugar = _np.asarray(age, dtype=float), _np.asarray(bmi, dtype=float), _np.asarray(sugar, dtype=float)",
+        "    sys_bp, dia_bp = _np.asarray(sys_bp, dtype=float), _np.asarray(dia_bp, dtype=float)",
+        "    sleep_hours = _np.full(age.shape, _nan) if sleep_hours is None else _np.asarray(sleep_hours, dtype=float)",
+        "    score = _np.zeros(age.shape, dtype=int)",
+        "    risk_factors = _np.zeros(age.shape, dtype=int)",
+    ]
+
+    factors = spec.get("factors")
+    if not isinstance(factors, list) or not factors:
+        raise RuleError("rule set needs a non-empty 'factors' list")
+    for f_index, factor in enumerate(factors):
+        if not isinstance(factor, dict):
+            raise RuleError(f"factor {f_index + 1}: must be an object")
+        name = factor.get("name", f"factor {f_index + 1}")
+        tiers = factor.get("tiers")
+        if not isinstance(tiers, list) or not tiers:
+            raise RuleError(f"factor {name!r}: needs a non-empty 'tiers' list")
+        conditions, points, labelled = [], [], []
+        for t_index, tier in enumerate(tiers):
+            where = f"factor {name!r} tier {t_index + 1}"
+            if not isinstance(tier, dict):
+                raise RuleError(f"{where}: must be an object")
+            if not isinstance(tier.get("points"), int):
+                raise RuleError(f"{where}: 'points' must be an integer")
+            label = tier.get("label")
+            keyword = "if" if t_index == 0 else "elif"
+            scalar.append(f"    {keyword} {_condition(tier.get('when'), False, where)}:")
+            scalar.append(f"        score += {tier['points']}")
+            if label:
+                scalar.append(f"        factors.append({text(str(label))})")
+            conditions.append(_condition(tier.get("when"), True, where))
+            points.append(tier["points"])
+            labelled.append(1 if label else 0)
+        # Conditions are evaluated before adding, so later factors see earlier ones only
+        vector.append(f"    _conds = [{', '.join(conditions)}]")
+        vector.append(f"    score = score + _np.select(_conds, {points!r}, 0)")
+        if any(labelled):
+            vector.append(f"    risk_factors = risk_factors + _np.select(_conds, {labelled!r}, 0)")
+
+    levels = spec.get("levels")
+    if not isinstance(levels, list) or not levels or "max_score" in levels[-1]:
+        raise RuleError("'levels' must be a list whose last entry has no max_score")
+    bands = []
+    for level in levels:
+        if "label" not in level:
+            raise RuleError("every level needs a 'label'")
+        bands.append((level.get("max_score"), text(str(level["label"])), text(str(level.get("color", "gray")))))
+    for max_score, label, color in bands[:-1]:
+        scalar.append(f"    if score <= {int(max_score)}:")
+        scalar.append(f"        return score, {label}, {color}, factors")
+    scalar.append(f"    return score, {bands[-1][1]}, {bands[-1][2]}, factors")
+    conditions = ", ".join(f"score <= {int(m)}" for m, _, _ in bands[:-1])
+    choices = ", ".join(label for _, label, _ in bands[:-1])
+    vector.append(f"    labels = _np.select([{conditions}], [{choices}], {bands[-1][1]}).astype(object)")
+    vector.append("    return score, labels")
+
+    namespace = {"_np": np, "_nan": float("nan")}
+    exec(compile("\n".join(scalar) + "\n\n" + "\n".join(vector) + "\n", f"<rules {spec.get('version')}>", "exec"),
+         namespace)
+    return namespace["score"], namespace["score_batch"]
+
+
+class RuleSet:
+    """
+    A compiled rule set.
+
+    Attributes:
+        version: Identifier stored with every score (e.g., "scrs-1")
+        name: Human-readable description
+        score: score(age, bmi, sugar, sys_bp, dia_bp, sleep_hours=None) for one
+            patient -> (score, risk level label, color, list of risk factor labels)
+        score_batch: Same signature over arrays (NaN sleep_hours = not recorded)
+            -> (scores int array, labels object array)
+    """
+
+    def __init__(self, spec):
+        if not spec.get("version"):
+            raise RuleError("rule set needs a 'version'")
+        self.version = str(spec["version"])
+        self.name = spec.get("name", self.version)
+        self.spec = spec
+        # Generated functions are bound directly so scoring adds no call layer
+        self.score, self.score_batch = _compile(spec)
+
+
+def load(path):
+    """
+    Load and compile a rule file (.json, or .yaml/.yml when PyYAML is installed).
+
+    Args:
+        path: Rule file path
+
+    Returns:
+        RuleSet
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                if not HAS_YAML:
+                    raise RuleError(f"{path}: install PyYAML to use YAML rule files")
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+    except OSError as e:
+        raise RuleError(f"cannot read rule file {path}: {e}")
+    except ValueError as e:
+        raise RuleError(f"{path}: {e}")
+    if not isinstance(spec, dict):
+        raise RuleError(f"{path}: expected an object at the top level")
+    return RuleSet(spec)
+
+
+def _path(version):
+    for extension in (".json", ".yaml", ".yml"):
+        path = os.path.join(rules_dir(), version + extension)
+        if os.path.exists(path):
+            return path
+    raise RuleError(f"no rule file for version {version!r} in {rules_dir()}")
+
+
+def get(version=None):
+    """
+    Return a compiled rule set by version (cached after the first load).
+
+    Args:
+        version: Rule set version; None means the active one
+
+    Returns:
+        RuleSet
+    """
+    if not version:
+        return _active or active()
+    ruleset = _cache.get(version)
+    if ruleset is None:
+        with _cache_lock:
+            ruleset = _cache.get(version)
+            if ruleset is None:
+                ruleset = load(_path(version))
+                if ruleset.version != version:
+                    raise RuleError(f"{_path(version)} declares version {ruleset.version!r}")
+                _cache[version] = ruleset
+    return ruleset
+
+
+def active():
+    """
+    Rule set used for new scores (RULESET setting, read once per process).
+
+    Returns:
+        RuleSet
+    """
+    global _active
+    if _active is None:
+        _active = get(config.get_setting("RULESET", DEFAULT_VERSION))
+    return _active
+
+
+def available():
+    """Versions of all rule files in rules_dir(), sorted."""
+    try:
+        names = os.listdir(rules_dir())
+    except OSError:
+        return []
+    versions = {os.path.splitext(n)[0] for n in names if n.endswith((".json", ".yaml", ".yml"))}
+    return sorted(versions)
@@ -0,0 +1,363 @@
+"""
+Background job runner for cache warmup and nightly maintenance.
+
+Without it, every bit of work happens inside a user's rerun, and the first
+user after a cache expiry pays for the full sheet read. The scheduler runs
+jobs on a daemon thread of the app process (or as a sidecar,
+`python -m src.scheduler`):
+
+    warm_history      every WARMUP_INTERVAL seconds (default 80% of
+                      SNAPSHOT_TTL): re-read the sheet before the cached copy
+                      expires and rebuild the search index
+    followup_list     nightly: queue reminders for due follow-ups (outbox)
+    forecast_refresh  nightly: fold the full history into patient summaries,
+                      forecasts and vital baselines
+    archive_rotation  nightly: move visits past the hot window to the archive
+
+Each run claims its time slot in the local SQLite file (swasthya_local.db)
+before starting, so several app processes on one host, or an app and a
+sidecar, never run the same slot twice. Runs, their duration and outcome are
+kept there for the admin panel. A nightly job whose time passed while no
+process was running catches up within NIGHTLY_CATCHUP_HOURS.
+
+Settings:
+    SCHEDULER_ENABLED:     Start the in-app scheduler (default true)
+    WARMUP_INTERVAL:       Seconds between history refreshes
+    NIGHTLY_AT:            Local time of the nightly jobs, "HH:MM" (default "02:00")
+    NIGHTLY_CATCHUP_HOURS: Run a missed nightly job this long after its time (default 6)
+    REMINDER_LANGUAGE:     Language of nightly reminders (default English)
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from src import config, database, outbox, snapshot, tracing
+
+WARMUP_INTERVAL = float(config.get_setting("WARMUP_INTERVAL", 0) or 0.8 * float(config.get_setting("SNAPSHOT_TTL", 600)))
+NIGHTLY_AT = str(config.get_setting("NIGHTLY_AT", "02:00"))
+CATCHUP_HOURS = float(config.get_setting("NIGHTLY_CATCHUP_HOURS", 6))
+REMINDER_LANGUAGE = config.get_setting("REMINDER_LANGUAGE", "English")
+
+RUNNING, OK, ERROR = "running", "ok", "error"
+
+# A run still marked running after this long belonged to a process that died
+STALE_RUN = 3600.0
+
+# Longest sleep between checks for due jobs
+MAX_TICK = 30.0
+
+# Runs kept per job
+KEEP_RUNS = 50
+
+_stores = {}
+_stores_lock = threading.Lock()
+_thread = None
+_thread_lock = threading.Lock()
+
+
+class Job:
+    """
+    A named job on an interval or at a daily time.
+
+    Args:
+        name: Job name
+        func: Zero-argument callable; its return value is recorded as the run's detail
+        every: Seconds between runs (interval job)
+        at: Local time "HH:MM" (daily job)
+        shared: One run per slot across all processes on the host (False: one per process)
+        description: Shown in the admin panel
+    """
+
+    def __init__(self, name, func, every=None, at=None, shared=True, description=""):
+        if (every is None) == (at is None):
+            raise ValueError("a job runs either every N seconds or daily at HH:MM")
+        self.name = name
+        self.func = func
+        self.every = float(every) if every is not None else None
+        self.at = datetime.strptime(at, "%H:%M").time() if at is not None else None
+        self.shared = shared
+        self.description = description
+
+    @property
+    def schedule(self):
+        return f"every {self.every:g}s" if self.every else f"daily at {self.at:%H:%M}"
+
+    def slot(self, now):
+        """
+        Time slot due at `now`, or None if the job is not due.
+
+        Interval jobs have one slot per multiple of `every` since the epoch, so
+        every process agrees on the slot; a daily job's slot is its date, due
+        from its time until CATCHUP_HOURS later.
+        """
+        if self.every:
+            slot = str(int(now // self.every))
+            return slot if self.shared else f"{slot}@{os.getpid()}"
+        moment = datetime.fromtimestamp(now)
+        scheduled = datetime.combine(moment.date(), self.at)
+        if moment < scheduled:
+            scheduled -= timedelta(days=1)
+        if moment - scheduled > timedelta(hours=CATCHUP_HOURS):
+            return None
+        return scheduled.strftime("%Y-%m-%d")
+
+    def next_run(self, now):
+        """Epoch seconds of the job's next slot after the current one."""
+        if self.every:
+            return (now // self.every + 1) * self.every
+        moment = datetime.fromtimestamp(now)
+        scheduled = datetime.combine(moment.date(), self.at)
+        if scheduled <= moment:
+            scheduled += timedelta(days=1)
+        return scheduled.timestamp()
+
+
+def _followup_list():
+    return outbox.queue_due(language=REMINDER_LANGUAGE)
+
+
+def _archive_rotation():
+    return {"archived": database.archive_old_records()}
+
+
+def default_jobs():
+    """The app's jobs, in the order they run when due together."""
+    return [
+        # Without snapshots each process caches its own copy, so each warms its own
+        Job("warm_history", database.refresh_history, every=WARMUP_INTERVAL, shared=snapshot.HAS_PYARROW,
+            description="Re-read the sheet before the cache expires; rebuild the search index"),
+        Job("followup_list", _followup_list, at=NIGHTLY_AT,
+            description="Queue reminders for due follow-ups"),
+        Job("forecast_refresh", database.refresh_summaries, at=NIGHTLY_AT,
+            description="Update patient summaries, forecasts and vital baselines from the full history"),
+        Job("archive_rotation", _archive_rotation, at=NIGHTLY_AT,
+            description="Move visits past the hot window to the archive"),
+    ]
+
+
+class JobStore:
+    """
+    SQLite log of job runs; a run's (job, slot) row is also its claim.
+
+    Args:
+        path: Database file path (":memory:" for a throwaway store)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_runs (id INTEGER PRIMARY KEY AUTOINCREMENT, job TEXT NOT NULL, "
+                "slot TEXT NOT NULL, status TEXT NOT NULL, started_at REAL, duration REAL, detail TEXT, "
+                "UNIQUE (job, slot))"
+            )
+
+    def claim(self, job, slot):
+        """
+        Claim a job's slot.
+
+        Returns:
+            int: Run ID, or None if another run (in any process) already claimed the slot
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO job_runs (job, slot, status, started_at) VALUES (?, ?, ?, ?)",
+                (job, slot, RUNNING, time.time()))
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def finish(self, run_id, status, duration, detail=None):
+        """Record a run's outcome and drop the job's runs beyond KEEP_RUNS."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE job_runs SET status = ?, duration = ?, detail = ? WHERE id = ?",
+                               (status, duration, detail, run_id))
+            (job,) = self._conn.execute("SELECT job FROM job_runs WHERE id = ?", (run_id,)).fetchone()
+            self._conn.execute(
+                "DELETE FROM job_runs WHERE job = ? AND id <= "
+                "(SELECT id FROM job_runs WHERE job = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (job, job, KEEP_RUNS))
+
+    def runs(self, job=None, limit=20):
+        """
+        Latest runs, newest first.
+
+        Returns:
+            pandas.DataFrame: Job, Slot, Status, Started, Duration_s, Detail
+        """
+        where, params = ("WHERE job = ?", (job,)) if job else ("", ())
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job, slot, status, started_at, duration, detail FROM job_runs {where} "
+                f"ORDER BY id DESC LIMIT ?", params + (int(limit),)).fetchall()
+        df = pd.DataFrame(rows, columns=["Job", "Slot", "Status", "Started", "Duration_s", "Detail"])
+        stale = (df["Status"] == RUNNING) & (df["Started"] < time.time() - STALE_RUN)
+        df.loc[stale, "Status"] = "interrupted"
+        df["Started"] = pd.to_datetime(df["Started"], unit="s", utc=True).dt.tz_convert(None)
+        df["Duration_s"] = pd.to_numeric(df["Duration_s"]).round(2)
+        return df
+
+    def last_runs(self):
+        """Latest run of every job: {job: (status, started_at, duration, detail)}."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job, status, started_at, duration, detail FROM job_runs WHERE id IN "
+                "(SELECT MAX(id) FROM job_runs GROUP BY job)").fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+
+def get_store(path=None):
+    """
+    Return the process-wide JobStore for a database file.
+
+    Args:
+        path: Database file (defaults to DATA_DIR/swasthya_local.db, shared with local_store)
+
+    Returns:
+        JobStore
+    """
+    path = path or config.data_path("swasthya_local.db")
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = JobStore(path)
+    return store
+
+
+def run_job(job, slot=None, store=None):
+    """
+    Claim a slot and run one job, recording its outcome.
+
+    Args:
+        job: Job to run
+        slot: Slot to claim (default: a manual run at the current time)
+        store: JobStore (default: this device's)
+
+    Returns:
+        dict: status, duration and detail, or None if the slot was already claimed
+    """
+    store = store or get_store()
+    run_id = store.claim(job.name, slot or f"manual-{time.time():.3f}")
+    if run_id is None:
+        return None
+    start = time.perf_counter()
+    try:
+        with tracing.span(f"job_{job.name}"):
+            detail = job.func()
+        status = OK
+    except Exception as e:
+        tracing.incr("job_errors_total", job=job.name)
+        status, detail = ERROR, f"{type(e).__name__}: {e}"
+    duration = time.perf_counter() - start
+    detail = detail if isinstance(detail, str) else json.dumps(detail, default=str)
+    store.finish(run_id, status, duration, detail)
+    tracing.set_gauge("job_last_duration_seconds", round(duration, 3), job=job.name)
+    return {"status": status, "duration": duration, "detail": detail}
+
+
+def run_due(jobs=None, now=None, store=None):
+    """
+    Run every job whose current slot nobody has claimed yet.
+
+    Returns:
+        dict: {job name: run result} for the jobs that ran
+    """
+    now = time.time() if now is None else now
+    results = {}
+    for job in jobs if jobs is not None else default_jobs():
+        slot = job.slot(now)
+        if slot is not None:
+            result = run_job(job, slot, store)
+            if result is not None:
+                results[job.name] = result
+    return results
+
+
+def status(jobs=None, store=None, now=None):
+    """
+    Schedule and latest run of every job, for the admin panel.
+
+    Returns:
+        pandas.DataFrame: Job, Schedule, Last_Run, Status, Duration_s, Next_Run, Detail
+    """
+    now = time.time() if now is None else now
+    last = (store or get_store()).last_runs()
+    rows = []
+    for job in jobs if jobs is not None else default_jobs():
+        run_status, started, duration, detail = last.get(job.name, (None, None, None, None))
+        if run_status == RUNNING and started < now - STALE_RUN:
+            run_status = "interrupted"
+        rows.append({
+            "Job": job.name, "Schedule": job.schedule,
+            "Last_Run": datetime.fromtimestamp(started).strftime("%Y-%m-%d %H:%M:%S") if started else "",
+            "Status": run_status or "never run",
+            "Duration_s": round(duration, 2) if duration is not None else None,
+            "Next_Run": datetime.fromtimestamp(job.next_run(now)).strftime("%Y-%m-%d %H:%M:%S"),
+            "Detail": detail or "",
+        })
+    return pd.DataFrame(rows)
+
+
+def _loop(jobs):
+    while True:
+        try:
+            run_due(jobs)
+        except Exception:
+            tracing.incr("job_errors_total", job="scheduler")
+        now = time.time()
+        wake = min(job.next_run(now) for job in jobs)
+        time.sleep(min(MAX_TICK, max(1.0, wake - now)))
+
+
+def start(jobs=None):
+    """
+    Start the scheduler thread (once per process; no-op when SCHEDULER_ENABLED is off).
+
+    Returns:
+        bool: True if the thread is running
+    """
+    global _thread
+    if not config.get_flag("SCHEDULER_ENABLED", default=True):
+        return False
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_loop, args=(jobs or default_jobs(),),
+                                       name="swasthya-scheduler", daemon=True)
+            _thread.start()
+    return True
+
+
+def running():
+    """True while this process's scheduler thread is alive."""
+    return _thread is not None and _thread.is_alive()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the background jobs (cache warmup, nightly maintenance).")
+    parser.add_argument("--run", metavar="JOB", help="run one job now and exit")
+    parser.add_argument("--list", action="store_true", help="show jobs and their latest runs")
+    args = parser.parse_args(argv)
+    jobs = default_jobs()
+    if args.list:
+        print(status(jobs).to_string(index=False))
+        return
+    if args.run:
+        job = next((job for job in jobs if job.name == args.run), None)
+        if job is None:
+            parser.exit(1, f"scheduler: unknown job {args.run!r} (one of {', '.join(j.name for j in jobs)})\n")
+        result = run_job(job)
+        print(f"{job.name}: {result['status']} in {result['duration']:.2f}s {result['detail']}")
+        return
+    _loop(jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+In-memory patient search over stored visits.
+
+Finds returning patients by Patient ID or phone (exact) and by name (prefix
+on any word, then fuzzy), and builds cohorts by visit date and risk score
+range. The index is built once from the history and updated in place as
+visits are saved, so lookups take milliseconds even on large histories.
+"""
+
+import bisect
+import difflib
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Columns returned for each matching patient (latest visit wins)
+PROFILE_COLUMNS = ["Patient_ID", "Name", "Age", "Gender", "Phone", "Weight", "Height",
+                   "Risk_Score", "Label", "Last_Visit", "Visits"]
+
+# Fuzzy name matches below this similarity (0-1) are dropped
+FUZZY_CUTOFF = 0.6
+
+# Names compared in full for a fuzzy query, picked by shared trigrams
+FUZZY_CANDIDATES = 50
+
+
+def normalize_name(name):
+    """Lower-case a name and collapse whitespace ("  Rahul  SHARMA" -> "rahul sharma")."""
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ""
+    return " ".join(str(name).lower().split())
+
+
+def phone_digits(phone):
+    """Digits of a phone number; sheet values read as floats (9876543210.0) lose the ".0"."""
+    if phone is None or (isinstance(phone, float) and np.isnan(phone)):
+        return ""
+    if isinstance(phone, float) and phone.is_integer():
+        phone = int(phone)
+    return re.sub(r"\D", "", str(phone))
+
+
+def normalize_phone(phone):
+    """Last 10 digits of a phone number, so "+91 98765-43210" and 9876543210.0 match."""
+    return phone_digits(phone)[-10:]
+
+
+def _trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PatientIndex:
+    """
+    Search index over visits in sheet format.
+
+    Args:
+        history: pandas.DataFrame of visits (may be empty or None)
+    """
+
+    def __init__(self, history=None):
+        self._lock = threading.RLock()
+        self._profiles = {}      # Patient_ID -> latest demographics and visit stats
+        self._ids = {}           # upper-cased Patient_ID -> Patient_ID
+        self._last_seen = {}     # Patient_ID -> latest visit timestamp (ns), for ordering
+        self._by_phone = {}      # normalized phone -> {Patient_ID}
+        self._by_name = {}       # normalized name -> {Patient_ID}
+        self._name_keys = []     # sorted (name from word i onwards, name) for prefix search
+        self._grams = {}         # trigram -> {normalized name}
+        self._visit_pid = []     # visit number -> Patient_ID
+        self._dates, self._date_visits = [], []    # sorted visit timestamps (ns) / visit numbers
+        self._risks, self._risk_visits = [], []    # sorted risk scores / visit numbers
+        if history is not None and not history.empty:
+            self._build(history)
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def _build(self, history):
+        dates = pd.to_datetime(history["Date"], format="ISO8601", errors="coerce")
+        risks = pd.to_numeric(history["Risk_Score"], errors="coerce").to_numpy(dtype=float)
+        pids = history["Patient_ID"].astype(str).to_numpy()
+        stamps = dates.to_numpy(dtype="datetime64[ns]").view("int64")
+        self._visit_pid = pids.tolist()
+
+        dated = np.flatnonzero(dates.notna().to_numpy())
+        order = dated[np.argsort(stamps[dated], kind="stable")]
+        self._dates, self._date_visits = stamps[order].tolist(), order.tolist()
+        scored = np.flatnonzero(~np.isnan(risks))
+        order = scored[np.argsort(risks[scored], kind="stable")]
+        self._risks, self._risk_visits = risks[order].tolist(), order.tolist()
+
+        frame = history.assign(Last_Visit=dates.to_numpy(), Patient_ID=pids)
+        latest = frame.sort_values("Last_Visit", kind="stable", na_position="first").drop_duplicates(
+            "Patient_ID", keep="last")
+        visits = frame["Patient_ID"].value_counts()
+        for row in latest.to_dict("records"):
+            self._add_profile(row, row["Last_Visit"], int(visits[row["Patient_ID"]]), sort=False)
+        self._name_keys.sort()
+
+    def _add_profile(self, row, date, visits, sort=True):
+        pid = row["Patient_ID"]
+        self._profiles[pid] = {
+            **{c: row.get(c) for c in PROFILE_COLUMNS[1:-2]},
+            "Patient_ID": pid, "Last_Visit": date, "Visits": visits,
+        }
+        self._ids[pid.upper()] = pid
+        self._last_seen[pid] = date.value if not pd.isna(date) else -1
+        phone = normalize_phone(row.get("Phone"))
+        if phone:
+            self._by_phone.setdefault(phone, set()).add(pid)
+        name = normalize_name(row.get("Name"))
+        if name:
+            if name not in self._by_name:
+                self._by_name[name] = set()
+                words = name.split(" ")
+                for i in range(len(words)):
+                    if sort:
+                        bisect.insort(self._name_keys, (" ".join(words[i:]), name))
+                    else:
+                        self._name_keys.append((" ".join(words[i:]), name))
+                for gram in _trigrams(name):
+                    self._grams.setdefault(gram, set()).add(name)
+            self._by_name[name].add(pid)
+
+    def add(self, rows):
+        """
+        Index newly saved visits.
+
+        Args:
+            rows: pandas.DataFrame of visits in sheet format
+        """
+        with self._lock:
+            for row in rows.to_dict("records"):
+                pid = str(row["Patient_ID"])
+                row["Patient_ID"] = pid
+                date = pd.to_datetime(row.get("Date"), format="ISO8601", errors="coerce")
+                risk = pd.to_numeric(row.get("Risk_Score"), errors="coerce")
+                visit = len(self._visit_pid)
+                self._visit_pid.append(pid)
+                if not pd.isna(date):
+                    position = bisect.bisect_right(self._dates, date.value)
+                    self._dates.insert(position, date.value)
+                    self._date_visits.insert(position, visit)
+                if not pd.isna(risk):
+                    position = bisect.bisect_right(self._risks, float(risk))
+                    self._risks.insert(position, float(risk))
+                    self._risk_visits.insert(position, visit)
+                previous = self._profiles.get(pid)
+                if previous is None:
+                    self._add_profile(row, date, 1)
+                elif pd.isna(previous["Last_Visit"]) or (not pd.isna(date) and date >= previous["Last_Visit"]):
+                    self._add_profile(row, date, previous["Visits"] + 1)
+                else:
+                    previous["Visits"] += 1
+
+    def profile(self, patient_id):
+        """Latest demographics for a patient (dict of PROFILE_COLUMNS), or None."""
+        with self._lock:
+            pid = self._ids.get(str(patient_id).strip().upper())
+            return dict(self._profiles[pid]) if pid else None
+
+    def _frame(self, pids):
+        rows = [self._profiles[pid] for pid in pids]
+        return pd.DataFrame(rows, columns=PROFILE_COLUMNS)
+
+    def _prefix(self, name):
+        """Names having a word sequence that starts with name."""
+        position = bisect.bisect_left(self._name_keys, (name,))
+        matches = {}
+        while position < len(self._name_keys) and self._name_keys[position][0].startswith(name):
+            matches[self._name_keys[position][1]] = None
+            position += 1
+        return list(matches)
+
+    def _fuzzy(self, name):
+        """Names similar to name, best first, as (name, similarity)."""
+        counts = Counter()
+        for gram in _trigrams(name):
+            counts.update(self._grams.get(gram, ()))
+        scored = []
+        for candidate, _ in counts.most_common(FUZZY_CANDIDATES):
+            ratio = difflib.SequenceMatcher(None, name, candidate).ratio()
+            if ratio >= FUZZY_CUTOFF:
+                scored.append((candidate, ratio))
+        return sorted(scored, key=lambda item: -item[1])
+
+    def _by_recency(self, pids):
+        return sorted(pids, key=self._last_seen.__getitem__, reverse=True)
+
+    def _match_name(self, name):
+        """Patient IDs for a name query: prefix matches, then fuzzy ones."""
+        pids = self._by_recency({pid for full in self._prefix(name) for pid in self._by_name[full]})
+        seen = set(pids)
+        for full, _ in self._fuzzy(name):
+            for pid in self._by_recency(self._by_name[full] - seen):
+                pids.append(pid)
+                seen.add(pid)
+        return pids
+
+    def find(self, query, limit=10):
+        """
+        Look up a returning patient.
+
+        A query matching a Patient ID returns that patient; a query without
+        letters is matched exactly against phone numbers; anything else is
+        a name (prefix on any word first, then fuzzy matches).
+
+        Args:
+            query: Patient ID, phone number or (part of a) name
+            limit: Maximum number of patients returned
+
+        Returns:
+            pandas.DataFrame: PROFILE_COLUMNS, best matches first
+        """
+        query = str(query or "").strip()
+        with self._lock:
+            if not query:
+                return self._frame([])
+            pid = self._ids.get(query.upper())
+            if pid:
+                return self._frame([pid])
+            if not re.search(r"[^\W\d_]", query):
+                return self._frame(self._by_recency(self._by_phone.get(normalize_phone(query), ()))[:limit])
+            return self._frame(self._match_name(normalize_name(query))[:limit])
+
+    def _visits_in(self, keys, visits, low, high):
+        start = 0 if low is None else bisect.bisect_left(keys, low)
+        stop = len(keys) if high is None else bisect.bisect_right(keys, high)
+        return set(visits[start:stop])
+
+    def cohort(self, start_date=None, end_date=None, min_risk=None, max_risk=None, name=None, limit=None):
+        """
+        Patients with at least one visit matching every given range.
+
+        Args:
+            start_date, end_date: Visit date range (inclusive; None = open)
+            min_risk, max_risk: Risk score range of that same visit (inclusive)
+            name: Optional name query narrowing the cohort (as in find)
+            limit: Maximum number of patients returned
+
+        Returns:
+            pandas.DataFrame: PROFILE_COLUMNS, most recent visit first
+        """
+        with self._lock:
+            visits = None
+            if start_date is not None or end_date is not None:
+                low = None if start_date is None else pd.Timestamp(start_date).value
+                high = None if end_date is None else pd.Timestamp(end_date).value
+                visits = self._visits_in(self._dates, self._date_visits, low, high)
+            if min_risk is not None or max_risk is not None:
+                matched = self._visits_in(self._risks, self._risk_visits, min_risk, max_risk)
+                visits = matched if visits is None else visits & matched
+            pids = set(self._profiles) if visits is None else {self._visit_pid[v] for v in visits}
+            if name:
+                pids = [pid for pid in self._match_name(normalize_name(name)) if pid in pids]
+            else:
+                pids = self._by_recency(pids)
+            return self._frame(pids[:limit])
@@ -0,0 +1,259 @@
+"""
+Shared Google Sheets client layer.
+
+Every sheet call of this process goes through here, from user sessions, the
+reconciler and the scheduler alike:
+
+- Coalescing: identical calls in flight at the same moment run once; the
+  other callers wait for that call and share its result (or its error). A
+  burst of sessions missing the cache together costs one upstream read.
+  Writes start a new generation for their worksheet, so reads issued after
+  a write never join a read that started before it.
+- Quota: upstream reads (ttl=0) and writes are paced by token buckets sized
+  to the Sheets API quota (60 reads and 60 writes per minute per user by
+  default) and counted in sheets_requests_total. Cached reads (ttl>0) may be
+  served by the connection without an API call, so they are neither paced
+  nor counted there.
+- Pooling: the connection's HTTP session keeps up to SHEETS_POOL_SIZE
+  keep-alive connections, so parallel reads reuse sockets instead of opening
+  (and discarding) new ones.
+- Batches: read_many() reads several worksheets in parallel.
+
+Settings:
+    SHEETS_READ_RATE:  Upstream reads per second (default 1)
+    SHEETS_WRITE_RATE: Upstream writes per second (default 1)
+    SHEETS_BURST:      Calls let through back to back before pacing (default 5)
+    SHEETS_POOL_SIZE:  Keep-alive HTTP connections per host (default 20)
+    SHEETS_WORKERS:    Parallel reads in read_many (default 4)
+"""
+
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from src import config, tracing
+from src.resilience import RateLimiter
+
+HAS_REQUESTS = False
+try:
+    from requests.adapters import HTTPAdapter
+    HAS_REQUESTS = True
+except ImportError:
+    # Connections keep the HTTP library's default pool
+    pass
+
+READ_RATE = float(config.get_setting("SHEETS_READ_RATE", 1))
+WRITE_RATE = float(config.get_setting("SHEETS_WRITE_RATE", 1))
+BURST = float(config.get_setting("SHEETS_BURST", 5))
+POOL_SIZE = int(config.get_setting("SHEETS_POOL_SIZE", 20))
+WORKERS = int(config.get_setting("SHEETS_WORKERS", 4))
+
+
+class _Call:
+    """One in-flight call and the outcome its waiters share."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+
+    A caller arriving while a call with the same key is running waits for it
+    and gets the same result (or exception) instead of starting another. Once
+    the call returns, the next caller with that key starts a new one; nothing
+    is cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Call func() unless an identical call is already running.
+
+        Args:
+            key: Hashable call identity; key[0] names the call in metrics
+            func: Function of no arguments
+
+        Returns:
+            Whatever func returns (shared by every caller of this flight)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            tracing.incr("sheets_coalesced_total", call=key[0])
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_flight = SingleFlight()
+_limiters = {"read": RateLimiter(READ_RATE, BURST), "write": RateLimiter(WRITE_RATE, BURST)}
+
+# Per-worksheet write generation; part of every read's coalescing key
+_generations = defaultdict(int)
+_generations_lock = threading.Lock()
+
+# Connections whose HTTP session already has the larger pool
+_pooled = set()
+_pooled_lock = threading.Lock()
+
+
+def coalesce(key, func):
+    """
+    Run func() once for all concurrent callers with the same key.
+
+    For work built on top of a sheet read (parsing, mirroring, publishing
+    the snapshot) that should also happen once per burst.
+
+    Args:
+        key: Hashable tuple; key[0] names the call in metrics
+        func: Function of no arguments
+    """
+    return _flight.do(key, func)
+
+
+def generation(worksheet):
+    """Writes started on a worksheet so far (twice per write); part of coalescing keys."""
+    with _generations_lock:
+        return _generations[worksheet]
+
+
+def _bump(worksheet):
+    with _generations_lock:
+        _generations[worksheet] += 1
+
+
+def _quota(kind, op):
+    """Wait for the quota, then count the upstream call."""
+    waited = _limiters[kind].acquire()
+    if waited:
+        tracing.incr("sheets_quota_wait_seconds_total", waited, kind=kind)
+    tracing.incr("sheets_requests_total", op=op)
+
+
+def pool(conn):
+    """
+    Give the connection's HTTP session a keep-alive pool of SHEETS_POOL_SIZE.
+
+    Only service-account connections (gspread over requests) have a session to
+    size; others are left alone. Done once per connection.
+
+    Args:
+        conn: Google Sheets connection
+
+    Returns:
+        bool: True if the session's pool was resized now
+    """
+    if not HAS_REQUESTS or POOL_SIZE <= 0:
+        return False
+    with _pooled_lock:
+        if id(conn) in _pooled:
+            return False
+        _pooled.add(id(conn))
+    try:
+        gspread_client = getattr(getattr(conn, "client", None), "_optional_client", None)
+        session = getattr(gspread_client, "session", None)
+        if session is None or not hasattr(session, "mount"):
+            return False
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        session.mount("https://", adapter)
+        return True
+    except Exception:
+        tracing.incr("sheets_pool_errors_total")
+        return False
+
+
+def read(conn, worksheet, ttl=0):
+    """
+    Read a worksheet, joining an identical read that is already running.
+
+    Args:
+        conn: Google Sheets connection
+        worksheet: Worksheet name
+        ttl: Seconds the connection may serve its own cached copy (0 = upstream;
+            only upstream reads wait for and count against the read quota)
+
+    Returns:
+        pandas.DataFrame: Worksheet contents as returned by the connection
+    """
+    def call():
+        if not ttl:
+            _quota("read", "read")
+        return conn.read(worksheet=worksheet, ttl=ttl)
+
+    return _flight.do(("read", id(conn), worksheet, ttl, generation(worksheet)), call)
+
+
+def read_many(conn, worksheets, ttl=0, max_workers=None):
+    """
+    Read several worksheets in parallel.
+
+    Args:
+        conn: Google Sheets connection
+        worksheets: Worksheet names
+        ttl: As in read()
+        max_workers: Parallel reads (default SHEETS_WORKERS)
+
+    Returns:
+        tuple: ({worksheet: DataFrame}, {worksheet: exception}) for the
+        worksheets that could and could not be read
+    """
+    worksheets = list(dict.fromkeys(worksheets))
+    results, errors = {}, {}
+    if not worksheets:
+        return results, errors
+    workers = max(1, min(max_workers or WORKERS, len(worksheets)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="swasthya-sheets") as executor:
+        futures = {ws: executor.submit(read, conn, ws, ttl) for ws in worksheets}
+        for ws, future in futures.items():
+            try:
+                results[ws] = future.result()
+            except Exception as e:
+                errors[ws] = e
+    return results, errors
+
+
+def write(conn, worksheet, data, create=False):
+    """
+    Replace a worksheet's contents (or create it).
+
+    Args:
+        conn: Google Sheets connection
+        worksheet: Worksheet name
+        data: DataFrame to write
+        create: Create the worksheet instead of updating it
+
+    Returns:
+        Whatever the connection returns
+    """
+    op = "create" if create else "update"
+    _bump(worksheet)
+    try:
+        _quota("write", op)
+        if create:
+            return conn.create(worksheet=worksheet, data=data)
+        return conn.update(worksheet=worksheet, data=data)
+    finally:
+        # Reads issued while the write ran must not be joined by later readers either
+        _bump(worksheet)
+
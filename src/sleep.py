@@ -0,0 +1,145 @@
+"""
+Sleep metrics: duration, mid-sleep point and chronotype from bed/wake times.
+
+Times can be hours (22 or 22.5), "HH:MM" strings or datetime.time values,
+one at a time or as arrays, so the sidebar and the population analytics use
+the same calculation.
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+EARLY_BIRD = "Early Bird (Lark)"
+INTERMEDIATE = "Intermediate"
+NIGHT_OWL = "Night Owl"
+
+# Mid-sleep hour (clock time) separating the chronotypes
+EARLY_BEFORE = 3.0
+LATE_AFTER = 5.5
+
+# Sleep-duration bands; < 6 and > 9 hours are the SCRS sleep risk factors
+BANDS = ["< 6 hrs", "6-7 hrs", "7-9 hrs", "> 9 hrs"]
+
+
+def _scalar_hours(value):
+    if isinstance(value, (datetime.time, datetime.datetime)):
+        return value.hour + value.minute / 60 + value.second / 3600
+    if isinstance(value, str):
+        hours, _, minutes = value.strip().partition(":")
+        try:
+            return float(hours) + (float(minutes[:2]) / 60 if minutes else 0.0)
+        except ValueError:
+            return np.nan
+    try:
+        return np.nan if value is None else float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def to_hours(times):
+    """
+    Convert clock times to fractional hours (22:30 -> 22.5).
+
+    Args:
+        times: A time or array-like of times (hours, "HH:MM" or datetime.time)
+
+    Returns:
+        float for a single time, else a float array; missing or invalid times
+        (including hours outside 0-24) are NaN
+    """
+    if np.ndim(times) == 0:
+        hours = _scalar_hours(times)
+        return hours if 0 <= hours < 24 else np.nan
+    try:
+        hours = np.asarray(times, dtype=float)
+    except (TypeError, ValueError):
+        # Mixed "HH:MM" strings / time objects: split on ":" column-wise
+        parts = pd.Series(list(times), dtype=object).astype(str).str.split(":", n=2, expand=True)
+        hours = pd.to_numeric(parts[0], errors="coerce").to_numpy(dtype=float)
+        for position, scale in ((1, 60), (2, 3600)):
+            if position in parts.columns:
+                extra = pd.to_numeric(parts[position], errors="coerce").fillna(0).to_numpy(dtype=float)
+                hours = hours + extra / scale
+    return np.where((hours >= 0) & (hours < 24), hours, np.nan)
+
+
+def metrics(bedtime, waketime):
+    """
+    Sleep duration, mid-sleep point and chronotype in one vectorized pass.
+
+    Sleep spanning midnight wraps around (22:30 -> 06:00 is 7.5 hours).
+
+    Args:
+        bedtime, waketime: Times or array-likes of times (see to_hours)
+
+    Returns:
+        tuple: (duration hours, mid-sleep clock hour, chronotype). Scalars for
+        single times, arrays otherwise; chronotype is None where a time is missing
+    """
+    bed, wake = to_hours(bedtime), to_hours(waketime)
+    single = np.ndim(bed) == 0 and np.ndim(wake) == 0
+    bed, wake = np.atleast_1d(bed), np.atleast_1d(wake)
+    duration = (wake - bed) % 24
+    mid_sleep = (bed + duration / 2) % 24
+    chronotype = np.select([mid_sleep < EARLY_BEFORE, mid_sleep > LATE_AFTER], [EARLY_BIRD, NIGHT_OWL],
+                           INTERMEDIATE).astype(object)
+    chronotype[np.isnan(duration)] = None
+    if single:
+        return float(duration[0]), float(mid_sleep[0]), chronotype[0]
+    return duration, mid_sleep, chronotype
+
+
+def summary(df):
+    """
+    Population sleep analytics over stored visits.
+
+    Sleep is recomputed from Bedtime/Waketime when present, otherwise taken
+    from Sleep_Hours/Chronotype; visits without sleep data are left out.
+
+    Args:
+        df: pandas.DataFrame in sheet format
+
+    Returns:
+        dict: visits (with sleep data), chronotypes (DataFrame: visits, mean sleep
+        hours and mean risk score per chronotype), bands (visits per sleep-duration
+        band), correlation (Pearson and Spearman of sleep hours vs Risk_Score);
+        None when no visit has sleep data
+    """
+    n = len(df)
+
+    def column(name):
+        if name not in df.columns:
+            return np.full(n, np.nan)
+        return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+
+    if "Bedtime" in df.columns and "Waketime" in df.columns:
+        hours, _, chronotype = metrics(df["Bedtime"].to_numpy(), df["Waketime"].to_numpy())
+    else:
+        hours, chronotype = np.full(n, np.nan), np.full(n, None, dtype=object)
+    if "Sleep_Hours" in df.columns:
+        missing = np.isnan(hours)
+        hours[missing] = column("Sleep_Hours")[missing]
+        if "Chronotype" in df.columns:
+            stored = df["Chronotype"].to_numpy(dtype=object)[missing]
+            chronotype[missing] = np.where(pd.notna(stored), stored, None)
+    has_sleep = ~np.isnan(hours)
+    if not has_sleep.any():
+        return None
+
+    frame = pd.DataFrame({"Sleep_Hours": hours, "Chronotype": chronotype,
+                          "Risk_Score": column("Risk_Score")})[has_sleep]
+    chronotypes = frame.groupby("Chronotype").agg(
+        visits=("Sleep_Hours", "size"), sleep_hours=("Sleep_Hours", "mean"), risk_score=("Risk_Score", "mean")
+    ).round(2)
+    sleep = frame["Sleep_Hours"].to_numpy()
+    band = np.select([sleep < 6, sleep < 7, sleep <= 9], [0, 1, 2], 3)
+    bands = pd.Series(np.bincount(band, minlength=len(BANDS)), index=BANDS)
+
+    scored = frame.dropna(subset=["Risk_Score"])
+    correlation = {"pearson": None, "spearman": None}
+    if len(scored) > 2 and scored["Sleep_Hours"].nunique() > 1 and scored["Risk_Score"].nunique() > 1:
+        correlation = {method: round(float(scored["Sleep_Hours"].corr(scored["Risk_Score"], method=method)), 3)
+                       for method in correlation}
+    return {"visits": int(has_sleep.sum()), "chronotypes": chronotypes, "bands": bands, "correlation": correlation}
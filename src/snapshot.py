@@ -0,0 +1,145 @@
+"""
+Shared, memory-mapped snapshot of the patient history (Arrow IPC).
+
+Every app process on a host maps the same read-only file instead of keeping
+its own pandas copy of the sheet:
+    DATA_DIR/snapshot/history-<generation>-<pid>.arrow
+    DATA_DIR/snapshot/CURRENT   -> {"generation": n, "file": ..., "published": ts}
+Writers publish a new file and then atomically replace CURRENT; readers
+notice the new generation on their next load and remap. Columns are exposed
+as Arrow-backed pandas columns, so the data stays in the shared page cache.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from src import archive, config, tracing
+
+HAS_PYARROW = False
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    # Snapshots disabled - each process keeps its own cached copy
+    pass
+
+# Older snapshot files kept around for readers that still map them
+KEEP_FILES = 3
+
+_mapped = {"token": None, "df": None}
+_mapped_lock = threading.Lock()
+
+
+def snapshot_dir():
+    """Folder holding the snapshot files."""
+    return config.data_path("snapshot", "")
+
+
+def _pointer_path():
+    return os.path.join(snapshot_dir(), "CURRENT")
+
+
+def current():
+    """
+    Read the pointer to the live snapshot.
+
+    Returns:
+        dict: generation, file and published time, or None if nothing is published
+    """
+    try:
+        with open(_pointer_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def generation():
+    """Generation number of the live snapshot (0 if none)."""
+    pointer = current()
+    return pointer["generation"] if pointer else 0
+
+
+def _map(path):
+    source = pa.memory_map(path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    # ArrowDtype columns wrap the mapped buffers without copying them
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def load(max_age=None):
+    """
+    Return the live snapshot as a DataFrame shared by all sessions of this process.
+
+    Args:
+        max_age: Ignore snapshots published more than this many seconds ago
+
+    Returns:
+        pandas.DataFrame: Read-only history, or None if no usable snapshot exists
+    """
+    if not HAS_PYARROW:
+        return None
+    pointer = current()
+    if pointer is None:
+        return None
+    if max_age is not None and time.time() - pointer["published"] > max_age:
+        return None
+    token = (pointer["generation"], pointer["file"])
+    with _mapped_lock:
+        if _mapped["token"] != token:
+            try:
+                with tracing.span("snapshot_map"):
+                    df = _map(os.path.join(snapshot_dir(), pointer["file"]))
+            except (OSError, pa.ArrowException):
+                return None
+            _mapped["token"], _mapped["df"] = token, df
+            tracing.set_gauge("snapshot_generation", pointer["generation"])
+        return _mapped["df"]
+
+
+def publish(df, columns):
+    """
+    Write a new snapshot and make it the live generation.
+
+    Args:
+        df: Current sheet contents
+        columns: Column order to store
+
+    Returns:
+        pandas.DataFrame: The published data, mapped from the new file
+    """
+    if not HAS_PYARROW:
+        return df
+    folder = snapshot_dir()
+    pointer = current()
+    gen = (pointer["generation"] if pointer else 0) + 1
+    name = f"history-{gen}-{os.getpid()}.arrow"
+    path = os.path.join(folder, name)
+    with tracing.span("snapshot_publish", rows=len(df)):
+        table = archive.to_table(df, columns)
+        tmp = path + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+        tmp = _pointer_path() + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"generation": gen, "file": name, "published": time.time()}, f)
+        os.replace(tmp, _pointer_path())  # the atomic swap readers observe
+    _cleanup(folder, name)
+    return load()
+
+
+def _cleanup(folder, live):
+    """Remove old snapshot files; ones still mapped elsewhere are skipped."""
+    files = sorted(glob.glob(os.path.join(folder, "history-*.arrow")), key=os.path.getmtime)
+    for path in files[:-KEEP_FILES]:
+        if os.path.basename(path) == live:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,242 @@
+"""
+Pre-aggregated per-patient summaries (SQLite, next to the local visit store).
+
+One row per patient holds the visit count, first and last visit, running
+count/sum/min/max of each vital, the last RECENT_VISITS visits and the
+forecast for the next visit. Rows are updated as visits are saved or read
+from the sheet, so the returning-patient view reads one small row instead
+of filtering the full history. The (Patient_ID, Date) of every folded visit
+is kept, so a visit is counted once however often it is passed in, and an
+older visit synced late by an offline device is still counted.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src import config, patient_tables, prediction
+
+# Vitals with running count/sum/min/max
+STAT_VITALS = ["Sugar", "Systolic_BP", "Diastolic_BP", "BMI", "Weight", "Risk_Score"]
+
+# Visit fields kept for the recent-visits window (enough for charts and forecasting)
+RECENT_COLUMNS = ["Date", "Age", "Weight", "BMI", "Sugar", "BP", "Risk_Score"]
+
+# Visit fields parsed from the sheet
+_VISIT_COLUMNS = ["Age", "Weight", "BMI", "Sugar", "Risk_Score", "BP"]
+
+# Visits kept per patient; the forecast is fitted on this window
+RECENT_VISITS = int(config.get_setting("SUMMARY_RECENT_VISITS", 20))
+
+_STAT_SUFFIXES = ["Count", "Sum", "Min", "Max"]
+_COLUMNS = (["Patient_ID", "Visits", "First_Visit", "Last_Visit"]
+            + [f"{v}_{s}" for v in STAT_VITALS for s in _STAT_SUFFIXES]
+            + ["Recent", "Forecast", "updated_at"])
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _json_value(value):
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+def _encode_forecast(trends):
+    if not trends:
+        return None
+    out = {k: _json_value(v) for k, v in trends.items() if k != "intervals"}
+    out["intervals"] = {k: list(v) for k, v in trends.get("intervals", {}).items()}
+    return json.dumps(out)
+
+
+def _decode_forecast(text):
+    if not text:
+        return None
+    trends = json.loads(text)
+    trends["intervals"] = {k: tuple(v) for k, v in trends.get("intervals", {}).items()}
+    if trends.get("Forecast_Date"):
+        trends["Forecast_Date"] = pd.Timestamp(trends["Forecast_Date"])
+    return trends
+
+
+class SummaryStore:
+    """
+    SQLite table with one summary row per patient.
+
+    Args:
+        path: Database file path (":memory:" for a throwaway store)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        stat_defs = ", ".join(f'"{v}_{s}" REAL' for v in STAT_VITALS for s in _STAT_SUFFIXES)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS patient_summary (Patient_ID TEXT PRIMARY KEY, Visits INTEGER, "
+                f"First_Visit TEXT, Last_Visit TEXT, {stat_defs}, Recent TEXT, Forecast TEXT, updated_at REAL)"
+            )
+            patient_tables.create_visit_table(self._conn, "summary_visit", "patient_summary")
+
+    def _unseen(self, new, existing):
+        """Visits not folded yet; only those dated at or before Last_Visit are looked up."""
+        maybe_seen = patient_tables.not_after_last(new, existing)
+        if not maybe_seen.any():
+            return new
+        drop = maybe_seen.copy()
+        drop[maybe_seen] = patient_tables.seen(self._conn, "summary_visit", new[maybe_seen])
+        return new[~drop]
+
+    def update(self, visits, known_only=False):
+        """
+        Fold visits into the summaries of their patients.
+
+        Visits already folded (same Patient_ID and Date) are skipped, so the
+        same sheet rows can be passed again without effect; visits older than
+        a patient's Last_Visit are still counted.
+
+        Args:
+            visits: pandas.DataFrame of visits in sheet format
+            known_only: Only update patients that already have a summary (used
+                for partial views such as the sheet without archived visits)
+
+        Returns:
+            int: Number of patient summaries written
+        """
+        new = patient_tables.visits(visits, _VISIT_COLUMNS)
+        if new.empty:
+            return 0
+        with self._lock, self._conn:
+            # Other app processes sharing the file wait here, so no visit is lost
+            self._conn.execute("BEGIN IMMEDIATE")
+            existing = patient_tables.load(self._conn, "patient_summary", _COLUMNS,
+                                           new["Patient_ID"].unique().tolist())
+            if known_only:
+                new = new[new["Patient_ID"].isin(existing.index).to_numpy()]
+            new = self._unseen(new, existing)
+            if new.empty:
+                return 0
+
+            groups = new.groupby("Patient_ID", sort=False)
+            stats = groups[STAT_VITALS].agg(["count", "sum", "min", "max"])
+            pids = stats.index.tolist()
+            old = existing.reindex(pids)
+            # Visits are sorted by date within each patient; late visits can widen either end
+            first, last = groups["Date"].first(), groups["Date"].last()
+            old_first = old["First_Visit"].fillna(first).to_numpy(dtype=object)
+            old_last = old["Last_Visit"].fillna(last).to_numpy(dtype=object)
+            first, last = first.to_numpy(dtype=object), last.to_numpy(dtype=object)
+            columns = {
+                "Patient_ID": pids,
+                "Visits": groups.size().to_numpy() + old["Visits"].fillna(0).to_numpy(dtype=int),
+                "First_Visit": np.where(old_first < first, old_first, first),
+                "Last_Visit": np.where(old_last > last, old_last, last),
+            }
+            for vital in STAT_VITALS:
+                for suffix, combine in (("Count", np.add), ("Sum", np.add), ("Min", np.fmin), ("Max", np.fmax)):
+                    previous = old[f"{vital}_{suffix}"].to_numpy(dtype=float)
+                    if suffix in ("Count", "Sum"):
+                        previous = np.nan_to_num(previous)
+                    columns[f"{vital}_{suffix}"] = combine(previous, stats[(vital, suffix.lower())].to_numpy(dtype=float))
+
+            # Recent window: previous visits plus the new ones in date order, newest RECENT_VISITS kept
+            tail = new[groups.cumcount(ascending=False).to_numpy() < RECENT_VISITS]
+            values = tail[RECENT_COLUMNS].astype(object)
+            records = values.where(values.notna(), None).to_dict("records")
+            previous = existing["Recent"].dropna().to_dict()
+            recent = {}
+            for pid, record in zip(tail["Patient_ID"].to_numpy(), records):
+                if pid not in recent:
+                    recent[pid] = json.loads(previous.get(pid) or "[]")
+                recent[pid].append(record)
+            for pid, kept in recent.items():
+                kept.sort(key=lambda visit: visit["Date"])
+                recent[pid] = kept[-RECENT_VISITS:]
+            columns["Recent"] = [json.dumps(recent[pid]) for pid in pids]
+
+            window = pd.DataFrame([dict(visit, Patient_ID=pid) for pid, visits in recent.items()
+                                   if len(visits) >= 2 for visit in visits])
+            forecasts = {}
+            if not window.empty:
+                population = prediction.forecast_population(window)
+                forecasts = {pid: _encode_forecast(prediction.as_trends(row))
+                             for pid, row in zip(population.index, population.to_dict("records"))}
+            columns["Forecast"] = [forecasts.get(pid) for pid in pids]
+            columns["updated_at"] = [time.time()] * len(pids)
+
+            names = ", ".join(f'"{c}"' for c in _COLUMNS)
+            marks = ", ".join("?" for _ in _COLUMNS)
+            values = zip(*([_json_value(v) for v in columns[c]] for c in _COLUMNS))
+            self._conn.executemany(f"INSERT OR REPLACE INTO patient_summary ({names}) VALUES ({marks})", values)
+            patient_tables.add_visits(self._conn, "summary_visit", new)
+        return len(pids)
+
+    def get(self, patient_id):
+        """
+        Summary of one patient.
+
+        Returns:
+            dict: Patient_ID, Visits, First_Visit, Last_Visit, stats ({vital: {min,
+            max, mean}}), recent (DataFrame of the last visits, oldest first) and
+            forecast (predict_trends format, or None); None if the patient is unknown
+        """
+        names = ", ".join(f'"{c}"' for c in _COLUMNS)
+        with self._lock:
+            row = self._conn.execute(f"SELECT {names} FROM patient_summary WHERE Patient_ID = ?",
+                                     (str(patient_id),)).fetchone()
+        if row is None:
+            return None
+        row = dict(zip(_COLUMNS, row))
+        stats = {}
+        for vital in STAT_VITALS:
+            count = row[f"{vital}_Count"] or 0
+            if count:
+                stats[vital] = {"min": row[f"{vital}_Min"], "max": row[f"{vital}_Max"],
+                                "mean": row[f"{vital}_Sum"] / count}
+        return {
+            "Patient_ID": row["Patient_ID"], "Visits": row["Visits"],
+            "First_Visit": row["First_Visit"], "Last_Visit": row["Last_Visit"],
+            "stats": stats,
+            "recent": pd.DataFrame(json.loads(row["Recent"] or "[]"), columns=RECENT_COLUMNS),
+            "forecast": _decode_forecast(row["Forecast"]),
+        }
+
+    def forget(self, patient_ids):
+        """Drop summaries (e.g., after stored visits were re-scored); they are rebuilt on next lookup."""
+        with self._lock, self._conn:
+            patient_tables.delete(self._conn, "patient_summary", "summary_visit", patient_ids)
+
+    def count(self):
+        """Number of patients with a summary."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM patient_summary").fetchone()[0]
+
+
+def get_store(path=None):
+    """
+    Return the process-wide SummaryStore for a database file.
+
+    Args:
+        path: Database file (defaults to DATA_DIR/swasthya_local.db, shared with local_store)
+
+    Returns:
+        SummaryStore
+    """
+    path = path or config.data_path("swasthya_local.db")
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SummaryStore(path)
+    return store
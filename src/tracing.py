@@ -0,0 +1,226 @@
+"""
+Lightweight tracing for the diagnostic pipeline.
+
+Each stage (sheet read, patient filter, regression, Groq call, PDF render,
+sheet write) is timed with a span. Durations are kept in a small fixed-size
+window per stage so p50/p95 can be reported without unbounded memory, and can
+be exported as structured log lines or Prometheus text. Simple counters and
+gauges (retries, circuit breaker state) are exported alongside.
+"""
+
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from src import config
+
+logger = logging.getLogger("swasthya.trace")
+
+# Samples kept per stage for percentile estimates
+WINDOW_SIZE = 512
+
+ENABLED = config.get_flag("TRACING_ENABLED", default=True)
+
+_lock = threading.Lock()
+_windows = {}  # stage -> deque of recent durations (seconds)
+_totals = {}   # stage -> [count, total_seconds, errors]
+_counters = {}  # (name, labels) -> cumulative value
+_gauges = {}    # (name, labels) -> current value
+
+
+def record(stage, duration, error=False, **attrs):
+    """
+    Record one completed span.
+
+    Args:
+        stage: Stage name (e.g., "sheet_read")
+        duration: Elapsed time in seconds
+        error: Whether the stage raised an exception
+        **attrs: Extra fields included in the structured log line
+    """
+    with _lock:
+        window = _windows.get(stage)
+        if window is None:
+            window = _windows[stage] = deque(maxlen=WINDOW_SIZE)
+            _totals[stage] = [0, 0.0, 0]
+        window.append(duration)
+        totals = _totals[stage]
+        totals[0] += 1
+        totals[1] += duration
+        if error:
+            totals[2] += 1
+
+    # Structured log export is opt-in via standard logging configuration
+    if logger.isEnabledFor(logging.INFO):
+        event = {"stage": stage, "ms": round(duration * 1000, 2), "error": error}
+        event.update(attrs)
+        logger.info(json.dumps(event, default=str))
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Time a block of code as one pipeline stage.
+
+    Usage:
+        with tracing.span("sheet_write"):
+            conn.update(...)
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, error=error, **attrs)
+
+
+def traced(stage):
+    """
+    Decorator form of span() for whole functions.
+
+    Args:
+        stage: Stage name recorded for each call
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incr(name, value=1, **labels):
+    """
+    Add to a cumulative counter.
+
+    Args:
+        name: Counter name (exported as swasthya_<name>)
+        value: Amount to add
+        **labels: Label values (e.g., backend="sheets")
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """
+    Set a gauge to its current value.
+
+    Args:
+        name: Gauge name (exported as swasthya_<name>)
+        value: Current value
+        **labels: Label values
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = value
+
+
+def _series():
+    """Snapshot of all counter and gauge series, sorted by name and labels."""
+    with _lock:
+        series = [(key, "counter", value) for key, value in _counters.items()]
+        series += [(key, "gauge", value) for key, value in _gauges.items()]
+    return sorted(series, key=lambda item: item[0])
+
+
+def metric_values():
+    """
+    List current counter and gauge values.
+
+    Returns:
+        list: One dict per series with metric, type, labels and value
+    """
+    return [
+        {"metric": name, "type": kind, "labels": ", ".join(f"{k}={v}" for k, v in labels), "value": value}
+        for (name, labels), kind, value in _series()
+    ]
+
+
+def _percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def stage_stats():
+    """
+    Summarize timings per stage.
+
+    Returns:
+        list: One dict per stage with count, errors, total_s, mean_ms, p50_ms, p95_ms, max_ms
+    """
+    with _lock:
+        snapshot = {stage: (list(window), list(_totals[stage])) for stage, window in _windows.items()}
+
+    stats = []
+    for stage, (window, (count, total, errors)) in sorted(snapshot.items()):
+        window.sort()
+        stats.append({
+            "stage": stage,
+            "count": count,
+            "errors": errors,
+            "total_s": total,
+            "mean_ms": round(total / count * 1000, 2) if count else 0.0,
+            "p50_ms": round(_percentile(window, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(window, 0.95) * 1000, 2),
+            "max_ms": round(window[-1] * 1000, 2) if window else 0.0,
+        })
+    return stats
+
+
+def export_prometheus():
+    """
+    Render stage timings in the Prometheus text exposition format.
+
+    Returns:
+        str: Metrics text (summary type with 0.5 and 0.95 quantiles)
+    """
+    lines = [
+        "# HELP swasthya_stage_seconds Time spent per diagnostic pipeline stage.",
+        "# TYPE swasthya_stage_seconds summary",
+    ]
+    stats = stage_stats()
+    for s in stats:
+        label = f'stage="{s["stage"]}"'
+        lines.append(f'swasthya_stage_seconds{{{label},quantile="0.5"}} {s["p50_ms"] / 1000:.6f}')
+        lines.append(f'swasthya_stage_seconds{{{label},quantile="0.95"}} {s["p95_ms"] / 1000:.6f}')
+        lines.append(f'swasthya_stage_seconds_sum{{{label}}} {s["total_s"]:.6f}')
+        lines.append(f'swasthya_stage_seconds_count{{{label}}} {s["count"]}')
+    lines.append("# HELP swasthya_stage_errors_total Stage executions that raised an exception.")
+    lines.append("# TYPE swasthya_stage_errors_total counter")
+    for s in stats:
+        lines.append(f'swasthya_stage_errors_total{{stage="{s["stage"]}"}} {s["errors"]}')
+
+    declared = set()
+    for (name, labels), kind, value in _series():
+        if name not in declared:
+            lines.append(f"# TYPE swasthya_{name} {kind}")
+            declared.add(name)
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        lines.append(f"swasthya_{name}{{{label_text}}} {value}" if label_text else f"swasthya_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Clear all recorded timings, counters and gauges."""
+    with _lock:
+        _windows.clear()
+        _totals.clear()
+        _counters.clear()
+        _gauges.clear()